@@ -0,0 +1,109 @@
+from __future__ import print_function
+
+import numpy as np
+from cprnc_py.print_utils import attribute_str
+
+class AttributeDiffs(object):
+    """This class finds the differences between the attributes (global
+    attributes and attributes of shared variables) of two netcdf files.
+
+    Typical usage is:
+
+    (1) Create an AttributeDiffs object:
+        mydiffs = AttributeDiffs(file1, file2)
+
+    (2a) (Optionally) Query the number of differences:
+         mydiffs.num_differences()
+
+    (2b) (Optionally) Print the differences:
+         str(mydiffs)
+    """
+
+    # ------------------------------------------------------------------------
+    # Constructor and other special methods
+    # ------------------------------------------------------------------------
+
+    def __init__(self, file1, file2):
+        """Create an AttributeDiffs object.
+
+        Arguments:
+        file1: netcdf file object with methods get_global_attributes,
+            get_varattributes, etc.
+        file2: netcdf file object
+        """
+
+        # List of tuples (varname, attname, value1, value2), where varname is
+        # None for global attributes, and value1 or value2 is None if the
+        # attribute is missing from that file
+        self._differences = []
+        self._add_differences(None,
+                              file1.get_global_attributes(),
+                              file2.get_global_attributes())
+        vlist_shared = set(file1.get_varlist()) & set(file2.get_varlist())
+        for varname in sorted(vlist_shared):
+            self._add_differences(varname,
+                                  file1.get_varattributes(varname),
+                                  file2.get_varattributes(varname))
+
+    def __str__(self):
+        if not self._differences:
+            return "No differences in header attributes\n"
+
+        lines = ["HEADER DIFFERENCES:"]
+        for (varname, attname, value1, value2) in self._differences:
+            if varname is None:
+                lines.append(" global attribute {}".format(attname))
+            else:
+                lines.append(" attribute {} of variable {}".format(attname, varname))
+            lines.append("   file 1: " + _value_str(value1))
+            lines.append("   file 2: " + _value_str(value2))
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------------------
+    # Public methods
+    # ------------------------------------------------------------------------
+
+    def num_differences(self):
+        """Returns the number of attributes that differ between the two files
+        (including attributes present in only one of them)."""
+
+        return len(self._differences)
+
+    # ------------------------------------------------------------------------
+    # Private methods
+    # ------------------------------------------------------------------------
+
+    def _add_differences(self, varname, attributes1, attributes2):
+        """Record the differences between two dictionaries of attributes.
+
+        Arguments:
+        varname: name of the variable that the attributes belong to, or None
+            for global attributes
+        attributes1, attributes2: dictionaries of attributes
+        """
+
+        for attname in sorted(set(attributes1) | set(attributes2)):
+            value1 = attributes1.get(attname)
+            value2 = attributes2.get(attname)
+            if not _attributes_equal(value1, value2):
+                self._differences.append((varname, attname, value1, value2))
+
+# ------------------------------------------------------------------------
+# Private functions
+# ------------------------------------------------------------------------
+
+def _attributes_equal(value1, value2):
+    """Return True if the two attribute values are the same (either of which may
+    be None if the attribute is missing)"""
+
+    if value1 is None or value2 is None:
+        return value1 is None and value2 is None
+    return np.array_equal(np.asarray(value1), np.asarray(value2))
+
+def _value_str(value):
+    """Return a string version of an attribute value (or None) for printing"""
+
+    if value is None:
+        return "(not present)"
+    else:
+        return attribute_str(value)
@@ -0,0 +1,145 @@
+from __future__ import print_function
+
+from cprnc_py.result_store import row_flag, COUNTED_FLAGS
+
+class DiffSummary(object):
+    """This class keeps running counts of the differences between two netcdf
+    files, as the results for the individual variables (or slices) arrive.
+
+    It is maintained by FileDiffs (see FileDiffs.get_summary). Each query takes
+    constant time, and can be made at any point; before all results have
+    arrived, the counts cover the results so far.
+
+    Typical usage is:
+
+    (1) Get the DiffSummary object of a FileDiffs object:
+        summary = mydiffs.get_summary()
+
+    (2a) (Optionally) Query whether the files differ:
+         summary.files_differ()
+
+    (2b) (Optionally) Query specific counts:
+         - summary.num_vars()
+         - summary.num_vars_differ()
+         - etc.
+
+    (2c) (Optionally) Print the summary:
+         str(summary)
+    """
+
+    # ------------------------------------------------------------------------
+    # Constructor and other special methods
+    # ------------------------------------------------------------------------
+
+    def __init__(self, num_expected=0):
+        """Create a DiffSummary object, with no results yet.
+
+        Arguments:
+        num_expected: total number of results that will be added
+        """
+
+        self._num_expected = num_expected
+        self._num_vars = 0
+        # Number of results added so far for which each of the flags in
+        # COUNTED_FLAGS is set
+        self._counts = dict((name, 0) for name in COUNTED_FLAGS)
+
+    def __str__(self):
+        # FIXME(wjs, 2015-12-26) is it right to include the
+        # could-not-be-analyzed fields in the 'total number' count? (If not,
+        # consider wording the print of the could not be analyzed number
+        # differently, too):
+        parts = ["SUMMARY of cprnc:\n"]
+        parts.append(" A total number of {0:6d} fields were compared\n".format(
+            self.num_vars()))
+        parts.append("          of which {0:6d} had non-zero differences\n".format(
+            self.num_vars_differ()))
+        parts.append("               and {0:6d} had differences in fill patterns\n".format(
+            self.num_masks_differ()))
+        parts.append("               and {0:6d} had differences in dimension sizes\n".format(
+            self.num_dims_differ()))
+        parts.append(" A total number of {0:6d} fields could not be analyzed (e.g., strings and fields with different dimension sizes)\n".format(
+            self.num_could_not_be_analyzed()))
+        parts.append(" A total number of {0:6d} fields did not exist in both files\n".format(
+            self.num_nonshared_fields()))
+
+        parts.append("  diff_test: the two files seem to be ")
+        if (self.files_differ()):
+            parts.append("DIFFERENT")
+        else:
+            parts.append("IDENTICAL")
+        parts.append("\n\n")
+
+        return "".join(parts)
+
+    # ------------------------------------------------------------------------
+    # Public methods
+    # ------------------------------------------------------------------------
+
+    def add(self, row):
+        """Count one result.
+
+        Arguments:
+        row: the result, packed by result_store.pack_vardiffs
+        """
+
+        self._num_vars += 1
+        for name in COUNTED_FLAGS:
+            if row_flag(row, name):
+                self._counts[name] += 1
+
+    def is_complete(self):
+        """Returns True if all expected results have been added."""
+
+        return self._num_vars >= self._num_expected
+
+    def num_vars(self):
+        """Returns a count of the total number of variables."""
+
+        return self._num_vars
+
+    def num_vars_differ(self):
+        """Returns a count of the number of variables with elements that
+        differ."""
+
+        return self._counts['vars_differ']
+
+    def num_masks_differ(self):
+        """Returns a count of the number of variables with masks that differ."""
+
+        return self._counts['masks_differ']
+
+    def num_dims_differ(self):
+        """Returns a count of the number of variables with dims that differ."""
+
+        return self._counts['dims_differ']
+
+    def num_could_not_be_analyzed(self):
+        """Returns a count of the number of variables that could not be
+        analyzed."""
+
+        return self._counts['could_not_be_analyzed']
+
+    def num_nonshared_fields(self):
+        """Returns a count of the number of fields that are different."""
+
+        return self._counts['fields_nonshared']
+
+    def files_differ(self):
+        """Returns a boolean variable saying whether the two files differ in any
+        meaningful way.
+
+        Before all results have been added, a True result is final (the files
+        differ, whatever the remaining results are), while a False result only
+        covers the results so far."""
+
+        if (self.num_vars_differ() > 0 or
+            self.num_masks_differ() > 0 or
+            self.num_dims_differ() > 0):
+            differ = True
+        elif (self.num_vars() - self.num_could_not_be_analyzed()) == 0:
+            # If no variables could be analyzed, treat this as files differing
+            differ = self.is_complete()
+        else:
+            differ = False
+        return differ
@@ -0,0 +1,260 @@
+"""Pools of workers for running tasks on a fixed set of netcdf files.
+
+Three executors are available:
+
+- 'processes' (FilePool): Each worker process opens its own copy of each of the
+  files once, when it starts, and reuses it for all of its tasks. The file
+  objects therefore never need to be stored in globals or passed to each task,
+  so several pools (e.g., for several concurrent comparisons) can be used within
+  one process, and this works with any multiprocessing start method.
+
+- 'threads' (FileThreadPool): Worker threads share the given file objects.
+  Nothing needs to be pickled, and memory is shared; this works well because
+  most of the time is spent in numpy operations and memory-mapped reads, which
+  release the GIL.
+
+- 'serial' (FilePoolFake): Tasks are run one after another in the calling
+  thread.
+
+Task functions are called as func(files, item), where files is a tuple of the
+NetcdfFile objects, in the order in which they were given when creating the
+pool.
+
+Typical usage is:
+
+    with create_file_pool((file1, file2), nprocs) as pool:
+        results = pool.map(func, items)
+
+or, for tasks whose costs vary widely:
+
+        results = pool.map_by_cost(func, items, costs)
+
+or, to handle each result as soon as it is available:
+
+        for (task, result) in pool.imap_by_cost(func, items, costs):
+
+or, to handle the results in order, as soon as they are available:
+
+        for result in pool.imap(func, items):
+"""
+
+from __future__ import print_function
+
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+from cprnc_py.multiprocessing_fake import FilePoolFake
+from cprnc_py.task_scheduler import schedule_batches
+
+# Valid values of the executor argument of create_file_pool
+EXECUTORS = ('serial', 'threads', 'processes')
+
+# ------------------------------------------------------------------------
+# Public functions and classes
+# ------------------------------------------------------------------------
+
+def create_file_pool(files, nprocs=None, executor=None):
+    """Return a pool object for running tasks on the given files.
+
+    Arguments:
+    files: sequence of NetcdfFile objects
+    nprocs: Number of workers (for the 'threads' and 'processes' executors)
+        If None, use the number of CPUs.
+    executor: One of EXECUTORS, or None
+        None means to use 'processes' if nprocs is given, and 'serial' (which
+        bypasses the multiprocessing package) otherwise.
+    """
+
+    if executor is None:
+        if (nprocs):
+            executor = 'processes'
+        else:
+            executor = 'serial'
+
+    if executor == 'serial':
+        return FilePoolFake(files)
+    elif executor == 'threads':
+        return FileThreadPool(files, nprocs or cpu_count())
+    elif executor == 'processes':
+        return FilePool(files, nprocs or cpu_count())
+    else:
+        raise ValueError("Unknown executor: {}".format(executor))
+
+class FilePool(object):
+    """Pool of worker processes, each of which holds its own open copies of a
+    fixed set of netcdf files.
+
+    This should be closed when it is no longer needed (which is done
+    automatically when it is used as a context manager).
+    """
+
+    def __init__(self, files, nprocs):
+        """Create a FilePool object.
+
+        Arguments:
+        files: sequence of NetcdfFile objects; each worker opens its own
+            equivalent objects (see NetcdfFile.get_opener)
+        nprocs: number of worker processes
+        """
+
+        openers = [ncfile.get_opener() for ncfile in files]
+        self._nprocs = nprocs
+        self._pool = Pool(nprocs, initializer=_init_worker, initargs=(openers,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def map(self, func, iterable):
+        """Return a list of func(files, item) for each item in iterable, where
+        files is the tuple of the worker's file objects"""
+
+        return self._pool.map(self._bind_files(func), iterable)
+
+    def imap(self, func, iterable, chunksize=1):
+        """Generator that yields func(files, item) for each item in iterable,
+        in order, as soon as the result and all results before it are
+        available.
+
+        Tasks are started in order, so the results arrive roughly in order,
+        too. To stop early, call terminate() before leaving the loop over the
+        results (see imap_by_cost).
+
+        Arguments:
+        func: function called as func(files, item)
+        iterable: task arguments
+        chunksize: number of tasks sent to a worker at once
+        """
+
+        for result in self._pool.imap(self._bind_files(func), iterable, chunksize):
+            yield result
+
+    def map_by_cost(self, func, items, costs):
+        """Return a list of func(files, item) for each item in items, like map.
+
+        The tasks are scheduled according to their estimated costs (see
+        imap_by_cost); the results are returned in the order of items.
+
+        Arguments:
+        func: function called as func(files, item)
+        items: sequence of task arguments
+        costs: sequence giving the estimated cost of each task
+        """
+
+        items = list(items)
+        results = [None] * len(items)
+        for (task, result) in self.imap_by_cost(func, items, costs):
+            results[task] = result
+        return results
+
+    def imap_by_cost(self, func, items, costs, cheapest_first=False):
+        """Generator that yields a tuple (task, func(files, items[task])) for
+        each item in items, as the tasks complete.
+
+        The tasks are scheduled according to their estimated costs (see
+        task_scheduler.schedule_batches): the most costly tasks are started
+        first (or, with cheapest_first, the least costly ones), and cheap tasks
+        are sent to the workers in batches. Results are yielded as soon as their
+        batch completes, so in no particular order.
+
+        To stop early, call terminate() before leaving the loop over the
+        results: this discards the tasks that have not completed yet.
+
+        Arguments:
+        func: function called as func(files, item)
+        items: sequence of task arguments
+        costs: sequence giving the estimated cost of each task
+        cheapest_first: if True, start the least costly tasks first
+        """
+
+        items = list(items)
+        batches = [[(task, items[task]) for task in batch]
+                   for batch in schedule_batches(costs, self._nprocs,
+                                                 cheapest_first=cheapest_first)]
+        for batch_results in self._pool.imap_unordered(
+                partial(_call_batch, self._bind_files(func)), batches):
+            for (task, result) in batch_results:
+                yield (task, result)
+
+    def close(self):
+        """Wait for outstanding tasks to finish, then stop the workers"""
+
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """Stop the workers immediately"""
+
+        self._pool.terminate()
+        self._pool.join()
+
+    def _bind_files(self, func):
+        """Return a picklable function of a single item that calls func(files,
+        item) with the files of the worker that runs it"""
+
+        return partial(_call_with_worker_files, func)
+
+class FileThreadPool(FilePool):
+    """Pool of worker threads, which share a fixed set of netcdf files.
+
+    Usage is the same as for FilePool. The file objects must support being
+    read from several threads at once.
+    """
+
+    def __init__(self, files, nthreads):
+        """Create a FileThreadPool object.
+
+        Arguments:
+        files: sequence of NetcdfFile objects, shared by all threads
+        nthreads: number of worker threads
+        """
+
+        self._files = tuple(files)
+        self._nprocs = nthreads
+        self._pool = ThreadPool(nthreads)
+
+    def _bind_files(self, func):
+        """Return a function of a single item that calls func(files, item) with
+        the shared files"""
+
+        return partial(func, self._files)
+
+# ------------------------------------------------------------------------
+# Private functions, run in the workers
+# ------------------------------------------------------------------------
+
+# Tuple of the files opened by this worker process (set by _init_worker)
+_worker_files = None
+
+def _init_worker(openers):
+    """Open this worker's files.
+
+    Arguments:
+    openers: list of (function, args) tuples, as returned by
+        NetcdfFile.get_opener
+    """
+
+    global _worker_files
+    _worker_files = tuple(function(*args) for (function, args) in openers)
+
+def _call_with_worker_files(func, item):
+    """Run one task in a worker process"""
+
+    return func(_worker_files, item)
+
+def _call_batch(func, batch):
+    """Run a batch of tasks in a worker.
+
+    Arguments:
+    func: function called as func(item)
+    batch: list of tuples (task, item), where task is a task number
+
+    Returns a list of tuples (task, result).
+    """
+
+    return [(task, func(item)) for (task, item) in batch]
@@ -1,8 +1,24 @@
 from __future__ import print_function
-from functools import partial
-from multiprocessing import Pool
-from cprnc_py.multiprocessing_fake import PoolFake
-from cprnc_py.vardiffs import (VarDiffs, VarDiffsNonNumeric, VarDiffsUnsharedVar, VarDiffsDimSizeDiff)
+from functools import partial, reduce
+from itertools import chain
+from cprnc_py.file_pool import create_file_pool
+from cprnc_py.prefetch import prefetch, DEFAULT_MAX_BYTES as DEFAULT_PREFETCH_BYTES
+from cprnc_py.attributediffs import AttributeDiffs
+from cprnc_py.diffsummary import DiffSummary
+from cprnc_py.result_store import (ResultStore, pack_vardiffs, unpack_vardiffs,
+                                   unpack_diff_stats, ROW_DTYPE, NUMERIC)
+import numpy as np
+from cprnc_py.stats_kernel import (compute_var_stats_chunked, compute_diff_stats_chunked,
+                                   compute_diff_stats_slices, VarStatsAccumulator,
+                                   DiffStatsAccumulator, BLOCK_SIZE)
+from cprnc_py.vardiffs import (VarDiffs, VarDiffsNonNumeric, VarDiffsUnsharedVar,
+                               VarDiffsDimSizeDiff, VarDiffsDataUnavailable)
+
+try:
+    # python2: use the lazy version of zip
+    from itertools import izip as zip
+except ImportError:
+    pass
 
 class FileDiffs(object):
     """This class computes statistics about the differences between two netcdf
@@ -16,6 +32,8 @@ class FileDiffs(object):
 
     (2a) (Optionally) Query whether the files differ:
          mydiffs.files_differ()
+         (the counts of differences are also available together, via
+         mydiffs.get_summary())
 
     (2b) (Optionally) Query specific differences: e.g., how many variables
          differ in various ways:
@@ -33,7 +51,11 @@ class FileDiffs(object):
     # Constructor and other special methods
     # ------------------------------------------------------------------------
 
-    def __init__(self, file1, file2, separate_dim="time", nprocs=None):
+    def __init__(self, file1, file2, separate_dim="time", nprocs=None,
+                 max_chunk_bytes=None, all_slices=False, check_data_identity=False,
+                 executor=None, record_scan=False, prefetch_depth=None,
+                 prefetch_bytes=DEFAULT_PREFETCH_BYTES, stream=None,
+                 slice_block_bytes=None, stop_on_first_difference=False):
         """Create a FileDiffs object.
 
         Arguments:
@@ -49,198 +71,722 @@ class FileDiffs(object):
             package (this adds some overhead, and is just intended for testing)
             nprocs > 1 means to use multiple tasks with the multiprocessing
             package
+            Each worker process opens its own copies of the two files (see
+            NetcdfFile.get_opener), so several FileDiffs objects can exist at
+            once.
+            With executor = 'threads', nprocs gives the number of threads.
+        max_chunk_bytes: If not None, then each variable (or slice) is read and
+            analyzed in consecutive pieces of at most this many bytes from each
+            file, rather than all at once. This bounds memory use for variables
+            too large to hold in memory. Results are identical either way.
+        all_slices: If True (and separate_dim is given), then for each variable
+            that is separated along separate_dim, also report statistics over
+            all slices combined. These are obtained by merging the per-slice
+            statistics, so the data are not read again.
+        check_data_identity: If True, then first check whether the data sections
+            of the two files are byte-for-byte identical (see
+            NetcdfFile.data_section_equal). If so, the files are reported as
+            identical without analyzing any variables, and the report just
+            lists differences in header attributes. This shortcut is not
+            taken if the files contain (unmasked) NaN values, which compare
+            unequal to themselves.
+        executor: How to run the tasks: 'serial', 'threads' (worker threads
+            sharing file1 and file2) or 'processes' (see file_pool.EXECUTORS)
+            executor = None (the default) means 'processes' if nprocs is
+            given, 'serial' otherwise.
+        record_scan: If True (and separate_dim is given), then the slices along
+            separate_dim of the variables that have it are compared by walking
+            through the two files once, in order of the index along
+            separate_dim (see NetcdfFile.iter_records), rather than one
+            variable at a time. For the unlimited (record) dimension of a
+            netcdf file, whose variables are stored interleaved record by
+            record, this reads each file sequentially. Results are identical
+            either way.
+        prefetch_depth: If not None, then the variables (or slices) are
+            compared in this process, in the order given by get_varlist_bydim,
+            while a separate thread reads the data of up to this many of the
+            following ones from the two files (see prefetch.prefetch), so that
+            reading overlaps with computing. Cannot be combined with nprocs or
+            a parallel executor.
+        prefetch_bytes: maximum number of bytes of data read ahead with
+            prefetch_depth (None for no limit)
+        stream: If not None, a file-like object to which the statistics of each
+            variable (or slice) are written as soon as they, and those of all
+            variables that come before them in the report, are available;
+            str(self) then only gives the summary.
+        slice_block_bytes: If not None (and separate_dim is given), then for
+            numeric variables whose slices along separate_dim are small (see
+            _get_slice_block_tasks), blocks of consecutive slices of up to this
+            many bytes are read from each file at once, and the statistics of
+            all slices in a block are computed together (see
+            stats_kernel.compute_diff_stats_slices). For variables with many
+            small slices, this is much faster than comparing one slice at a
+            time. Results are identical either way.
+        stop_on_first_difference: If True, then the variables (or slices)
+            that are cheapest to compare, and those most likely to differ
+            (e.g., whose shapes differ), are compared first (except with
+            prefetch_depth, which keeps the order of the file), and the comparison
+            stops as soon as the files are known to differ: outstanding work is
+            cancelled, and the report and counts only cover the variables
+            compared so far. files_differ() gives the same answer either way.
         """
 
-        # TODO(wjs, 2016-01-05) This use of globals is bad. It's done for the
-        # sake of multiprocessing, but maybe there is some other way around it.
-        global _file1
-        global _file2
-        _file1 = file1
-        _file2 = file2
+        if prefetch_depth is not None and (nprocs is not None or
+                                           executor not in (None, 'serial')):
+            raise ValueError("prefetch_depth cannot be combined with a parallel executor")
 
+        self._file1 = file1
+        self._file2 = file2
         self._nprocs = nprocs
-
-        if separate_dim:
-            self._add_vardiffs_separated_by_dim(separate_dim)
+        self._executor = executor
+        self._max_chunk_bytes = max_chunk_bytes
+        self._record_scan = record_scan
+        self._prefetch_depth = prefetch_depth
+        self._prefetch_bytes = prefetch_bytes
+        self._slice_block_bytes = slice_block_bytes
+        self._stream = stream
+        self._separate_dim = separate_dim
+        self._stop_on_first_difference = stop_on_first_difference
+        # Whether the comparison was stopped before all results were added
+        self._stopped = False
+        # Bookkeeping of the expected results (see _expect_results)
+        self._result_ids = {}
+        self._all_slices_ids = {}
+        self._slices_remaining = {}
+        # Rows of the slices of each variable whose summary of all slices is
+        # still to be created, keyed by index (see _add_slice_stats)
+        self._slice_rows = {}
+        self._order = []
+        self._writer = None
+        # The results themselves, one compact row each (see result_store.py);
+        # the first self._num_expected are the individual results, and any
+        # others are the summaries of all slices of a variable. With a stream,
+        # results are written instead of being stored, so this stays empty.
+        self._results = ResultStore(0)
+        self._num_expected = 0
+        self._summary = DiffSummary()
+        # Unmasked NaNs compare unequal to themselves, so files containing them
+        # need the full comparison even if they are byte-for-byte identical
+        self._data_identical = (check_data_identity and
+                                file1.data_section_equal(file2) and
+                                not _file_has_nan(file1, max_chunk_bytes))
+
+        if self._data_identical:
+            # Every variable is known to be identical, so there is no need to
+            # analyze them
+            self._attribute_diffs = AttributeDiffs(file1, file2)
+        elif separate_dim:
+            self._add_vardiffs_separated_by_dim(separate_dim, all_slices)
         else:
             self._add_vardiffs()
 
     def __str__(self):
-        mystr = ""
+        if self._data_identical:
+            return self._data_identical_str()
+
+        # The pieces of the report are collected in a list and joined at the
+        # end, since building up a long string piece by piece is quadratic
+        parts = []
         # FIXME(wjs, 2015-12-26) Add some header text
 
-        for var in self._vardiffs_list:
-            mystr = mystr + str(var) + "\n\n"
+        if self._writer is None:
+            # (With a stream, the individual results have been written already)
+            for result_id in self._order:
+                if self._results.is_set(result_id):
+                    parts.append(str(self._get_diff_wrapper(result_id)) + "\n\n")
 
-        mystr = mystr + "SUMMARY of cprnc:\n"
-        # FIXME(wjs, 2015-12-26) is it right to include the
-        # could-not-be-analyzed fields in the 'total number' count? (If not,
-        # consider wording the print of the could not be analyzed number
-        # differently, too):
-        mystr = mystr + " A total number of {0:6d} fields were compared\n".format(
-            self.num_vars())
-        mystr = mystr + "          of which {0:6d} had non-zero differences\n".format(
-            self.num_vars_differ())
-        mystr = mystr + "               and {0:6d} had differences in fill patterns\n".format(
-            self.num_masks_differ())
-        mystr = mystr + "               and {0:6d} had differences in dimension sizes\n".format(
-            self.num_dims_differ())
-        mystr = mystr + " A total number of {0:6d} fields could not be analyzed (e.g., strings and fields with different dimension sizes)\n".format(
-            self.num_could_not_be_analyzed())
-        mystr = mystr + " A total number of {0:6d} fields did not exist in both files\n".format(
-            self.num_nonshared_fields())
-
-        mystr = mystr + "  diff_test: the two files seem to be "
-        if (self.files_differ()):
-            mystr = mystr + "DIFFERENT"
-        else:
-            mystr = mystr + "IDENTICAL"
-        mystr = mystr + "\n\n"
+        if self._stopped:
+            parts.append("Stopped at the first difference: the counts below only cover "
+                         "the {0} of {1} fields that were compared\n\n".format(
+                             self._summary.num_vars(), self._num_expected))
+        parts.append(str(self._summary))
 
-        return mystr
+        return "".join(parts)
 
     # ------------------------------------------------------------------------
     # Public methods
     # ------------------------------------------------------------------------
 
+    def get_summary(self):
+        """Returns the DiffSummary object holding the counts of differences.
+
+        The summary is updated as the results arrive, so it can be queried
+        before all variables have been compared (e.g., from a stream, or after
+        stopping early)."""
+
+        return self._summary
+
     def num_vars(self):
         """Returns a count of the total number of variables."""
 
-        return len(self._vardiffs_list)
+        return self._summary.num_vars()
 
     def num_vars_differ(self):
         """Returns a count of the number of variables with elements that
         differ."""
 
-        return sum([var.var_diffs.vars_differ() for var in self._vardiffs_list])
+        return self._summary.num_vars_differ()
 
     def num_masks_differ(self):
         """Returns a count of the number of variables with masks that differ."""
 
-        return sum([var.var_diffs.masks_differ() for var in self._vardiffs_list])
+        return self._summary.num_masks_differ()
 
     def num_dims_differ(self):
         """Returns a count of the number of variables with dims that differ."""
 
-        return sum([var.var_diffs.dims_differ() for var in self._vardiffs_list])
+        return self._summary.num_dims_differ()
 
     def num_could_not_be_analyzed(self):
         """Returns a count of the number of variables that could not be
         analyzed."""
 
-        return sum([var.var_diffs.could_not_be_analyzed() for var in self._vardiffs_list])
+        return self._summary.num_could_not_be_analyzed()
 
     def num_nonshared_fields(self):
         """Returns a count of the number of fields that are different."""
 
-        return sum([var.var_diffs.fields_nonshared() for var in self._vardiffs_list])
+        return self._summary.num_nonshared_fields()
 
     def files_differ(self):
         """Returns a boolean variable saying whether the two files differ in any
         meaningful way."""
 
-        if (self.num_vars_differ() > 0 or
-            self.num_masks_differ() > 0 or
-            self.num_dims_differ() > 0):
-            differ = True
-        elif (self.num_vars() - self.num_could_not_be_analyzed()) == 0:
-            # If no variables could be analyzed, treat this as files differing
-            differ = True
-        else:
-            differ = False
-        return differ
+        if self._data_identical:
+            return False
+        return self._summary.files_differ()
+
+    def stopped_early(self):
+        """Returns True if the comparison was stopped at the first difference
+        (see stop_on_first_difference), before all variables were compared."""
+
+        return self._stopped
 
     # ------------------------------------------------------------------------
     # Private methods
     # ------------------------------------------------------------------------
 
-    def _add_vardiffs(self):
-        """Add all of the vardiffs to self.
+    def _data_identical_str(self):
+        """Returns the string version of self for files whose data sections
+        are identical"""
 
-        Assumes that globals _file1 and _file2 have already been set.
-        """
+        mystr = str(self._attribute_diffs) + "\n"
+        mystr = mystr + "SUMMARY of cprnc:\n"
+        mystr = mystr + " The data sections of the two files are byte-for-byte identical,\n"
+        mystr = mystr + " so no fields were analyzed individually\n"
+        mystr = mystr + "  diff_test: the two files seem to be IDENTICAL\n\n"
+        return mystr
 
-        pool = self._create_pool()
-        vlist1 = set(_file1.get_varlist())
-        vlist2 = set(_file2.get_varlist())
-        vlist_shared = vlist1 & vlist2
-        self._vardiffs_list = list(pool.map(_create_vardiffs_wrapper_nodim, vlist_shared))
+    def _add_vardiffs(self):
+        """Add all of the vardiffs to self."""
+
+        myfunc = partial(_create_packed_results,
+                         create_func=partial(_create_vardiffs_wrapper_nodim,
+                                             max_chunk_bytes=self._max_chunk_bytes))
+        vlist1 = set(self._file1.get_varlist())
+        vlist2 = set(self._file2.get_varlist())
+        if self._prefetch_depth is not None:
+            # Keep the order of the file, so that it is read sequentially
+            vlist_shared = [varname for varname in self._file1.get_varlist()
+                            if varname in vlist2]
+        else:
+            # Sort in report order, so that results can be streamed early
+            vlist_shared = sorted(vlist1 & vlist2,
+                                  key=lambda varname: _sort_key(varname, None))
         vlist_1_not_2 = vlist1 - vlist2
         vlist_2_not_1 = vlist2 - vlist1
+        self._expect_results([(varname, None) for varname in
+                              chain(vlist_shared, vlist_1_not_2, vlist_2_not_1)])
+
         for i, vlist_nonshared in enumerate((vlist_1_not_2, vlist_2_not_1)):
             found_in_filenum = i + 1
             for varname in vlist_nonshared:
                 var_diffs = VarDiffsUnsharedVar(varname, found_in_filenum)
-                diff_wrapper = _DiffWrapper.no_slicing(var_diffs, varname)
-                self._add_one_vardiffs(diff_wrapper)
-        self._vardiffs_list.sort(key=diff_wrapper_sort_key)
+                self._add_result(varname, None, pack_vardiffs(var_diffs))
+        if self._prefetch_depth is not None:
+            self._add_vardiffs_prefetched([(varname, None) for varname in vlist_shared])
+        else:
+            costs = [self._estimate_cost(varname, {}) for varname in vlist_shared]
+            with self._create_pool() as pool:
+                self._add_pool_results(pool, myfunc, vlist_shared, costs)
+        self._finish_stream()
 
-    def _add_vardiffs_separated_by_dim(self, dimname):
+    def _add_vardiffs_separated_by_dim(self, dimname, all_slices=False):
         """Add all of the vardiffs to self.
 
         For variables containing the given dimension, analysis is done
-        separately for each slice along this dimension.
-
-        Assumes that globals _file1 and _file2 have already been set.
+        separately for each slice along this dimension. If all_slices is True,
+        then for each variable that is separated along dimname, a summary of
+        all slices is added, too (see _add_slice_stats).
         """
 
-        myfunc = partial(_create_vardiffs_wrapper, dimname=dimname)
-        vlist1 = set(_file1.get_varlist_bydim(dimname))
-        vlist2 = set(_file2.get_varlist_bydim(dimname))
-        vlist_shared = vlist1 & vlist2
-        pool = self._create_pool()
-        self._vardiffs_list = list(pool.map(myfunc, vlist_shared))
+        myfunc = partial(_create_packed_results,
+                         create_func=partial(_create_vardiffs_wrapper, dimname=dimname,
+                                             max_chunk_bytes=self._max_chunk_bytes))
+        vlist1 = set(self._file1.get_varlist_bydim(dimname))
+        vlist2 = set(self._file2.get_varlist_bydim(dimname))
+        if self._prefetch_depth is not None:
+            # Keep the order of the file, so that it is read sequentially
+            vlist_shared = [varname_index for varname_index
+                            in self._file1.get_varlist_bydim(dimname)
+                            if varname_index in vlist2]
+        else:
+            # Sort in report order, so that results can be streamed early
+            vlist_shared = sorted(vlist1 & vlist2,
+                                  key=lambda varname_index: _sort_key(*varname_index))
         vlist_1_not_2 = vlist1 - vlist2
         vlist_2_not_1 = vlist2 - vlist1
+        self._expect_results(list(chain(vlist_shared, vlist_1_not_2, vlist_2_not_1)),
+                             all_slices)
+
+        if self._record_scan:
+            record_varnames = self._get_record_scan_varnames(dimname, vlist_shared)
+            vlist_shared = [(varname, index) for (varname, index) in vlist_shared
+                            if index is None or varname not in record_varnames]
+        else:
+            record_varnames = []
+
+        if self._slice_block_bytes is not None:
+            block_tasks = self._get_slice_block_tasks(dimname, vlist_shared,
+                                                      record_varnames)
+            block_varnames = set(varname for (varname, start, stop) in block_tasks)
+            vlist_shared = [(varname, index) for (varname, index) in vlist_shared
+                            if index is None or varname not in block_varnames]
+        else:
+            block_tasks = []
+
         for i, vlist_nonshared in enumerate((vlist_1_not_2, vlist_2_not_1)):
             found_in_filenum = i + 1
             for (varname, index) in vlist_nonshared:
                 var_diffs = VarDiffsUnsharedVar(varname, found_in_filenum)
-                diff_wrapper = _DiffWrapper.dim_sliced(var_diffs, varname, dimname,
-                                                       index, index)
-                self._add_one_vardiffs(diff_wrapper)
-        self._vardiffs_list.sort(key=diff_wrapper_sort_key)
+                self._add_result(varname, index, pack_vardiffs(var_diffs))
+        if self._prefetch_depth is not None:
+            # These are compared in this process, so do not need the pool
+            self._add_vardiffs_prefetched(vlist_shared, dimname)
+            vlist_shared = []
+        if self._stopped or not (vlist_shared or record_varnames or block_tasks):
+            # (The prefetched comparisons may have stopped at the first
+            # difference, in which case nothing else is compared)
+            self._finish_stream()
+            return
+        with self._create_pool() as pool:
+            costs = [self._estimate_cost(varname, _dim_indices(dimname, index))
+                     for (varname, index) in vlist_shared]
+            self._add_pool_results(pool, myfunc, vlist_shared, costs)
+            if record_varnames:
+                record_func = partial(_create_packed_results,
+                                      create_func=partial(_create_vardiffs_records,
+                                                          dimname=dimname,
+                                                          varnames=record_varnames))
+                record_ranges = self._get_record_ranges(dimname)
+                self._add_pool_results(pool, record_func, record_ranges,
+                                       [stop - start for (start, stop) in record_ranges])
+            if block_tasks:
+                block_func = partial(_create_packed_results,
+                                     create_func=partial(_create_vardiffs_slice_block,
+                                                         dimname=dimname))
+                costs = [self._estimate_cost(varname, {dimname: slice(start, stop)})
+                         for (varname, start, stop) in block_tasks]
+                self._add_pool_results(pool, block_func, block_tasks, costs)
+        self._finish_stream()
+
+    def _expect_results(self, vlist, all_slices=False):
+        """Register the results that will be added with _add_result, before any
+        of them are added. This sets up the store of the results (unless they
+        are written to a stream), and is needed to know when a result can be
+        written to the stream (all results before it in the report have been
+        added) and when all slices of a variable have been added.
 
-    def _create_pool(self):
-        """Return a multiprocessing Pool object that can be used for
-        parallelization"""
+        Arguments:
+        vlist: list of (varname, index) tuples, one for each expected result
+        all_slices: if True, also expect a summary of all slices for each
+            variable that has at least one slice (i.e., a non-None index)
+        """
 
-        if (self._nprocs):
-            return Pool(self._nprocs)
+        keys = []
+        for (varname, index) in vlist:
+            self._result_ids[(varname, index)] = len(keys)
+            keys.append(_sort_key(varname, index))
+        self._num_expected = len(keys)
+        self._summary = DiffSummary(self._num_expected)
+        if all_slices:
+            for (varname, index) in vlist:
+                if index is not None:
+                    self._slices_remaining[varname] = (
+                        self._slices_remaining.get(varname, 0) + 1)
+            for varname in sorted(self._slices_remaining):
+                self._all_slices_ids[varname] = len(keys)
+                keys.append(_sort_key(varname, None, all_slices=True))
+                self._slice_rows[varname] = {}
+        self._order = sorted(range(len(keys)), key=lambda result_id: keys[result_id])
+        if self._stream is not None:
+            self._writer = _OrderedWriter(self._stream, self._order)
         else:
-            return PoolFake()
+            self._results = ResultStore(len(keys))
+
+    def _add_pool_results(self, pool, func, tasks, costs):
+        """Run func on each of the given tasks with the given pool, and add the
+        results packed by _pack_diff_wrappers as they arrive.
 
-    def _add_one_vardiffs(self, diff_wrapper):
-        """Add one _DiffWrapper object to the list."""
+        Tasks are normally scheduled by cost (see file_pool.imap_by_cost). With
+        a stream, they are instead run in the given order (which should be the
+        order of the report), so that results can be written as they arrive.
+        With stop_on_first_difference, the cheapest tasks are started first,
+        and once the files are known to differ, the pool is terminated
+        (cancelling its outstanding tasks) and no further tasks are run, by
+        this or any later call.
+
+        Arguments:
+        pool: pool object (see _create_pool)
+        func: function called as func(files, task), returning packed results
+        tasks: list of task arguments
+        costs: list giving the estimated cost of each task
+        """
+
+        if self._stopped:
+            return
+        if self._writer is not None and not self._stop_on_first_difference:
+            all_packed_results = pool.imap(func, tasks)
+        else:
+            all_packed_results = (packed_results for (task, packed_results) in
+                                  pool.imap_by_cost(func, tasks, costs,
+                                                    cheapest_first=self._stop_on_first_difference))
+        for packed_results in all_packed_results:
+            self._add_packed_results(packed_results)
+            if self._should_stop():
+                self._stopped = True
+                pool.terminate()
+                return
+
+    def _should_stop(self):
+        """Return True if the comparison should stop now, because the files are
+        known to differ (with stop_on_first_difference) and some results are
+        still outstanding"""
+
+        return (self._stop_on_first_difference and
+                not self._summary.is_complete() and
+                self._summary.files_differ())
+
+    def _finish_stream(self):
+        """Once no more results will be added, write any results still held
+        back for the stream (these are only left if the comparison was
+        stopped early)"""
+
+        if self._writer is not None:
+            self._writer.finish()
+
+    def _add_packed_results(self, packed_results):
+        """Add the results packed by _pack_diff_wrappers"""
+
+        (varname_indices, row_bytes) = packed_results
+        rows = np.frombuffer(row_bytes, dtype=ROW_DTYPE)
+        for ((varname, index), row) in zip(varname_indices, rows):
+            self._add_result(varname, index, row)
+
+    def _add_result(self, varname, index, row):
+        """Add one result: the row (see result_store.pack_vardiffs) describing
+        the given variable, or slice of it, which should have been registered
+        with _expect_results. Results can be added in any order.
+
+        With a stream, the result is handed to the writer rather than stored;
+        only the counts in the summary (and, until the summary of all slices of
+        its variable is created, the row of a slice) are kept."""
+
+        result_id = self._result_ids[(varname, index)]
+        if row['kind'] == NUMERIC:
+            shape = self._file1.get_varshape(
+                varname, _dim_indices(self._separate_dim, index))
+        else:
+            shape = None
+        self._summary.add(row)
+        if self._writer is not None:
+            self._writer.add(result_id, self._make_diff_wrapper(
+                result_id, varname, index, unpack_vardiffs(varname, row, shape)))
+        else:
+            self._results.set(result_id, varname, index, row, shape)
+        if index is not None and varname in self._slices_remaining:
+            self._add_slice_stats(varname, index, row)
+
+    def _add_slice_stats(self, varname, index, row):
+        """Note that one more slice of the given variable has been added, for
+        the summary of all slices of the variable; once all slices have been
+        added, create this summary.
+
+        The summary is created by merging the statistics of the individual
+        slices (in order of the slices), so the data are not read again; it is
+        skipped if any slice could not be analyzed. Summaries are stored
+        after the individual results, and do not contribute to the counts of
+        differences.
+        """
+
+        # (Copy the row, so it does not hold on to the buffer it came in)
+        self._slice_rows[varname][index] = row.copy()
+        self._slices_remaining[varname] -= 1
+        if self._slices_remaining[varname] > 0:
+            return
+
+        all_slices_id = self._all_slices_ids[varname]
+        slice_rows = self._slice_rows.pop(varname)
+        rows = [(index, slice_rows[index]) for index in sorted(slice_rows)]
+        var_diffs = None
+        if all(row['kind'] == NUMERIC for (index, row) in rows):
+            dimname = self._separate_dim
+            full_shape = self._file1.get_varshape(varname)
+            dimnum = self._file1.get_vardims(varname).index(dimname)
+            merged = reduce(
+                lambda stats1, stats2: stats1.merge(stats2),
+                [unpack_diff_stats(row).embedded(full_shape, dimnum, index)
+                 for (index, row) in rows])
+            var_diffs = VarDiffs.from_stats(varname, merged, full_shape)
+
+        if self._writer is not None:
+            if var_diffs is None:
+                self._writer.add(all_slices_id, None)
+            else:
+                self._writer.add(all_slices_id, self._make_diff_wrapper(
+                    all_slices_id, varname, None, var_diffs))
+        elif var_diffs is not None:
+            self._results.set(all_slices_id, varname, None, pack_vardiffs(var_diffs),
+                              full_shape)
+
+    def _get_diff_wrapper(self, result_id):
+        """Return the _DiffWrapper object of the stored result with the given
+        id, for printing, or None if this result has not been set"""
+
+        if not self._results.is_set(result_id):
+            return None
+        return self._make_diff_wrapper(result_id, self._results.get_varname(result_id),
+                                       self._results.get_index(result_id),
+                                       self._results.get_vardiffs(result_id))
+
+    def _make_diff_wrapper(self, result_id, varname, index, var_diffs):
+        """Return the _DiffWrapper object, for printing, of the result with
+        the given id, which describes the given variable (or slice of it, if
+        index is not None)
+
+        Arguments:
+        result_id: id of the result (see _expect_results)
+        varname: variable name
+        index: index of the slice along separate_dim, or None
+        var_diffs: VarDiffs object (or object of one of the other VarDiffs
+            classes)
+        """
+
+        if result_id >= self._num_expected:
+            return _DiffWrapper.all_slices(var_diffs, varname, self._separate_dim)
+        if index is None:
+            return _DiffWrapper.no_slicing(var_diffs, varname)
+        return _DiffWrapper.dim_sliced(var_diffs, varname, self._separate_dim,
+                                       index, index)
+
+    def _add_vardiffs_prefetched(self, vlist, dimname=None):
+        """Add the _DiffWrapper objects for each (varname, index) tuple in
+        vlist, computed in order while the data of the following ones are read
+        in a separate thread (see _read_vardata)"""
+
+        files = (self._file1, self._file2)
+        read_func = partial(_read_vardata, files, dimname=dimname,
+                            max_chunk_bytes=self._max_chunk_bytes)
+        for (varname_index, vardata) in prefetch(
+                read_func, vlist, self._prefetch_depth,
+                max_bytes=self._prefetch_bytes, size_func=_vardata_nbytes):
+            diff_wrapper = _create_vardiffs_wrapper(
+                files, varname_index, dimname=dimname,
+                max_chunk_bytes=self._max_chunk_bytes, vardata=vardata)
+            self._add_packed_results(_pack_diff_wrappers([diff_wrapper]))
+            if self._should_stop():
+                # Leaving the loop stops the read-ahead thread
+                self._stopped = True
+                return
+
+    def _get_record_scan_varnames(self, dimname, vlist_shared):
+        """Return a sorted list of the variables whose slices along dimname can
+        be compared with a record scan (see _create_vardiffs_records).
+
+        These are the numeric variables that have the dimension in both files,
+        with the same shape in both. Others (and all variables, if the data
+        are not available in both files) are compared one slice at a time, as
+        usual. With max_chunk_bytes, variables whose slices are larger than
+        that are left out, too, since a record scan reads whole slices.
+
+        Arguments:
+        dimname: name of dimension to separate along
+        vlist_shared: list of (varname, index) tuples present in both files
+        """
+
+        if not (self._file1.is_data_available() and self._file2.is_data_available()):
+            return []
+        varnames = set(varname for (varname, index) in vlist_shared
+                       if index is not None)
+        record_varnames = []
+        for varname in sorted(varnames):
+            if not (self._file1.is_var_numeric(varname) and
+                    self._file2.is_var_numeric(varname)):
+                continue
+            if self._file1.get_varshape(varname) != self._file2.get_varshape(varname):
+                continue
+            if (self._max_chunk_bytes is not None and
+                any(int(np.prod(ncfile.get_varshape(varname, {dimname: 0}))) *
+                    ncfile.get_vardtype(varname).itemsize > self._max_chunk_bytes
+                    for ncfile in (self._file1, self._file2))):
+                continue
+            record_varnames.append(varname)
+        return record_varnames
+
+    def _get_record_ranges(self, dimname):
+        """Return a list of (start, stop) tuples that split the indices along
+        dimname into contiguous ranges, one per task, for the record scan"""
+
+        nrecords = min(self._file1.get_dimsize(dimname),
+                       self._file2.get_dimsize(dimname))
+        ntasks = max(1, min(self._nprocs or 1, nrecords))
+        bounds = [(nrecords * task) // ntasks for task in range(ntasks + 1)]
+        return [(bounds[task], bounds[task + 1]) for task in range(ntasks)]
+
+    def _get_slice_block_tasks(self, dimname, vlist_shared, exclude_varnames=()):
+        """Return a list of (varname, start, stop) tuples, each giving a block
+        of consecutive slices along dimname of one variable whose statistics
+        can be computed together (see _create_vardiffs_slice_block).
+
+        These blocks cover all of the slices of the numeric variables that have
+        the dimension in both files, with the same shape in both, and whose
+        slices are small enough that the statistics of each slice are computed
+        as a single block by the stats kernel. Each block holds at most
+        slice_block_bytes (and max_chunk_bytes, if given) from each file, but
+        always at least one slice. Other variables (and all variables, if the
+        data are not available in both files) are compared one slice at a
+        time, as usual.
+
+        Arguments:
+        dimname: name of dimension to separate along
+        vlist_shared: list of (varname, index) tuples present in both files
+        exclude_varnames: variables that are compared some other way (e.g., with
+            a record scan)
+        """
+
+        if not (self._file1.is_data_available() and self._file2.is_data_available()):
+            return []
+        max_block_bytes = self._slice_block_bytes
+        if self._max_chunk_bytes is not None:
+            max_block_bytes = min(max_block_bytes, self._max_chunk_bytes)
+        indices = {}
+        for (varname, index) in vlist_shared:
+            if index is not None and varname not in exclude_varnames:
+                indices.setdefault(varname, []).append(index)
+        tasks = []
+        for varname in sorted(indices):
+            if not (self._file1.is_var_numeric(varname) and
+                    self._file2.is_var_numeric(varname)):
+                continue
+            if self._file1.get_varshape(varname) != self._file2.get_varshape(varname):
+                continue
+            slice_size = int(np.prod(self._file1.get_varshape(varname, {dimname: 0})))
+            if slice_size > BLOCK_SIZE:
+                continue
+            itemsize = max(self._file1.get_vardtype(varname).itemsize,
+                           self._file2.get_vardtype(varname).itemsize)
+            slices_per_block = max(1, max_block_bytes // max(1, slice_size * itemsize))
+            for (start, stop) in _index_runs(sorted(indices[varname]), slices_per_block):
+                tasks.append((varname, start, stop))
+        # Sort in report order, so that results can be streamed early
+        tasks.sort(key=lambda task: _sort_key(task[0], task[1]))
+        return tasks
+
+    def _estimate_cost(self, varname, dim_indices):
+        """Return an estimate of the cost of comparing the given variable
+        (possibly sliced): the number of bytes to be read from the two files.
+
+        This only looks at metadata, so is cheap to compute.
+
+        With stop_on_first_difference, a variable whose shapes differ between
+        the two files gets a cost of 0: it is known to differ without reading
+        any data, so it is compared first."""
+
+        if (self._stop_on_first_difference and
+            self._file1.get_varshape(varname) != self._file2.get_varshape(varname)):
+            return 0
+        cost = 0
+        for ncfile in (self._file1, self._file2):
+            shape = ncfile.get_varshape(varname, dim_indices)
+            cost += int(np.prod(shape)) * ncfile.get_vardtype(varname).itemsize
+        return cost
+
+    def _create_pool(self):
+        """Return a pool object (see file_pool.py) that can be used for
+        parallelization; its tasks are given the tuple (file1, file2)"""
+
+        return create_file_pool((self._file1, self._file2), self._nprocs,
+                                self._executor)
 
-        self._vardiffs_list.append(diff_wrapper)
 
 # ------------------------------------------------------------------------
 # The following are defined outside the class so that they can be more
 # easily 'pickled' for the sake of parallelization
 # ------------------------------------------------------------------------
 
-def _create_vardiffs_wrapper_nodim(varname):
+def _create_packed_results(files, task, create_func):
+    """Run one task that creates _DiffWrapper objects, and return its results
+    packed into compact rows (see _pack_diff_wrappers), which are much cheaper
+    to send back from a worker than the objects themselves.
+
+    Arguments:
+    files: tuple of netcdf file objects (file1, file2)
+    task: the task's argument to create_func
+    create_func: function called as create_func(files, task), returning a
+        _DiffWrapper object or a list of them
+    """
+
+    diff_wrappers = create_func(files, task)
+    if isinstance(diff_wrappers, _DiffWrapper):
+        diff_wrappers = [diff_wrappers]
+    return _pack_diff_wrappers(diff_wrappers)
+
+
+def _pack_diff_wrappers(diff_wrappers):
+    """Return a tuple (varname_indices, row_bytes) describing the given
+    _DiffWrapper objects: a list of their (varname, index) tuples, and the raw
+    bytes of an array of their packed VarDiffs objects (see
+    result_store.pack_vardiffs). Raw bytes are much cheaper to pickle than
+    numpy objects, each of which carries a description of its data type."""
+
+    rows = np.zeros(len(diff_wrappers), dtype=ROW_DTYPE)
+    for (i, diff_wrapper) in enumerate(diff_wrappers):
+        rows[i] = pack_vardiffs(diff_wrapper.var_diffs)
+    return ([(diff_wrapper.varname, diff_wrapper.index1)
+             for diff_wrapper in diff_wrappers],
+            rows.tobytes())
+
+
+def _create_vardiffs_wrapper_nodim(files, varname, max_chunk_bytes=None):
     """Create one DiffWrapper object, with no separation by dimension.
     Arguments:
+    files: tuple of netcdf file objects (file1, file2)
     varname: string
+    max_chunk_bytes: maximum bytes to read at once from each file (or None)
     """
 
-    return _create_vardiffs_wrapper((varname, None))
+    return _create_vardiffs_wrapper(files, (varname, None),
+                                    max_chunk_bytes=max_chunk_bytes)
 
 
-def _create_vardiffs_wrapper(varname_index, dimname=None):
+def _create_vardiffs_wrapper(files, varname_index, dimname=None, max_chunk_bytes=None,
+                             vardata=None):
     """Create one DiffWrapper object.
 
     Arguments:
+    files: tuple of netcdf file objects (file1, file2)
     varname_index: tuple (varname, index)
     dimname: dimension name (or None)
+    max_chunk_bytes: maximum bytes to read at once from each file (or None)
+    vardata: the variable's data from the two files, if already read (see
+        _read_vardata), or None
     """
 
     (varname, index) = varname_index
 
     if index is None:
-        var_diffs = _create_vardiffs(varname)
+        var_diffs = _create_vardiffs(files, varname, max_chunk_bytes=max_chunk_bytes,
+                                     vardata=vardata)
         diff_wrapper = _DiffWrapper.no_slicing(var_diffs, varname)
     else:
         # For now, assume that we want the same index in file2 as in file1.
@@ -248,32 +794,181 @@ def _create_vardiffs_wrapper(varname_index, dimname=None):
         # TODO(wjs, 2015-12-31) (optional) allow for different indices,
         # based on reading the associated coordinate variable and finding
         # the matching coordinate (e.g., matching time).
-        var_diffs = _create_vardiffs(varname, {dimname:index})
+        var_diffs = _create_vardiffs(files, varname, _dim_indices(dimname, index),
+                                     max_chunk_bytes=max_chunk_bytes, vardata=vardata)
         diff_wrapper = _DiffWrapper.dim_sliced(var_diffs, varname,
                                                dimname, index, index)
 
     return diff_wrapper
 
 
-def _create_vardiffs(varname, dim_indices={}):
+def _create_vardiffs_records(files, record_range, dimname, varnames):
+    """Create the DiffWrapper objects for the given variables at each index
+    along dimname in the given range, walking through the two files together,
+    in order of the index (see NetcdfFile.iter_records).
+
+    Assumes that the given variables are numeric and have the same shape in
+    both files. Returns a list of DiffWrapper objects.
+
+    Arguments:
+    files: tuple of netcdf file objects (file1, file2)
+    record_range: tuple (start, stop) giving the range of indices along dimname
+    dimname: dimension name
+    varnames: list of variable names
+    """
+
+    (file1, file2) = files
+    (start, stop) = record_range
+    diff_wrappers = []
+    for ((index, data1), (index2, data2)) in zip(
+            file1.iter_records(dimname, varnames, start, stop),
+            file2.iter_records(dimname, varnames, start, stop)):
+        for varname in varnames:
+            var_diffs = VarDiffs(varname, data1[varname], data2[varname])
+            diff_wrappers.append(_DiffWrapper.dim_sliced(var_diffs, varname,
+                                                         dimname, index, index))
+    return diff_wrappers
+
+
+def _create_vardiffs_slice_block(files, task, dimname):
+    """Create the DiffWrapper objects for a block of consecutive slices along
+    dimname of one variable, reading the block from each file at once and
+    computing the statistics of all of its slices together (see
+    stats_kernel.compute_diff_stats_slices).
+
+    Assumes that the variable is numeric and has the same shape in both files.
+    Returns a list of DiffWrapper objects, one per slice.
+
+    Arguments:
+    files: tuple of netcdf file objects (file1, file2)
+    task: tuple (varname, start, stop) giving the range of indices along dimname
+    dimname: dimension name
+    """
+
+    (file1, file2) = files
+    (varname, start, stop) = task
+    dimnum = file1.get_vardims(varname).index(dimname)
+    slice_shape = file1.get_varshape(varname, {dimname: start})
+    # Move the slices to the first dimension, as compute_diff_stats_slices
+    # expects
+    blocks1 = np.moveaxis(file1.get_vardata(varname, {dimname: slice(start, stop)},
+                                            copy=False), dimnum, 0)
+    blocks2 = np.moveaxis(file2.get_vardata(varname, {dimname: slice(start, stop)},
+                                            copy=False), dimnum, 0)
+    diff_wrappers = []
+    for (index, stats) in enumerate(compute_diff_stats_slices(blocks1, blocks2), start):
+        var_diffs = VarDiffs.from_stats(varname, stats, slice_shape)
+        diff_wrappers.append(_DiffWrapper.dim_sliced(var_diffs, varname,
+                                                     dimname, index, index))
+    return diff_wrappers
+
+
+def _index_runs(indices, max_length):
+    """Split a sorted list of indices into runs of consecutive indices of at
+    most max_length indices each; returns a list of (start, stop) tuples"""
+
+    runs = []
+    for index in indices:
+        if runs and runs[-1][1] == index and runs[-1][1] - runs[-1][0] < max_length:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return [tuple(run) for run in runs]
+
+
+def _dim_indices(dimname, index):
+    """Return the dim_indices dictionary for the given index along dimname (or
+    an empty dictionary if index is None)"""
+
+    if index is None:
+        return {}
+    else:
+        return {dimname:index}
+
+
+def _read_vardata(files, varname_index, dimname=None, max_chunk_bytes=None):
+    """Read the data of one variable (or slice) from the two files, for
+    _create_vardiffs; this is the reading stage of the prefetch pipeline.
+
+    Returns a tuple (data1, data2) of copies of the data, or None for a
+    variable that _create_vardiffs would not read all at once: one that is not
+    numeric in both files, whose data are unavailable, or, with
+    max_chunk_bytes, whose data in either file are larger than that.
+
+    Arguments:
+    files: tuple of netcdf file objects (file1, file2)
+    varname_index: tuple (varname, index)
+    dimname: dimension name (or None)
+    max_chunk_bytes: maximum bytes to read at once from each file (or None)
+    """
+
+    (varname, index) = varname_index
+    dim_indices = _dim_indices(dimname, index)
+    for f in files:
+        if not (f.is_data_available() and f.is_var_numeric(varname)):
+            return None
+        if (max_chunk_bytes is not None and
+            int(np.prod(f.get_varshape(varname, dim_indices))) *
+            f.get_vardtype(varname).itemsize > max_chunk_bytes):
+            return None
+    # Copying the data forces them to be read now, rather than when they are
+    # first used (e.g., from a memory-mapped file)
+    return tuple(f.get_vardata(varname, dim_indices, copy=True) for f in files)
+
+
+def _vardata_nbytes(vardata):
+    """Returns the number of bytes held by a result of _read_vardata"""
+
+    if vardata is None:
+        return 0
+    return sum(np.ma.getdata(data).nbytes + np.ma.getmask(data).nbytes
+               for data in vardata)
+
+
+def _create_vardiffs(files, varname, dim_indices={}, max_chunk_bytes=None, vardata=None):
     """Create and return a VarDiffs object.
 
     Assumes that the given varname and dim_indices are present on both files
 
     Arguments:
+    files: tuple of netcdf file objects (file1, file2)
     varname: variable name
     dim_indices: dictionary of (dimname:index) pairs giving dimension index or
         indices to use for slicing the data (should agree with index_info)
+    max_chunk_bytes: if not None, read and analyze the data in pieces of at most
+        this many bytes from each file
+    vardata: tuple (data1, data2) giving the data from the two files, if they
+        have already been read (see _read_vardata), or None
     """
 
+    (file1, file2) = files
     varIsNumeric = True
-    for f in (_file1, _file2):
+    for f in (file1, file2):
         if (f.has_variable(varname)):
             varIsNumeric = varIsNumeric and f.is_var_numeric(varname)
 
-    if (varIsNumeric):
-        v1 = _file1.get_vardata(varname, dim_indices)
-        v2 = _file2.get_vardata(varname, dim_indices)
+    my_vardiffs = None
+    if (varIsNumeric and file1.var_bytes_equal(file2, varname, dim_indices)):
+        my_vardiffs = _create_vardiffs_identical(files, varname, dim_indices, max_chunk_bytes)
+
+    if (my_vardiffs is not None):
+        pass
+    elif (varIsNumeric and not (file1.is_data_available() and
+                                file2.is_data_available())):
+        my_vardiffs = VarDiffsDataUnavailable(varname)
+    elif (vardata is not None):
+        (v1, v2) = vardata
+        if (v1.shape == v2.shape):
+            my_vardiffs = VarDiffs(varname, v1, v2)
+        else:
+            my_vardiffs = VarDiffsDimSizeDiff(varname)
+    elif (varIsNumeric and max_chunk_bytes is not None):
+        my_vardiffs = _create_vardiffs_chunked(files, varname, dim_indices, max_chunk_bytes)
+    elif (varIsNumeric):
+        # The data are only needed while computing the statistics, so there is
+        # no need to copy them out of the files
+        v1 = file1.get_vardata(varname, dim_indices, copy=False)
+        v2 = file2.get_vardata(varname, dim_indices, copy=False)
         if (v1.shape == v2.shape):
             my_vardiffs = VarDiffs(varname, v1, v2)
         else:
@@ -284,6 +979,113 @@ def _create_vardiffs(varname, dim_indices={}):
     return my_vardiffs
 
 
+def _create_vardiffs_identical(files, varname, dim_indices, max_chunk_bytes):
+    """Create and return a VarDiffs object for a numeric variable whose data are
+    known to be byte-for-byte identical in the two files.
+
+    Only the single-variable statistics of file1 are needed: the statistics on
+    differences follow from the identity. These are taken from the statistics
+    stored with file1, if any (e.g., if file1 is a manifest); otherwise only
+    file1's data are read. Returns None if the variable contains (unmasked) NaN
+    values, since these compare unequal to themselves, so the full comparison is
+    needed to give the usual results.
+
+    Arguments:
+    files: tuple of netcdf file objects (file1, file2)
+    varname: variable name
+    dim_indices: dictionary of (dimname:index) pairs giving dimension index or
+        indices to use for slicing the data
+    max_chunk_bytes: if not None, read the data in pieces of at most this many
+        bytes
+    """
+
+    (file1, file2) = files
+    shape = file1.get_varshape(varname, dim_indices)
+    stored_stats = file1.get_stored_varstats(varname, dim_indices)
+    if stored_stats is not None:
+        var_stats = VarStatsAccumulator.from_dict(stored_stats)
+    else:
+        if max_chunk_bytes is None:
+            max_chunk_size = None
+        else:
+            max_chunk_size = max(1, max_chunk_bytes // file1.get_vardtype(varname).itemsize)
+        var_stats = compute_var_stats_chunked(
+            file1.get_vardata_chunks(varname, dim_indices, max_chunk_size,
+                                     copy=False))
+    if _var_stats_have_nan(var_stats):
+        return None
+    stats = DiffStatsAccumulator.identical(var_stats)
+    return VarDiffs.from_stats(varname, stats, shape)
+
+
+def _file_has_nan(ncfile, max_chunk_bytes=None):
+    """Return True if any floating point variable of the given file contains
+    (unmasked) NaN values.
+
+    The data are checked in blocks of at most BLOCK_SIZE elements, stopping at
+    the first block with an unmasked NaN, so this costs little more than
+    reading the floating point data once.
+
+    Arguments:
+    ncfile: netcdf file object
+    max_chunk_bytes: if not None, read the data in pieces of at most this many
+        bytes
+    """
+
+    for varname in ncfile.get_varlist():
+        if not (ncfile.is_var_numeric(varname) and
+                ncfile.get_vardtype(varname).kind == 'f'):
+            continue
+        max_chunk_size = BLOCK_SIZE
+        if max_chunk_bytes is not None:
+            max_chunk_size = min(max_chunk_size, max(
+                1, max_chunk_bytes // ncfile.get_vardtype(varname).itemsize))
+        for chunk in ncfile.get_vardata_chunks(varname, {}, max_chunk_size, copy=False):
+            isnan = np.isnan(np.ma.getdata(chunk))
+            if not isnan.any():
+                continue
+            mask = np.ma.getmask(chunk)
+            if mask is np.ma.nomask or (isnan & ~mask).any():
+                return True
+    return False
+
+
+def _var_stats_have_nan(var_stats):
+    """Return True if the variable described by the given VarStatsAccumulator
+    object contains (unmasked) NaN values"""
+
+    return (var_stats.num_valid > 0 and
+            (np.isnan(var_stats.max_val) or np.isnan(var_stats.min_val)))
+
+
+def _create_vardiffs_chunked(files, varname, dim_indices, max_chunk_bytes):
+    """Create and return a VarDiffs object for a numeric variable, reading the
+    data in pieces of at most max_chunk_bytes from each file.
+
+    Assumes that the given varname and dim_indices are present on both files
+
+    Arguments:
+    files: tuple of netcdf file objects (file1, file2)
+    varname: variable name
+    dim_indices: dictionary of (dimname:index) pairs giving dimension index or
+        indices to use for slicing the data
+    max_chunk_bytes: maximum number of bytes to read at once from each file
+    """
+
+    (file1, file2) = files
+    shape = file1.get_varshape(varname, dim_indices)
+    if (shape != file2.get_varshape(varname, dim_indices)):
+        return VarDiffsDimSizeDiff(varname)
+
+    itemsize = max(file1.get_vardtype(varname).itemsize,
+                   file2.get_vardtype(varname).itemsize)
+    max_chunk_size = max(1, max_chunk_bytes // itemsize)
+    chunks1 = file1.get_vardata_chunks(varname, dim_indices, max_chunk_size, copy=False)
+    chunks2 = file2.get_vardata_chunks(varname, dim_indices, max_chunk_size, copy=False)
+    stats = compute_diff_stats_chunked(zip(chunks1, chunks2))
+    return VarDiffs.from_stats(varname, stats, shape)
+
+
 class _DiffWrapper(object):
     """This class is used by FileDiffs to wrap instances of VarDiffs objects. It
     should not be used by outside code.
@@ -294,14 +1096,17 @@ class _DiffWrapper(object):
     Typically, instances should be created using one of:
     my_vardiffs = _DiffWrapper.no_slicing(var_diffs, varname)
     my_vardiffs = _DiffWrapper.dim_sliced(var_diffs, varname, separate_dim, index1, index2)
+    my_vardiffs = _DiffWrapper.all_slices(var_diffs, varname, separate_dim)
     """
 
-    def __init__(self, var_diffs, varname, separate_dim, index1, index2):
+    def __init__(self, var_diffs, varname, separate_dim, index1, index2,
+                 all_slices=False):
         self.var_diffs = var_diffs
         self.varname = varname
         self.separate_dim = separate_dim
         self.index1 = index1
         self.index2 = index2
+        self.all_slices = all_slices
 
     @classmethod
     def no_slicing(cls, var_diffs, varname):
@@ -329,9 +1134,25 @@ class _DiffWrapper(object):
         """
         return cls(var_diffs, varname, separate_dim, index1, index2)
 
+    @classmethod
+    def all_slices(cls, var_diffs, varname, separate_dim):
+        """Returns a _DiffWrapper object that is appropriate for statistics
+        combined over all slices along one dimension.
+
+        Arguments:
+        var_diffs: VarDiffs object
+        varname: string: name of this variable
+        separate_dim: string: name of dimension that was sliced
+        """
+        return cls(var_diffs, varname, separate_dim, index1=None, index2=None,
+                   all_slices=True)
+
     def __str__(self):
         mystr = self.varname + "  "
-        if self.separate_dim is None:
+        if self.all_slices:
+            mystr = mystr + "{dimname} index: {index1} {index2}".format(
+                dimname=self.separate_dim, index1="   All", index2="   All")
+        elif self.separate_dim is None:
             pass
         elif self.index1 is None and self.index2 is None:
             pass
@@ -356,16 +1177,73 @@ class _DiffWrapper(object):
 # Sort functions
 # ------------------------------------------------------------------------
 
-def diff_wrapper_sort_key(diff_wrapper):
-    """Given a _DiffWrapper object, returns a key that can be used for sorting
+def _sort_key(varname, index, all_slices=False):
+    """Returns a key giving the position in the report of the _DiffWrapper
+    object that would have the given varname, index1 and all_slices"""
 
-    Args:
-        diff_wrapper: object of type _DiffWrapper
-    """
-    name = diff_wrapper.varname.lower()
-    index = diff_wrapper.index1
-    if index is None:
+    name = varname.lower()
+    if all_slices:
+        # make sure a summary of all slices appears after the individual slices
+        index = float("inf")
+    elif index is None:
         # make sure an index of 'None' appears before any numeric index
         index = float("-inf")
     return (name, index)
 
+# ------------------------------------------------------------------------
+# Streaming of the results
+# ------------------------------------------------------------------------
+
+class _OrderedWriter(object):
+    """Writes results to a stream in sort order, as soon as possible, when they
+    arrive in an arbitrary order.
+
+    Each expected result has an id (see FileDiffs._expect_results). A result is
+    written once it and all results that come before it in the given order have
+    been added; until then, only its text is held here.
+    """
+
+    def __init__(self, stream, order):
+        """Create an _OrderedWriter object.
+
+        Arguments:
+        stream: file-like object
+        order: list of the ids of all expected results, in the order in which
+            they are to be written
+        """
+
+        self._stream = stream
+        self._order = order
+        self._next = 0
+        self._pending = {}
+
+    def add(self, result_id, diff_wrapper):
+        """Add the result with the given id: a _DiffWrapper object, or None if
+        there is nothing to write for this id"""
+
+        if diff_wrapper is None:
+            self._pending[result_id] = None
+        else:
+            self._pending[result_id] = str(diff_wrapper) + "\n\n"
+        written = False
+        while (self._next < len(self._order) and
+               self._order[self._next] in self._pending):
+            text = self._pending.pop(self._order[self._next])
+            self._next += 1
+            if text is not None:
+                self._stream.write(text)
+                written = True
+        if written:
+            self._stream.flush()
+
+    def finish(self):
+        """Write all results that are still held, in order, skipping those
+        that never arrived (e.g., because the comparison was stopped early)"""
+
+        for result_id in self._order[self._next:]:
+            text = self._pending.pop(result_id, None)
+            if text is not None:
+                self._stream.write(text)
+        self._next = len(self._order)
+        self._stream.flush()
+
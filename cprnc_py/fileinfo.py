@@ -1,7 +1,9 @@
 
 from __future__ import print_function
-from multiprocessing import Process, Queue
-from cprnc_py.multiprocessing_fake import PoolFake
+from functools import partial
+import numpy as np
+from cprnc_py.file_pool import create_file_pool
+from cprnc_py.stats_kernel import compute_var_stats_slices, BLOCK_SIZE
 from cprnc_py.varinfo import (VarInfo, VarInfoNonNumeric)
 
 class FileInfo(object):
@@ -26,7 +28,8 @@ class FileInfo(object):
          - str(finfo)
     """
 
-    def __init__(self, ncfile, separate_dim="time", nprocs=None):
+    def __init__(self, ncfile, separate_dim="time", nprocs=None, executor=None,
+                 slice_block_bytes=None):
         """Create a FileInfo object.
 
         Arguments:
@@ -41,9 +44,23 @@ class FileInfo(object):
             package (this adds some overhead, and is just intended for testing)
             nprocs > 1 means to use multiple tasks with the multiprocessing
             package
+            Each worker process opens its own copy of the file (see
+            NetcdfFile.get_opener).
+        executor: How to run the tasks: 'serial', 'threads' (worker threads
+            sharing ncfile) or 'processes' (see file_pool.EXECUTORS)
+            executor = None (the default) means 'processes' if nprocs is
+            given, 'serial' otherwise.
+        slice_block_bytes: If not None (and separate_dim is given), then for
+            numeric variables whose slices along separate_dim are small, blocks
+            of consecutive slices of up to this many bytes are read at once,
+            and the statistics of all slices in a block are computed together
+            (see stats_kernel.compute_var_stats_slices). Results are identical
+            either way.
         """
         self._file = ncfile
         self._nprocs = nprocs
+        self._executor = executor
+        self._slice_block_bytes = slice_block_bytes
         self._varlist = []
         if (separate_dim and separate_dim in ncfile.get_varlist()):
             self._add_separated_varinfo(separate_dim)
@@ -64,41 +81,127 @@ class FileInfo(object):
         return mystr
 
     def _add_separated_varinfo(self, dim):
-        q = Queue()
-        procs = []
-        for (varname, index) in self._file.get_varlist_bydim(dim):
-            if index is None:
-                p = Process(target=_create_varinfo_wrapper,
-                            args=(self._file, varname, q, {}))
-            else:
-                p = Process(target=_create_varinfo_wrapper,
-                            args=(self._file, varname, q, {dim: index}))
-            p.start()
-            procs.append(p)
-        self._varlist = []
-        for p in procs:
-            p.join()
-            info, indices = q.get()
-            self._varlist.append(info)
+        varlist = list(self._file.get_varlist_bydim(dim))
+        if self._slice_block_bytes is None:
+            block_tasks = []
+        else:
+            block_tasks = self._get_slice_block_tasks(dim, varlist)
+        block_varnames = set(varname for (varname, dim_indices) in block_tasks)
+        varlist_single = [(varname, index) for (varname, index) in varlist
+                          if index is None or varname not in block_varnames]
+        tasks = [(varname, _dim_indices(dim, index))
+                 for (varname, index) in varlist_single]
+        varinfo = dict(zip(varlist_single, self._map_with_pool(tasks)))
+        block_func = partial(_create_varinfo_slice_block, dimname=dim)
+        for ((varname, dim_indices), varinfo_list) in zip(
+                block_tasks, self._map_with_pool(block_tasks, block_func)):
+            for (index, this_varinfo) in enumerate(varinfo_list, dim_indices[dim].start):
+                varinfo[(varname, index)] = this_varinfo
+        self._varlist = [varinfo[varname_index] for varname_index in varlist]
 
     def _add_varinfo(self):
-        q = Queue()
-        vnamelist = self._file.get_varlist()
-        procs = [Process(target=_create_varinfo_wrapper,
-                         args=(self._file, varname, q, {}))
-                 for varname in vnamelist]
-        for p in procs:
-            p.start()
-        self._varlist = []
-        for p in procs:
-            p.join()
-            self._varlist.append(q.get()[0])
-
-def _create_varinfo_wrapper(f, varname, q, dim_indices={}):
-    if not f.is_var_numeric(varname):
-        q.put((VarInfoNonNumeric(varname), None))
-        return
-    varinfo = VarInfo(f.get_vardata(varname, dim_indices), varname)
-    a = (varinfo, dim_indices)
-    q.put(a)
-    return
+        tasks = [(varname, {}) for varname in self._file.get_varlist()]
+        self._varlist = self._map_with_pool(tasks)
+
+    def _map_with_pool(self, tasks, func=None):
+        """Return the list of results of func (by default, the VarInfo object)
+        for the given tasks, each of which is a tuple (varname, dim_indices), in
+        the order of the tasks.
+
+        The tasks are run by a pool of at most nprocs workers, each of which
+        opens the file once (see file_pool.py); they are scheduled by their
+        estimated costs, like those of FileDiffs."""
+
+        costs = [self._estimate_cost(varname, dim_indices)
+                 for (varname, dim_indices) in tasks]
+        with create_file_pool((self._file,), self._nprocs, self._executor) as pool:
+            return pool.map_by_cost(func or _create_varinfo, tasks, costs)
+
+    def _get_slice_block_tasks(self, dimname, varlist):
+        """Return a list of (varname, dim_indices) tuples, each of whose
+        dim_indices selects a block of consecutive slices along dimname of one
+        variable whose statistics can be computed together (see
+        _create_varinfo_slice_block).
+
+        These blocks cover all of the slices of the numeric variables with the
+        dimension whose slices are small enough that the statistics of each
+        slice are computed as a single block by the stats kernel. Each block
+        holds at most slice_block_bytes, but always at least one slice.
+
+        Arguments:
+        dimname: name of dimension to separate along
+        varlist: list of (varname, index) tuples, as from get_varlist_bydim
+        """
+
+        indices = {}
+        for (varname, index) in varlist:
+            if index is not None:
+                indices.setdefault(varname, []).append(index)
+        tasks = []
+        for varname in sorted(indices):
+            if not self._file.is_var_numeric(varname):
+                continue
+            slice_size = int(np.prod(self._file.get_varshape(varname, {dimname: 0})))
+            if slice_size > BLOCK_SIZE:
+                continue
+            slice_bytes = max(1, slice_size * self._file.get_vardtype(varname).itemsize)
+            slices_per_block = max(1, self._slice_block_bytes // slice_bytes)
+            # get_varlist_bydim gives every index along the dimension, in order
+            nslices = len(indices[varname])
+            for start in range(0, nslices, slices_per_block):
+                stop = min(start + slices_per_block, nslices)
+                tasks.append((varname, {dimname: slice(start, stop)}))
+        return tasks
+
+    def _estimate_cost(self, varname, dim_indices):
+        """Return an estimate of the cost of analyzing the given variable
+        (possibly sliced): the number of bytes to be read.
+
+        This only looks at metadata, so is cheap to compute."""
+
+        shape = self._file.get_varshape(varname, dim_indices)
+        return int(np.prod(shape)) * self._file.get_vardtype(varname).itemsize
+
+def _dim_indices(dimname, index):
+    """Return the dim_indices dictionary for the given slice along dimname
+    (index None meaning the whole variable)"""
+
+    if index is None:
+        return {}
+    else:
+        return {dimname: index}
+
+def _create_varinfo(files, task):
+    """Return the VarInfo object for one task run by a file pool.
+
+    Arguments:
+    files: tuple (ncfile,)
+    task: tuple (varname, dim_indices)
+    """
+
+    (ncfile,) = files
+    (varname, dim_indices) = task
+    if not ncfile.is_var_numeric(varname):
+        return VarInfoNonNumeric(varname)
+    return VarInfo(ncfile.get_vardata(varname, dim_indices, copy=False), varname)
+
+def _create_varinfo_slice_block(files, task, dimname):
+    """Return the list of VarInfo objects for each slice along dimname in a
+    block of consecutive slices of a numeric variable, reading the block at
+    once and computing the statistics of all of its slices together (see
+    stats_kernel.compute_var_stats_slices).
+
+    Arguments:
+    files: tuple (ncfile,)
+    task: tuple (varname, dim_indices), where dim_indices maps dimname to a
+        slice object
+    dimname: dimension name
+    """
+
+    (ncfile,) = files
+    (varname, dim_indices) = task
+    dimnum = ncfile.get_vardims(varname).index(dimname)
+    slice_shape = ncfile.get_varshape(varname, {dimname: 0})
+    block = np.moveaxis(ncfile.get_vardata(varname, dim_indices, copy=False), dimnum, 0)
+    return [VarInfo.from_stats(stats, slice_shape, varname)
+            for stats in compute_var_stats_slices(block)]
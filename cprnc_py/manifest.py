@@ -0,0 +1,107 @@
+"""Writing of manifests: compact summaries of a netcdf file, giving a digest
+and the VarInfo statistics of each variable (or of each slice of a variable
+along some dimension).
+
+A manifest can then be used in place of the file itself as file 1 of a
+comparison (see cprnc_py.netcdf.netcdf_file_manifest.NetcdfFileManifest), so
+that the file only needs to be read for variables whose digests differ.
+
+Typical usage is:
+
+    write_manifest(ncfile, 'baseline.manifest')
+    FileDiffs(NetcdfFileManifest('baseline.manifest'), ncfile2)
+"""
+
+from __future__ import print_function
+
+import json
+import os
+from cprnc_py.stats_kernel import compute_var_stats_chunked
+from cprnc_py.netcdf.netcdf_utils import DataDigest
+from cprnc_py.netcdf.netcdf_file_manifest import (MANIFEST_FORMAT, MANIFEST_VERSION,
+                                                  slice_key)
+
+# ------------------------------------------------------------------------
+# Public functions
+# ------------------------------------------------------------------------
+
+def write_manifest(ncfile, filename, separate_dim="time", max_chunk_bytes=None):
+    """Write a manifest describing the given netcdf file.
+
+    Arguments:
+    ncfile: netcdf file object with methods get_varlist, get_vardata, etc.
+    filename: name of the manifest file to write
+    separate_dim: name of dimension to separate along (should match the
+        separate_dim of the comparisons in which the manifest will be used)
+        For variables containing this dimension, a digest and statistics are
+        stored for each slice along this dimension; for other variables, they
+        are stored for the whole variable.
+    max_chunk_bytes: If not None, then each variable (or slice) is read in
+        consecutive pieces of at most this many bytes, rather than all at once.
+    """
+
+    manifest = {'format': MANIFEST_FORMAT,
+                'version': MANIFEST_VERSION,
+                'baseline': os.path.abspath(ncfile.get_filename()),
+                'separate_dim': separate_dim,
+                'dimensions': dict((dimname, int(ncfile.get_dimsize(dimname)))
+                                   for dimname in ncfile.get_dimlist()),
+                'variables': dict((varname, _variable_entry(ncfile, varname,
+                                                            separate_dim,
+                                                            max_chunk_bytes))
+                                  for varname in ncfile.get_varlist())}
+    with open(filename, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, sort_keys=True, separators=(',', ':'))
+
+# ------------------------------------------------------------------------
+# Private functions
+# ------------------------------------------------------------------------
+
+def _variable_entry(ncfile, varname, separate_dim, max_chunk_bytes):
+    """Returns the manifest's entry for one variable, as a dictionary"""
+
+    dimensions = ncfile.get_vardims(varname)
+    shape = ncfile.get_varshape(varname)
+    numeric = ncfile.is_var_numeric(varname)
+    slices = {}
+    if numeric:
+        if separate_dim in dimensions:
+            indices = range(shape[dimensions.index(separate_dim)])
+        else:
+            indices = [None]
+        for index in indices:
+            if index is None:
+                dim_indices = {}
+            else:
+                dim_indices = {separate_dim: index}
+            slices[slice_key(index)] = _slice_entry(ncfile, varname, dim_indices,
+                                                    max_chunk_bytes)
+
+    return {'dimensions': dimensions,
+            'shape': [int(n) for n in shape],
+            'dtype': ncfile.get_vardtype(varname).str,
+            'numeric': numeric,
+            'slices': slices}
+
+def _slice_entry(ncfile, varname, dim_indices, max_chunk_bytes):
+    """Returns the digest and statistics of one variable (or slice), as a
+    dictionary, reading the data only once"""
+
+    if max_chunk_bytes is None:
+        max_chunk_size = None
+    else:
+        max_chunk_size = max(1, max_chunk_bytes // ncfile.get_vardtype(varname).itemsize)
+    digest = DataDigest(ncfile.get_vardtype(varname),
+                        ncfile.get_varshape(varname, dim_indices))
+    chunks = ncfile.get_vardata_chunks(varname, dim_indices, max_chunk_size, copy=False)
+    stats = compute_var_stats_chunked(_digested(chunks, digest))
+    return {'digest': digest.hexdigest(),
+            'stats': stats.to_dict()}
+
+def _digested(chunks, digest):
+    """Generator that yields the given chunks unchanged, adding each one to
+    digest (a DataDigest object) along the way"""
+
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
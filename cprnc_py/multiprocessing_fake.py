@@ -5,6 +5,42 @@ interface. The point of this is so we can avoid the overhead of the true
 multiprocessing package when just using one proc.
 """
 
-class PoolFake(object):
-    def __init__(self):
-        self.map = map
+class FilePoolFake(object):
+    """Fake replacement for FilePool (see file_pool.py).
+
+    This version runs all tasks serially in the calling process, using the
+    given file objects themselves."""
+
+    def __init__(self, files):
+        self._files = tuple(files)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def map(self, func, iterable):
+        return [func(self._files, item) for item in iterable]
+
+    def imap(self, func, iterable, chunksize=1):
+        for item in iterable:
+            yield func(self._files, item)
+
+    def map_by_cost(self, func, items, costs):
+        return self.map(func, items)
+
+    def imap_by_cost(self, func, items, costs, cheapest_first=False):
+        items = list(items)
+        tasks = range(len(items))
+        if cheapest_first:
+            costs = list(costs)
+            tasks = sorted(tasks, key=lambda task: costs[task])
+        for task in tasks:
+            yield (task, func(self._files, items[task]))
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
@@ -24,12 +24,61 @@ class NetcdfFile(object):
     - get_varlist_by_dim(dimname): Generator that yields a tuple (varname,
       index), with one return for each index in the given dimname
 
-    - get_vardata(varname, dim_indices): Returns the variable's data, possibly
-      sliced along one or more named dimensions
+    - get_vardata(varname, dim_indices, copy): Returns the variable's data,
+      possibly sliced along one or more named dimensions
+
+    - get_vardata_chunks(varname, dim_indices, max_chunk_size, copy): Generator
+      that yields the variable's data (possibly sliced) in consecutive pieces of
+      bounded size
+
+    - iter_records(dimname, varnames, start, stop): Generator that yields the
+      slices of several variables along a dimension, one index at a time
+
+    - get_varshape(varname, dim_indices): Returns the shape of the array that
+      would be returned by get_vardata
+
+    - get_vardtype(varname): Returns the numpy dtype of the variable's data
+
+    - get_vardims(varname): Returns a list of the variable's dimension names
+
+    - get_varattributes(varname): Returns a dictionary of the variable's
+      attributes
 
     - is_var_numeric(varname): Returns True if the given variable is numeric
+
+    - var_bytes_equal(other, varname, dim_indices): Returns True if the given
+      variable's data are known to be byte-for-byte identical in this file and
+      another file (subclasses that can compare raw file contents override
+      this)
+
+    - data_section_equal(other): Returns True if the data sections of this
+      file and another file are known to be byte-for-byte identical, with the
+      same variables laid out in the same way (subclasses that can compare raw
+      file contents override this)
+
+    - is_data_available(): Returns True if variable data can be read from this
+      file (False for files that only hold summaries of the data)
+
+    - get_stored_varstats(varname, dim_indices): Returns statistics on the
+      given variable that are stored with the file, if any
+
+    - get_opener(): Returns a picklable recipe for opening an equivalent
+      NetcdfFile object in another process
+
+    - close(): Closes the file (this is also done when a NetcdfFile is used as
+      a context manager)
     """
 
+    def __init__(self):
+        # Index of the variables by dimension; built lazily by _get_dim_index
+        self._dim_index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     # ------------------------------------------------------------------------
     # Public methods implemented here
     # ------------------------------------------------------------------------
@@ -61,24 +110,20 @@ class NetcdfFile(object):
         ('foo3', 2)
         """
 
+        dim_index = self._get_dim_index()
         dimsize = self.get_dimsize(dimname)
 
         # First yield variables that do not have the given dimension
-        for varname in sorted(self.get_varlist()):
-            var = self._get_variable(varname)
-            dimnum = var.get_dimnum(dimname)
-            if dimnum is None:
-                yield (varname, None)
+        for varname in dim_index.varnames_without_dim(dimname):
+            yield (varname, None)
 
         # Now yield variables with the given dimension
+        varnames = dim_index.varnames_with_dim(dimname)
         for index in range(dimsize):
-            for varname in sorted(self.get_varlist()):
-                var = self._get_variable(varname)
-                dimnum = var.get_dimnum(dimname)
-                if dimnum is not None:
-                    yield (varname, index)
-        
-    def get_vardata(self, varname, dim_indices={}):
+            for varname in varnames:
+                yield (varname, index)
+
+    def get_vardata(self, varname, dim_indices={}, copy=True):
         """Get data corresponding to the given variable name, as a numpy (or
         numpy.ma) array.
 
@@ -93,9 +138,74 @@ class NetcdfFile(object):
         all slices for that dimension. e.g., if we have a variable
         foo(lat,lon,time), and dim_indices = {'lat':3, 'time':None}, then
         get_data will return an array that contains foo[3,:,:].
+
+        A dim_indices value can also be a slice object, keeping that dimension:
+        e.g., dim_indices = {'time':slice(2,5)} returns foo[:,:,2:5].
+
+        If copy is False, the result may be a read-only view of the file's data
+        (e.g., directly into a memory-mapped file), which saves copying the
+        data when they are only needed briefly, such as for computing
+        statistics. Such views must be released (or copied) before the file is
+        closed. See NetcdfVariable.get_data.
         """
         var = self._get_variable(varname)
-        return var.get_data(dim_indices)
+        return var.get_data(dim_indices, copy)
+
+    def get_vardata_chunks(self, varname, dim_indices={}, max_chunk_size=None,
+                           copy=True):
+        """Generator that yields the data corresponding to the given variable
+        name in consecutive pieces of at most max_chunk_size elements.
+
+        Concatenating the flattened (C-order) pieces gives the flattened version
+        of get_vardata(varname, dim_indices, copy). See
+        NetcdfVariable.get_data_chunks for details.
+        """
+        var = self._get_variable(varname)
+        return var.get_data_chunks(dim_indices, max_chunk_size, copy)
+
+    def iter_records(self, dimname, varnames, start=0, stop=None):
+        """Generator that yields a tuple (index, data) for each index along the
+        given dimension, from start up to (but not including) stop (or the end
+        of the dimension), where data is a dictionary giving, for each of the
+        given variables, get_vardata(varname, {dimname: index}, copy=False).
+
+        All of the given variables must have the dimension. This is intended
+        for walking through all records of a file in order: subclasses for
+        file formats that store record variables interleaved, record by
+        record, override this to read each record in a single sequential pass.
+        """
+
+        if stop is None:
+            stop = self.get_dimsize(dimname)
+        for index in range(start, stop):
+            yield (index, dict(
+                (varname, self.get_vardata(varname, {dimname: index}, copy=False))
+                for varname in varnames))
+
+    def get_varshape(self, varname, dim_indices={}):
+        """Returns the shape of the array that would be returned by
+        get_vardata(varname, dim_indices), without reading any data."""
+
+        var = self._get_variable(varname)
+        return var.get_data_shape(dim_indices)
+
+    def get_vardtype(self, varname):
+        """Returns the numpy dtype of the given variable's data."""
+
+        var = self._get_variable(varname)
+        return var.get_dtype()
+
+    def get_vardims(self, varname):
+        """Returns a list of the given variable's dimension names."""
+
+        var = self._get_variable(varname)
+        return list(var.get_dimensions())
+
+    def get_varattributes(self, varname):
+        """Returns a dictionary of the given variable's attributes."""
+
+        var = self._get_variable(varname)
+        return var.get_attributes()
 
     def is_var_numeric(self, varname):
         """Returns True if the given variable is numeric, False otherwise (e.g.,
@@ -104,6 +214,77 @@ class NetcdfFile(object):
         var = self._get_variable(varname)
         return var.is_numeric()
 
+    def var_bytes_equal(self, other, varname, dim_indices={}):
+        """Returns True if the data of the given variable (possibly sliced, as
+        for get_vardata) are known to be byte-for-byte identical in this file
+        and in other (another NetcdfFile), with the same data type, shape and
+        fill value - so that get_vardata would return identical results for the
+        two files.
+
+        A return value of False means either that the data differ or that a
+        quick comparison was not possible. This base version always returns
+        False; subclasses with access to the raw file contents can do better.
+        """
+
+        return False
+
+    def data_section_equal(self, other):
+        """Returns True if the data sections of this file and other (another
+        NetcdfFile) are known to be byte-for-byte identical, with the same
+        variables, dimensions, data types and fill values, laid out in the same
+        way - so that get_vardata would return identical results for every
+        variable in the two files. Headers may differ in other ways (e.g., in
+        attributes other than fill values).
+
+        A return value of False means either that the data differ or that a
+        quick comparison was not possible. This base version always returns
+        False; subclasses with access to the raw file contents can do better.
+        """
+
+        return False
+
+    def is_data_available(self):
+        """Returns True if variable data can be read from this file (via
+        get_vardata, etc.).
+
+        This base version always returns True; subclasses that only hold
+        summaries of the data (such as digests) can override this."""
+
+        return True
+
+    def get_stored_varstats(self, varname, dim_indices={}):
+        """Returns previously-computed statistics on the data of the given
+        variable (possibly sliced, as for get_vardata) that are stored with the
+        file, as a dictionary (see VarStatsAccumulator.to_dict), or None if no
+        statistics are stored.
+
+        This base version always returns None; subclasses that store
+        statistics can override this."""
+
+        return None
+
+    def get_opener(self):
+        """Returns a tuple (function, args) such that function(*args) returns a
+        NetcdfFile object equivalent to this one. This is picklable, so it can
+        be used to open the file once in each worker process of a pool, rather
+        than passing the file object itself to each task.
+
+        This base version returns a function that simply returns this object
+        (which then gets pickled); subclasses that hold open file handles should
+        override this to reopen the file.
+        """
+
+        return (_same_file, (self,))
+
+    def close(self):
+        """Closes the file. Data obtained from the file with copy=False must
+        not be used after this.
+
+        This base version does nothing; subclasses that hold open file handles
+        override this."""
+
+        pass
+
     # ------------------------------------------------------------------------
     # Public methods that should be provided by subclasses
     # ------------------------------------------------------------------------
@@ -144,16 +325,22 @@ class NetcdfFile(object):
         If no variables contain this dimension, returns 0.
         """
 
-        for varname in self.get_varlist():
-            var = self._get_variable(varname)
-            dimnum = var.get_dimnum(dimname)
-            if dimnum is not None:
-                dimsize = var.get_shape()[dimnum]
-                break
-        else:
-            dimsize = 0
+        return self._get_dim_index().dimsize(dimname)
 
-        return dimsize
+    def _get_dim_index(self):
+        """Returns the _DimensionIndex of this file's variables, building it the
+        first time this is called.
+
+        The index describes the file's metadata, which is assumed not to change
+        once the file is open; subclasses that allow adding variables must reset
+        self._dim_index to None when they do so.
+        """
+
+        if self._dim_index is None:
+            self._dim_index = _DimensionIndex(
+                (varname, self._get_variable(varname))
+                for varname in self.get_varlist())
+        return self._dim_index
 
     # ------------------------------------------------------------------------
     # Private methods that should be provided by subclasses
@@ -163,3 +350,65 @@ class NetcdfFile(object):
         """Returns a NetcdfVariable-like object for the given variable"""
         raise NotImplementedError
 
+# ------------------------------------------------------------------------
+# Private functions
+# ------------------------------------------------------------------------
+
+def _same_file(ncfile):
+    """Returns ncfile; see NetcdfFile.get_opener"""
+
+    return ncfile
+
+# ------------------------------------------------------------------------
+# Private classes
+# ------------------------------------------------------------------------
+
+class _DimensionIndex(object):
+    """Index of a file's variables by dimension, built from the variables'
+    metadata in a single pass.
+
+    This lets NetcdfFile.get_varlist_bydim and
+    NetcdfFile._get_dimsize_from_variables avoid examining (and creating
+    wrappers for) every variable each time they are called.
+    """
+
+    def __init__(self, variables):
+        """Create a _DimensionIndex object.
+
+        Arguments:
+        variables: iterable of (varname, NetcdfVariable-like object) tuples
+        """
+
+        self._varnames = []
+        # For each dimension: set of the names of the variables that have it
+        self._varname_sets = {}
+        # For each dimension: its size in the first variable that has it
+        self._dimsizes = {}
+        for (varname, var) in variables:
+            self._varnames.append(varname)
+            shape = var.get_shape()
+            for (dimnum, dimname) in enumerate(var.get_dimensions()):
+                self._varname_sets.setdefault(dimname, set()).add(varname)
+                self._dimsizes.setdefault(dimname, shape[dimnum])
+        self._varnames.sort()
+        self._varnames_with_dim = dict((dimname, sorted(varnames))
+                                       for (dimname, varnames) in self._varname_sets.items())
+
+    def varnames_with_dim(self, dimname):
+        """Returns a sorted list of the names of variables that have the given
+        dimension"""
+
+        return self._varnames_with_dim.get(dimname, [])
+
+    def varnames_without_dim(self, dimname):
+        """Returns a sorted list of the names of variables that do not have the
+        given dimension"""
+
+        varnames_with_dim = self._varname_sets.get(dimname, set())
+        return [varname for varname in self._varnames if varname not in varnames_with_dim]
+
+    def dimsize(self, dimname):
+        """Returns the size of the given dimension in the first variable that
+        has it, or 0 if no variables have it"""
+
+        return self._dimsizes.get(dimname, 0)
@@ -34,6 +34,7 @@ class NetcdfFileFake(NetcdfFile):
         variable: instance of NetcdfVariableFake
         """
         self._variables[varname] = variable
+        self._dim_index = None
 
     # ------------------------------------------------------------------------
     # Replacements for real functionality
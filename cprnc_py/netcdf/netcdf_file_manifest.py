@@ -0,0 +1,189 @@
+# A NetcdfFile that is backed by a manifest: a summary of a netcdf file holding
+# digests and statistics of its data, rather than the data themselves
+
+import json
+import os
+import threading
+from cprnc_py.netcdf.netcdf_file import NetcdfFile
+from cprnc_py.netcdf.netcdf_variable_manifest import NetcdfVariableManifest
+from cprnc_py.netcdf.netcdf_utils import DataDigest
+from cprnc_py.netcdf.netcdf_wrapper import netcdf
+
+# Identification of the manifest file format
+MANIFEST_FORMAT = "cprnc-manifest"
+MANIFEST_VERSION = 1
+
+# Maximum number of elements read at once when computing a digest
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+def slice_key(index):
+    """Returns the key used in a manifest's dictionary of slices for the given
+    index along the manifest's separate_dim (None for the whole variable)"""
+
+    if index is None:
+        return ""
+    else:
+        return str(index)
+
+class NetcdfFileManifest(NetcdfFile):
+    """NetcdfFile-like view of a manifest, which describes a netcdf file (the
+    baseline) by its metadata plus a digest and statistics for each variable
+    (or each slice of a variable along some dimension). Manifests are written
+    by cprnc_py.manifest.write_manifest.
+
+    This can be used in place of the baseline file itself: var_bytes_equal
+    compares another file's data against the stored digests, and
+    get_stored_varstats returns the stored statistics, so the baseline only
+    needs to be read for variables whose digests do not match. Variable data
+    (get_vardata, etc.) are read from the baseline file if it still exists;
+    is_data_available tells whether it does.
+    """
+
+    def __init__(self, filename, mode='r', staging_cache=None):
+        """Open the given manifest.
+
+        staging_cache is passed on when opening the baseline file (see
+        NetcdfFileScipy).
+        """
+
+        super(NetcdfFileManifest, self).__init__()
+        if mode != 'r':
+            raise ValueError("Manifests can only be opened for reading")
+        with open(filename) as manifest_file:
+            self._manifest = json.load(manifest_file)
+        if self._manifest.get('format') != MANIFEST_FORMAT:
+            raise ValueError(filename + " is not a cprnc manifest")
+        if self._manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError("Unsupported version of cprnc manifest: " + filename)
+        self._filename = filename
+        self._baseline = None
+        self._staging_cache = staging_cache
+        # Guards the lazy opening of the baseline, since this object may be
+        # shared by several threads
+        self._baseline_lock = threading.Lock()
+
+    def get_opener(self):
+        """Returns a tuple (function, args) such that function(*args) opens
+        this manifest again"""
+
+        return (NetcdfFileManifest, (self._filename,))
+
+    def get_varlist(self):
+        """Returns a list of variables in the netcdf file"""
+        return self._manifest['variables'].keys()
+
+    def get_filename(self):
+        """Returns the file name corresponding to this netcdf file"""
+        return self._filename
+
+    def get_baseline_filename(self):
+        """Returns the name of the netcdf file described by this manifest"""
+        return self._manifest['baseline']
+
+    def get_global_attributes(self):
+        """Returns a dictionary of global attributes.
+
+        Attributes are not stored in the manifest, so these come from the
+        baseline file; if that is not available, returns an empty dictionary.
+        """
+
+        if self.is_data_available():
+            return self._get_baseline().get_global_attributes()
+        else:
+            return {}
+
+    def get_dimlist(self):
+        """Returns a list of dimensions in the netcdf file"""
+        return self._manifest['dimensions'].keys()
+
+    def get_dimsize(self, dimname):
+        """Returns the size of the given dimension.
+
+        If this dimension doesn't exist, returns 0.
+        """
+
+        return self._manifest['dimensions'].get(dimname, 0)
+
+    def has_variable(self, varname):
+        """Returns True if the Netcdf file has the requested variable, otherwise False"""
+        return varname in self._manifest['variables']
+
+    def is_data_available(self):
+        """Returns True if the baseline file, from which variable data are read,
+        still exists"""
+
+        return os.path.isfile(self.get_baseline_filename())
+
+    def var_bytes_equal(self, other, varname, dim_indices={}):
+        """Returns True if other (another NetcdfFile) has the same data for the
+        given variable (possibly sliced, as for get_vardata) as the baseline
+        file, as determined by comparing a digest of other's data with the
+        digest stored in the manifest.
+
+        Returns False if the manifest holds no digest for this variable and
+        slicing.
+        """
+
+        stored = self._get_slice_entry(varname, dim_indices)
+        if stored is None:
+            return False
+        digest = DataDigest(other.get_vardtype(varname),
+                            other.get_varshape(varname, dim_indices))
+        for chunk in other.get_vardata_chunks(varname, dim_indices, DIGEST_CHUNK_SIZE,
+                                              copy=False):
+            digest.update(chunk)
+        return digest.hexdigest() == stored['digest']
+
+    def get_stored_varstats(self, varname, dim_indices={}):
+        """Returns the statistics stored in the manifest for the given variable
+        (possibly sliced, as for get_vardata), as a dictionary (see
+        VarStatsAccumulator.to_dict), or None if there are none for this
+        variable and slicing."""
+
+        stored = self._get_slice_entry(varname, dim_indices)
+        if stored is None:
+            return None
+        return stored['stats']
+
+    def close(self):
+        """Closes the baseline file, if it has been opened"""
+
+        with self._baseline_lock:
+            if self._baseline is not None:
+                self._baseline.close()
+                self._baseline = None
+
+    def _get_slice_entry(self, varname, dim_indices):
+        """Returns the manifest's entry (a dictionary with keys 'digest' and
+        'stats') for the given variable and slicing, or None if there is none.
+
+        Entries are stored for the whole variable (if it does not have the
+        manifest's separate_dim) or for each index along separate_dim.
+        """
+
+        var = self._get_variable(varname)
+        indices = dict((dimname, index) for (dimname, index) in dim_indices.items()
+                       if index is not None and var.get_dimnum(dimname) is not None)
+        separate_dim = self._manifest['separate_dim']
+        if not indices:
+            key = slice_key(None)
+        elif list(indices.keys()) == [separate_dim]:
+            key = slice_key(indices[separate_dim])
+        else:
+            return None
+        return var.get_slices().get(key)
+
+    def _get_baseline(self):
+        """Returns the (lazily-opened) baseline netcdf file"""
+
+        with self._baseline_lock:
+            if self._baseline is None:
+                self._baseline = netcdf(self.get_baseline_filename(),
+                                        staging_cache=self._staging_cache)
+        return self._baseline
+
+    def _get_variable(self, varname):
+        """Returns a NetcdfVariable-like object for the given variable"""
+
+        return NetcdfVariableManifest(self._manifest['variables'][varname],
+                                      varname, self._get_baseline)
@@ -5,10 +5,30 @@ from cprnc_py.netcdf.netcdf_file import NetcdfFile
 from cprnc_py.netcdf.netcdf_variable_netcdf4 import NetcdfVariableNetcdf4
 
 class NetcdfFileNetcdf4(NetcdfFile):
-    def __init__(self, filename, mode='r'):
+    def __init__(self, filename, mode='r', staging_cache=None):
+        """Open the given netcdf file.
+
+        staging_cache is accepted for compatibility with NetcdfFileScipy, but
+        ignored: files are always read in place.
+        """
+
         super(NetcdfFileNetcdf4, self).__init__()
         self._file = Dataset(filename, mode)
         self._filename = filename
+        # NetcdfVariableNetcdf4 objects, created as needed (see _get_variable)
+        self._variables = {}
+
+    def get_opener(self):
+        """Returns a tuple (function, args) such that function(*args) opens
+        this file again"""
+
+        return (NetcdfFileNetcdf4, (self._filename,))
+
+    def close(self):
+        """Closes the file"""
+
+        self._variables = {}
+        self._file.close()
 
     def get_varlist(self):
         """Returns a list of variables in the netcdf file"""
@@ -36,7 +56,14 @@ class NetcdfFileNetcdf4(NetcdfFile):
         return dimsize
 
     def _get_variable(self, varname):
-        """Returns a NetcdfVariable-like object for the given variable"""
+        """Returns a NetcdfVariable-like object for the given variable.
+
+        This object is created the first time it is needed, then reused."""
 
-        return NetcdfVariableNetcdf4(self._file.variables[varname])
+        try:
+            return self._variables[varname]
+        except KeyError:
+            var = NetcdfVariableNetcdf4(self._file.variables[varname])
+            self._variables[varname] = var
+            return var
 
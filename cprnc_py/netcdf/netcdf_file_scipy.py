@@ -3,28 +3,74 @@
 from cprnc_py.netcdf.scipy.io.netcdf import netcdf_file as scipy_netcdf_file
 from cprnc_py.netcdf.netcdf_file import NetcdfFile
 from cprnc_py.netcdf.netcdf_variable_scipy import NetcdfVariableScipy
-from cprnc_py.netcdf.fs_utils import tmpfs_copy
+from cprnc_py.netcdf.netcdf_utils import (fillvalues_equal, arrays_bitwise_equal,
+                                          mask_fillvalue)
 
-import warnings
-import os
+import numpy as np
 
 class NetcdfFileScipy(NetcdfFile):
-    def __init__(self, filename, mode='r'):
+    def __init__(self, filename, mode='r', staged_copy=None, staging_cache=None):
+        """Open the given netcdf file.
+
+        If staging_cache is given (and staged_copy is not), a file opened for
+        reading is first staged (copied to a fast tmpfs file system) by
+        staging_cache, if it decides that this is worthwhile.
+
+        Arguments:
+        filename: name of the netcdf file
+        mode: mode in which to open the file
+        staged_copy: if given, the name of an existing copy of filename (e.g.,
+            the copy opened by another NetcdfFileScipy object) which is opened
+            instead, if it still exists
+        staging_cache: StagingCache object; if None, the file is not staged
+        """
+
         super(NetcdfFileScipy, self).__init__()
-        self._copy = tmpfs_copy(filename)
-        if self._copy:
-            self._file = scipy_netcdf_file(self._copy, mode)
-        else:
+        if staged_copy is None and mode == 'r' and staging_cache is not None:
+            staged_copy = staging_cache.stage(filename)
+
+        self._staged_copy = None
+        self._file = None
+        if staged_copy:
+            try:
+                self._file = scipy_netcdf_file(staged_copy, mode)
+                self._staged_copy = staged_copy
+            except (IOError, OSError):
+                # The copy has been evicted from the staging cache in the
+                # meantime; fall back to the original file
+                pass
+        if self._file is None:
             self._file = scipy_netcdf_file(filename, mode)
         self._filename = filename
+        # NetcdfVariableScipy objects, created as needed (see _get_variable)
+        self._variables = {}
 
     def __del__(self):
-        if self._copy:
-            try:
-                os.remove(self._copy)
-            except:
-                warnings.warn("Could not remove copy " + self._copy,
-                              category=RuntimeWarning)
+        # Drop our references to the variables (and thus to the memory-mapped
+        # data) before the underlying file is closed
+        self._variables = {}
+
+    def get_opener(self):
+        """Returns a tuple (function, args) such that function(*args) opens
+        this file again (reusing this object's staged copy, if any)"""
+
+        return (NetcdfFileScipy, (self._filename, 'r', self._staged_copy))
+
+    def close(self):
+        """Closes the file.
+
+        Views obtained with copy=False refer directly to the memory-mapped
+        file, so they should be released first; otherwise the memory map stays
+        open (with a warning) until they are garbage-collected."""
+
+        self._variables = {}
+        self._file.close()
+
+    def get_staged_copy(self):
+        """Returns the name of the staged copy of the file that was opened, or
+        None if the file was opened in place"""
+
+        return self._staged_copy
 
     def get_varlist(self):
         """Returns a list of variables in the netcdf file"""
@@ -65,10 +111,159 @@ class NetcdfFileScipy(NetcdfFile):
                 dimsize = self._get_dimsize_from_variables(dimname)
         return dimsize
 
+    def iter_records(self, dimname, varnames, start=0, stop=None):
+        """Generator that yields a tuple (index, data) for each index along the
+        given dimension; see NetcdfFile.iter_records.
+
+        In a netcdf file, the data of all record variables (those on the
+        unlimited dimension) are stored interleaved, record by record. When
+        dimname is the unlimited dimension and the file is memory-mapped, this
+        walks through the record section in order, taking each record as a
+        single contiguous block and slicing the variables out of it, so that
+        the file is read sequentially. The data are read-only views into the
+        memory-mapped file.
+        """
+
+        if stop is None:
+            stop = self.get_dimsize(dimname)
+        layout = self._get_record_layout(dimname)
+        if layout is None:
+            for record in super(NetcdfFileScipy, self).iter_records(
+                    dimname, varnames, start, stop):
+                yield record
+            return
+
+        (records_begin, record_size, offsets) = layout
+        variables = sorted(((offsets[varname], varname, self._get_variable(varname))
+                            for varname in varnames),
+                           key=lambda item: item[0])
+        for index in range(start, stop):
+            record_begin = records_begin + index * record_size
+            record = self._file._mm_buf[record_begin:record_begin + record_size]
+            data = {}
+            for (offset, varname, var) in variables:
+                # Indexing with () gives a scalar for a variable with no other
+                # dimension, like get_vardata does
+                vardata = np.ndarray(shape=var.get_shape()[1:], dtype=var.get_dtype(),
+                                     buffer=record, offset=offset)[()]
+                if isinstance(vardata, np.ndarray):
+                    vardata.flags.writeable = False
+                data[varname] = mask_fillvalue(vardata, var.get_fillvalue(), copy=False)
+            yield (index, data)
+
+    def var_bytes_equal(self, other, varname, dim_indices={}):
+        """Returns True if the data of the given variable (possibly sliced, as
+        for get_vardata) are known to be byte-for-byte identical in this file
+        and in other (another NetcdfFile), with the same data type, shape and
+        fill value.
+
+        When both files are NetcdfFileScipy objects, this compares the raw
+        (memory-mapped) data in the two files, without decoding them. Otherwise
+        it returns False.
+        """
+
+        if not isinstance(other, NetcdfFileScipy):
+            return False
+
+        var1 = self._get_variable(varname)
+        var2 = other._get_variable(varname)
+        if not fillvalues_equal(var1.get_fillvalue(), var2.get_fillvalue()):
+            return False
+        return arrays_bitwise_equal(var1.get_raw_data(dim_indices),
+                                    var2.get_raw_data(dim_indices))
+
+    def data_section_equal(self, other):
+        """Returns True if the data sections of this file and other (another
+        NetcdfFile) are known to be byte-for-byte identical, with the same
+        variables, dimensions, data types and fill values, laid out in the same
+        way.
+
+        When both files are memory-mapped NetcdfFileScipy objects, this compares
+        the headers' descriptions of the variables, then compares everything
+        from the start of the first variable's data to the end of the two files
+        in large sequential blocks. Otherwise it returns False.
+        """
+
+        if not isinstance(other, NetcdfFileScipy):
+            return False
+        if self._file._mm_buf is None or other._file._mm_buf is None:
+            return False
+        if self._get_data_layout() != other._get_data_layout():
+            return False
+        for varname in self.get_varlist():
+            if not fillvalues_equal(self._get_variable(varname).get_fillvalue(),
+                                    other._get_variable(varname).get_fillvalue()):
+                return False
+        return arrays_bitwise_equal(self._get_data_section(),
+                                    other._get_data_section())
+
+    def _get_record_layout(self, dimname):
+        """Returns a tuple (records_begin, record_size, offsets) describing the
+        record section of the file: the byte offset of the first record, the
+        size of each record, and a dictionary giving the offset of each record
+        variable's data within a record.
+
+        Returns None if dimname is not the unlimited dimension, if there are no
+        records, or if the file is not memory-mapped.
+        """
+
+        if (self._file._mm_buf is None or
+            self._file.dimensions.get(dimname, 0) is not None or
+            self.get_dimsize(dimname) == 0):
+            return None
+        record_vars = [(varname, self._get_variable(varname))
+                       for varname in self.get_varlist()
+                       if self._get_variable(varname).get_dimnum(dimname) == 0]
+        records_begin = min(var.get_byte_layout()[0] for (varname, var) in record_vars)
+        # The record size is the stride of the record variables' data, which
+        # (unlike the header's record size) accounts for the lack of padding
+        # when there is a single record variable
+        record_size = self._file.variables[record_vars[0][0]].data.strides[0]
+        offsets = dict((varname, var.get_byte_layout()[0] - records_begin)
+                       for (varname, var) in record_vars)
+        return (records_begin, record_size, offsets)
+
+    def _get_data_start(self):
+        """Returns the byte offset of the start of the data section: the
+        position of the first variable's data in the file"""
+
+        begins = [self._get_variable(varname).get_byte_layout()[0]
+                  for varname in self.get_varlist()]
+        if begins:
+            return min(begins)
+        else:
+            return len(self._file._mm_buf)
+
+    def _get_data_layout(self):
+        """Returns a description of how variables are laid out in the data
+        section, which is the same for two files if and only if their data
+        sections can be compared byte for byte"""
+
+        data_start = self._get_data_start()
+        layout = []
+        for varname in sorted(self.get_varlist()):
+            var = self._get_variable(varname)
+            layout.append((varname, var.get_dimensions(), var.get_shape(),
+                           var.get_dtype().str,
+                           var.get_byte_layout()[0] - data_start))
+        return (sorted(self._file.dimensions.items()), self._file._recsize, layout)
+
+    def _get_data_section(self):
+        """Returns a view of the data section of the memory-mapped file"""
+
+        return self._file._mm_buf[self._get_data_start():]
+
     def _get_variable(self, varname):
-        """Returns a NetcdfVariable-like object for the given variable"""
+        """Returns a NetcdfVariable-like object for the given variable.
+
+        This object is created the first time it is needed, then reused."""
 
-        return NetcdfVariableScipy(self._file.variables[varname])
+        try:
+            return self._variables[varname]
+        except KeyError:
+            var = NetcdfVariableScipy(self._file.variables[varname])
+            self._variables[varname] = var
+            return var
 
     def has_variable(self, varname):
         """Returns True if the Netcdf file has the requested variable, otherwise False"""
@@ -1,44 +1,177 @@
 """This module provides some useful utilities for working with netcdf files."""
 
+import hashlib
 import numpy as np
 
+# Number of bytes compared at a time by arrays_bitwise_equal
+BITWISE_COMPARE_BYTES = 4 * 1024 * 1024
+
+def get_fillvalue(attributes):
+    """Return the value that marks missing data, given a dictionary of variable
+    attributes: _FillValue if present, otherwise missing_value, otherwise None.
+    """
+
+    if '_FillValue' in attributes:
+        return attributes['_FillValue']
+    elif 'missing_value' in attributes:
+        return attributes['missing_value']
+    else:
+        return None
+
+def fillvalues_equal(fillvalue1, fillvalue2):
+    """Return True if the two fill values (as returned by get_fillvalue) would
+    lead apply_fillvalue to mask exactly the same points of any data array.
+
+    A fill value of None (no fill value) only equals None; two NaN fill values
+    are considered equal.
+    """
+
+    if fillvalue1 is None or fillvalue2 is None:
+        return fillvalue1 is None and fillvalue2 is None
+    try:
+        return bool(np.all(np.asarray(fillvalue1) == np.asarray(fillvalue2)) or
+                    (np.all(np.isnan(fillvalue1)) and np.all(np.isnan(fillvalue2))))
+    except TypeError:
+        # some data types (e.g., characters) cannot be tested for NaN
+        return False
+
+def arrays_bitwise_equal(arr1, arr2):
+    """Return True if the two arrays have the same dtype and shape and contain
+    exactly the same bits.
+
+    No conversions are done: in particular, byte swapping is avoided for
+    non-native byte orders, and NaNs with identical bits compare equal. The
+    arrays can be arbitrary (e.g., non-contiguous) views, such as slices of
+    memory-mapped files; they are compared a block at a time, so that
+    temporaries stay small.
+
+    Arguments:
+    arr1, arr2: numpy arrays (not masked arrays)
+    """
+
+    if arr1.dtype != arr2.dtype or arr1.shape != arr2.shape:
+        return False
+    if arr1.dtype.itemsize not in (1, 2, 4, 8):
+        return np.array_equal(arr1, arr2)
+
+    # Reinterpret the bits as native unsigned integers of the same size: this
+    # preserves bitwise equality without converting anything
+    uint_type = np.dtype('u{}'.format(arr1.dtype.itemsize))
+    bits1 = np.atleast_1d(arr1).view(uint_type)
+    bits2 = np.atleast_1d(arr2).view(uint_type)
+    row_bytes = max(1, bits1[0:1].nbytes)
+    rows_per_block = max(1, BITWISE_COMPARE_BYTES // row_bytes)
+    for start in range(0, bits1.shape[0], rows_per_block):
+        stop = start + rows_per_block
+        if not np.array_equal(bits1[start:stop], bits2[start:stop]):
+            return False
+    return True
+
+class DataDigest(object):
+    """Computes a digest (hash) of a variable's data, as returned by
+    NetcdfFile.get_vardata: the values and the mask.
+
+    The data can be provided in consecutive pieces (e.g., from
+    NetcdfFile.get_vardata_chunks); the digest does not depend on how the data
+    are split. Nor does it depend on the byte order in which the data are
+    stored, so data with equal digests are (for all practical purposes)
+    identical.
+
+    Typical usage is:
+
+    digest = DataDigest(dtype, shape)
+    for chunk in chunks:
+        digest.update(chunk)
+    digest.hexdigest()
+    """
+
+    def __init__(self, dtype, shape):
+        """Create a DataDigest object.
+
+        Arguments:
+        dtype: numpy dtype of the data
+        shape: shape of the full data
+        """
+
+        self._dtype = np.dtype(dtype).newbyteorder('<')
+        self._shape = tuple(int(n) for n in shape)
+        self._num_elements = 0
+        self._data_hash = hashlib.sha1()
+        self._mask_hash = hashlib.sha1()
+
+    def update(self, chunk):
+        """Add the next piece of the data to the digest.
+
+        Arguments:
+        chunk: numpy or numpy.ma array containing the next elements of the
+            flattened (C-order) data
+        """
+
+        data = np.ravel(np.ma.getdata(chunk))
+        self._data_hash.update(np.ascontiguousarray(data, dtype=self._dtype))
+        mask = np.ma.getmask(chunk)
+        if mask is not np.ma.nomask:
+            masked_positions = np.flatnonzero(mask) + self._num_elements
+            self._mask_hash.update(masked_positions.astype('<i8'))
+        self._num_elements += data.size
+
+    def hexdigest(self):
+        """Return the digest of all data added so far, as a string of hex
+        digits"""
+
+        digest = hashlib.sha1()
+        digest.update("{} {}".format(self._dtype.str, self._shape).encode('ascii'))
+        digest.update(self._data_hash.digest())
+        digest.update(self._mask_hash.digest())
+        return digest.hexdigest()
+
 def apply_fillvalue(data, attributes):
     """Apply the _FillValue or missing_value attribute to the given data array,
-    producing a masked array (numpy.ma).
+    producing a masked array (numpy.ma) if any points equal the fill value.
 
     If both _FillValue and missing_value are given, then _FillValue takes
     precedence.
 
-    If neither _FillValue nor missing_value are given, then the result has no
-    mask.
+    If neither _FillValue nor missing_value are given, or if no points equal
+    the fill value, then the result is the given (unmasked) array.
 
     Arguments:
     data: numpy array
     attributes: dictionary of attributes
     """
 
-    if '_FillValue' in attributes:
-        missing_value = attributes['_FillValue']
-    elif 'missing_value' in attributes:
-        missing_value = attributes['missing_value']
-    else:
-        missing_value = None
+    return mask_fillvalue(data, get_fillvalue(attributes))
 
-    if missing_value is None:
-        newdata = data
-    else:
-        try:
-            missing_value_isnan = np.isnan(missing_value)
-        except TypeError:
-            # some data types (e.g., characters) cannot be tested for NaN
-            missing_value_isnan = False
+def mask_fillvalue(data, missing_value, copy=True):
+    """Mask the points of the given data array that equal missing_value (as
+    returned by get_fillvalue), producing a masked array (numpy.ma).
+
+    If missing_value is None, or if no points equal missing_value, then the
+    result is the given array itself, without a mask: code working with the
+    data accepts both plain and masked arrays, and plain arrays avoid the
+    overhead of numpy.ma in every later operation. (Most fields with a fill
+    value do not actually contain any missing points.)
+
+    Arguments:
+    data: numpy array
+    missing_value: fill value, or None
+    copy: if False, a masked result shares its data with the given array
+    """
 
-        if (missing_value_isnan):
-            mymask = np.isnan(data)
-        else:
-            mymask = (data == missing_value)
+    if missing_value is None:
+        return data
 
-        newdata = np.ma.masked_where(mymask, data)
+    try:
+        missing_value_isnan = np.isnan(missing_value)
+    except TypeError:
+        # some data types (e.g., characters) cannot be tested for NaN
+        missing_value_isnan = False
 
-    return newdata
+    if (missing_value_isnan):
+        mymask = np.isnan(data)
+    else:
+        mymask = (data == missing_value)
 
+    if not np.any(mymask):
+        return data
+    return np.ma.MaskedArray(data, mask=mymask, copy=copy)
@@ -1,3 +1,5 @@
+import itertools
+
 class NetcdfVariable(object):
     """Base class providing operations that can be performed on a netcdf
     variable.
@@ -16,6 +18,8 @@ class NetcdfVariable(object):
 
     - get_attributes(): Returns a dictionary of variable attributes on the file
 
+    - get_dtype(): Returns the numpy dtype of the variable's data
+
     - is_numeric(): Returns True if this variable is numeric
 
     (2) Provides some higher-level methods on top of these netCDF packages, such
@@ -25,10 +29,20 @@ class NetcdfVariable(object):
     - get_dimnum(dimname): Get the dimension number of the given dimension in
       this variable
 
-    - get_data(dim_indices): Returns the variable's data, possibly sliced along
-      one or more named dimensions
+    - get_data(dim_indices, copy): Returns the variable's data, possibly sliced
+      along one or more named dimensions
+
+    - get_data_shape(dim_indices): Returns the shape of the array that would be
+      returned by get_data(dim_indices)
+
+    - get_data_chunks(dim_indices, max_chunk_size, copy): Generator that yields
+      the variable's data (possibly sliced) in consecutive pieces of bounded
+      size
     """
 
+    # Subclasses that are created in large numbers can define slots of their own
+    __slots__ = ()
+
     # ------------------------------------------------------------------------
     # Public methods implemented here
     # ------------------------------------------------------------------------
@@ -50,7 +64,7 @@ class NetcdfVariable(object):
 
         return dimnum
 
-    def get_data(self, dim_indices={}):
+    def get_data(self, dim_indices={}, copy=True):
         """Get this variable's data as a numpy (or numpy.ma) array.
 
         If dim_indices is given, it should be a dictionary whose keys are names of
@@ -64,20 +78,58 @@ class NetcdfVariable(object):
         all slices for that dimension. e.g., if we have a variable
         foo(lat,lon,time), and dim_indices = {'lat':3, 'time':None}, then
         get_data will return an array that contains foo[3,:,:].
+
+        If copy is False, the result may be a read-only view of data held by
+        the file (e.g., directly into a memory-mapped file, in the file's byte
+        order), which avoids copying the data. Such views are only valid while
+        the file is open, and must be released (or copied) before the file is
+        closed. Subclasses that cannot provide views return a copy either way.
         """
 
-        dim_slices = []
-        for dim in self.get_dimensions():
-            if (dim in dim_indices):
-                dim_index = dim_indices[dim]
-                if dim_index is None:
-                    this_slice = slice(None)
-                else:
-                    this_slice = dim_index
-            else:
-                this_slice = slice(None)
-            dim_slices.append(this_slice)
-        return self._get_data_from_slices(dim_slices)
+        return self._get_data_from_slices(self._get_dim_slices(dim_indices), copy)
+
+    def get_data_shape(self, dim_indices={}):
+        """Returns the shape of the array that would be returned by
+        get_data(dim_indices), without reading any data.
+
+        dim_indices has the same meaning as for get_data.
+        """
+
+        shape = self.get_shape()
+        return tuple(len(range(*this_slice.indices(shape[i])))
+                     for (i, this_slice) in enumerate(self._get_dim_slices(dim_indices))
+                     if isinstance(this_slice, slice))
+
+    def get_data_chunks(self, dim_indices={}, max_chunk_size=None, copy=True):
+        """Generator that yields this variable's data in consecutive pieces.
+
+        Concatenating the flattened (C-order) pieces gives the flattened version
+        of get_data(dim_indices). Each piece is a numpy (or numpy.ma) array
+        containing at most max_chunk_size elements - except that a piece is
+        never smaller than a single element. If max_chunk_size is None, the
+        data are returned in a single piece.
+
+        This is useful for processing variables that are too large to hold in
+        memory at once.
+
+        dim_indices and copy have the same meaning as for get_data.
+        """
+
+        dim_slices = self._get_dim_slices(dim_indices)
+        if max_chunk_size is None:
+            yield self._get_data_from_slices(dim_slices, copy)
+            return
+
+        # Positions of the dimensions that remain after applying dim_indices
+        free_dims = [i for (i, this_slice) in enumerate(dim_slices)
+                     if isinstance(this_slice, slice)]
+        shape = self.get_shape()
+        for chunk_slices in _chunk_slices([shape[i] for i in free_dims],
+                                          max_chunk_size):
+            these_slices = list(dim_slices)
+            for (i, this_slice) in zip(free_dims, chunk_slices):
+                these_slices[i] = this_slice
+            yield self._get_data_from_slices(these_slices, copy)
 
     # ------------------------------------------------------------------------
     # Public methods that should be implemented by subclasses
@@ -95,18 +147,89 @@ class NetcdfVariable(object):
         """Returns a dictionary of variable attributes on the file"""
         raise NotImplementedError
 
+    def get_dtype(self):
+        """Returns the numpy dtype of this variable's data"""
+        raise NotImplementedError
+
     def is_numeric(self):
         """Returns True if this variable is numeric, False otherwise (e.g., for characters)"""
         raise NotImplementedError
 
+    # ------------------------------------------------------------------------
+    # Private methods implemented here
+    # ------------------------------------------------------------------------
+
+    def _get_dim_slices(self, dim_indices):
+        """Convert a dim_indices dictionary (see get_data) into a list giving a
+        slice object or integer index for each dimension of this variable."""
+
+        dim_slices = []
+        for dim in self.get_dimensions():
+            if (dim in dim_indices):
+                dim_index = dim_indices[dim]
+                if dim_index is None:
+                    this_slice = slice(None)
+                else:
+                    this_slice = dim_index
+            else:
+                this_slice = slice(None)
+            dim_slices.append(this_slice)
+        return dim_slices
+
     # ------------------------------------------------------------------------
     # Private methods that should be implemented by subclasses
     # ------------------------------------------------------------------------
 
-    def _get_data_from_slices(self, dim_slices):
+    def _get_data_from_slices(self, dim_slices, copy=True):
         """Get this variable's data as a numpy array.
 
         dim_slices: list of slice objects or integer indices; length of
         dim_slices should match the dimensionality of this variable
+        copy: if False, may return a read-only view (see get_data)
         """
         raise NotImplementedError
+
+# ------------------------------------------------------------------------
+# Private functions
+# ------------------------------------------------------------------------
+
+def _chunk_slices(shape, max_chunk_size):
+    """Generator that splits an array of the given shape into consecutive
+    (C-order) pieces of at most max_chunk_size elements (but at least one
+    element).
+
+    Yields lists with one entry (an integer index or slice object) for each
+    dimension in shape.
+
+    Pieces are formed by iterating over single indices in the outer dimensions,
+    taking a run of indices in one dimension, and taking the whole of the inner
+    dimensions; e.g., for shape (2, 3, 4) and max_chunk_size 8, this yields:
+    [0, slice(0, 2), slice(None)]
+    [0, slice(2, 3), slice(None)]
+    [1, slice(0, 2), slice(None)]
+    [1, slice(2, 3), slice(None)]
+    """
+
+    ndims = len(shape)
+
+    # Find the outermost dimension such that whole sub-arrays over it and all
+    # inner dimensions fit in a chunk
+    inner_size = 1
+    split_dim = ndims
+    while split_dim > 0 and inner_size * shape[split_dim-1] <= max_chunk_size:
+        split_dim -= 1
+        inner_size *= shape[split_dim]
+
+    if split_dim == 0:
+        # The whole array fits in a single chunk
+        yield [slice(None)] * ndims
+        return
+
+    # Take runs along the next dimension out
+    split_dim -= 1
+    run = max(1, max_chunk_size // inner_size)
+    inner_slices = [slice(None)] * (ndims - split_dim - 1)
+    for outer_indices in itertools.product(*[range(n) for n in shape[:split_dim]]):
+        for start in range(0, shape[split_dim], run):
+            stop = min(start + run, shape[split_dim])
+            yield list(outer_indices) + [slice(start, stop)] + inner_slices
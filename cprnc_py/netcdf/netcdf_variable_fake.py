@@ -6,9 +6,10 @@ class NetcdfVariableFake(NetcdfVariable):
     Attributes are:
     vardata: the data themselves (typically numpy or numpy.ma array)
     dimensions: list of dimension names
+    attributes: dictionary of variable attributes
     """
 
-    def __init__(self, data, dimnames=None, is_numeric=True):
+    def __init__(self, data, dimnames=None, is_numeric=True, attributes=None):
         """Initialize a netcdf_var_fake instance.
 
         Arguments:
@@ -18,6 +19,8 @@ class NetcdfVariableFake(NetcdfVariable):
         dimnames: list of strings, with one dimname for each dimension in data
             If None, constructs dimnames as dim1, dim2, etc.
         is_numeric: whether this variable is numeric
+        attributes: dictionary of variable attributes (if None, the variable has
+            no attributes)
         """
 
         super(NetcdfVariableFake, self).__init__()
@@ -31,6 +34,9 @@ class NetcdfVariableFake(NetcdfVariable):
                 raise ValueError("Wrong number of dimnames")
             self.dimensions = dimnames
         self.numeric = is_numeric
+        if attributes is None:
+            attributes = {}
+        self.attributes = attributes
 
     def get_dimensions(self):
         """Return a list of dimension names"""
@@ -42,16 +48,24 @@ class NetcdfVariableFake(NetcdfVariable):
 
     def get_attributes(self):
         """Return a dictionary of variable attributes on the file"""
-        return {}
+        return self.attributes
+
+    def get_dtype(self):
+        """Return the numpy dtype of this variable's data"""
+        return self.vardata.dtype
 
     def is_numeric(self):
         """Return True if this variable is numeric, False otherwise (e.g., for characters)"""
         return self.numeric
 
-    def _get_data_from_slices(self, dim_slices):
+    def _get_data_from_slices(self, dim_slices, copy=True):
         """Get this variable's data as a numpy array.
 
         dim_slices: list of slice objects or integer indices; length of
         dim_slices should match the dimensionality of this variable
+        copy: if False, return a view of the fake data
         """
-        return self.vardata[dim_slices]
+        vardata = self.vardata[tuple(dim_slices)]
+        if copy:
+            vardata = vardata.copy()
+        return vardata
@@ -0,0 +1,66 @@
+from cprnc_py.netcdf.netcdf_variable import NetcdfVariable
+import numpy as np
+
+class NetcdfVariableManifest(NetcdfVariable):
+    """Variable of a NetcdfFileManifest: metadata come from the manifest, while
+    data are read from the baseline file."""
+
+    def __init__(self, entry, varname, get_baseline):
+        """Create a NetcdfVariableManifest instance.
+
+        Arguments:
+        entry: dictionary describing this variable in the manifest
+        varname: name of this variable
+        get_baseline: function that returns the baseline NetcdfFile
+        """
+
+        super(NetcdfVariableManifest, self).__init__()
+        self._entry = entry
+        self._varname = varname
+        self._get_baseline = get_baseline
+
+    def get_dimensions(self):
+        """Returns a list of dimension names"""
+
+        return self._entry['dimensions']
+
+    def get_shape(self):
+        """Returns a tuple describing the variable's shape"""
+
+        return tuple(self._entry['shape'])
+
+    def get_attributes(self):
+        """Returns a dictionary of variable attributes on the baseline file"""
+
+        return self._get_baseline_variable().get_attributes()
+
+    def get_dtype(self):
+        """Returns the numpy dtype of this variable's data"""
+
+        return np.dtype(str(self._entry['dtype']))
+
+    def is_numeric(self):
+        """Returns True if this variable is numeric, False otherwise (e.g., for characters)"""
+
+        return self._entry['numeric']
+
+    def get_slices(self):
+        """Returns the dictionary of digests and statistics stored for this
+        variable (see NetcdfFileManifest)"""
+
+        return self._entry['slices']
+
+    def _get_data_from_slices(self, dim_slices, copy=True):
+        """Get this variable's data as a numpy array, from the baseline file.
+
+        dim_slices: list of slice objects or integer indices; length of
+        dim_slices should match the dimensionality of this variable
+        copy: if False, may return a read-only view (see NetcdfVariable.get_data)
+        """
+
+        return self._get_baseline_variable()._get_data_from_slices(dim_slices, copy)
+
+    def _get_baseline_variable(self):
+        """Returns the corresponding NetcdfVariable of the baseline file"""
+
+        return self._get_baseline()._get_variable(self._varname)
@@ -4,7 +4,14 @@ import numpy as np
 
 class NetcdfVariableNetcdf4(NetcdfVariable):
     """Adapter for the Netcdf4 Variable class, making it adapt to a common
-    interface."""
+    interface.
+
+    The variable's metadata are looked up once, when this object is created,
+    and kept in slots: NetcdfFileNetcdf4 keeps one of these objects per
+    variable, shared by all callers, so that repeated queries are cheap.
+    """
+
+    __slots__ = ('_var', '_dimensions', '_dimnums', '_shape', '_dtype')
 
     def __init__(self, var):
         """Create a NetcdfVariableNetcdf4 instance.
@@ -15,38 +22,57 @@ class NetcdfVariableNetcdf4(NetcdfVariable):
 
         super(NetcdfVariableNetcdf4, self).__init__()
         self._var = var
+        self._dimensions = var.dimensions
+        self._dimnums = dict((dimname, dimnum)
+                             for (dimnum, dimname) in enumerate(var.dimensions))
+        self._shape = var.shape
+        self._dtype = var.dtype
 
     def get_dimensions(self):
         """Returns a list of dimension names"""
 
-        return self._var.dimensions
+        return self._dimensions
+
+    def get_dimnum(self, dimname):
+        """Get the dimension number of the given dimension in this variable.
+
+        If this dimension is not present, returns None.
+        """
+
+        return self._dimnums.get(dimname)
 
     def get_shape(self):
         """Returns a tuple describing the variable's shape"""
 
-        return self._var.shape
+        return self._shape
 
     def get_attributes(self):
         """Returns a dictionary of variable attributes on the file"""
 
         raise NotImplementedError
 
+    def get_dtype(self):
+        """Returns the numpy dtype of this variable's data"""
+
+        return self._dtype
+
     def is_numeric(self):
         """Returns True if this variable is numeric, False otherwise (e.g., for characters)"""
 
-        mytype = self._var.dtype
+        mytype = self._dtype
         if mytype.kind == 'S' or mytype.kind == 'U':
             return False
         else:
             return True
 
-    def _get_data_from_slices(self, dim_slices):
+    def _get_data_from_slices(self, dim_slices, copy=True):
         """Get this variable's data as a numpy array.
 
         dim_slices: list of slice objects or integer indices; length of
         dim_slices should match the dimensionality of this variable
+        copy: ignored: netCDF4 always reads the data into new arrays
         """
 
         # FIXME(wjs, 2016-01-05) Will this work on scalar data?
-        vardata = self._var[dim_slices]
+        vardata = self._var[tuple(dim_slices)]
         return vardata
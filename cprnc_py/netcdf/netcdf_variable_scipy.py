@@ -1,10 +1,18 @@
 from cprnc_py.netcdf.netcdf_variable import NetcdfVariable
-from cprnc_py.netcdf.netcdf_utils import apply_fillvalue
+from cprnc_py.netcdf.netcdf_utils import get_fillvalue, mask_fillvalue
 import numpy as np
 
 class NetcdfVariableScipy(NetcdfVariable):
     """Adapter for the scipy netcdf_variable class, making it adapt to a common
-    interface."""
+    interface.
+
+    The variable's metadata are looked up once, when this object is created,
+    and kept in slots: NetcdfFileScipy keeps one of these objects per variable,
+    shared by all callers, so that repeated queries are cheap.
+    """
+
+    __slots__ = ('_var', '_dimensions', '_dimnums', '_shape', '_dtype',
+                 '_numeric', '_fillvalue', '_begin', '_vsize')
 
     def __init__(self, var):
         """Create a NetcdfVariableScipy instance.
@@ -15,40 +23,96 @@ class NetcdfVariableScipy(NetcdfVariable):
 
         super(NetcdfVariableScipy, self).__init__()
         self._var = var
+        self._dimensions = var.dimensions
+        self._dimnums = dict((dimname, dimnum)
+                             for (dimnum, dimname) in enumerate(var.dimensions))
+        self._shape = var.shape
+        self._dtype = var.data.dtype
+        self._numeric = (var.typecode() != 'c')
+        self._fillvalue = get_fillvalue(var._attributes)
+        # Position and size of the data in the file (recorded by our version of
+        # the scipy reader; None for variables that were not read from a file)
+        self._begin = getattr(var, '_begin', None)
+        self._vsize = getattr(var, '_vsize', None)
 
     def get_dimensions(self):
         """Returns a list of dimension names"""
 
-        return self._var.dimensions
+        return self._dimensions
+
+    def get_dimnum(self, dimname):
+        """Get the dimension number of the given dimension in this variable.
+
+        If this dimension is not present, returns None.
+        """
+
+        return self._dimnums.get(dimname)
 
     def get_shape(self):
         """Returns a tuple describing the variable's shape"""
 
-        return self._var.shape
+        return self._shape
 
     def get_attributes(self):
         """Returns a dictionary of variable attributes on the file"""
 
         return self._var._attributes
 
+    def get_dtype(self):
+        """Returns the numpy dtype of this variable's data"""
+
+        return self._dtype
+
+    def get_fillvalue(self):
+        """Returns the value that marks missing data (see
+        netcdf_utils.get_fillvalue), or None"""
+
+        return self._fillvalue
+
+    def get_byte_layout(self):
+        """Returns a tuple (begin, vsize) giving the byte offset of this
+        variable's data in the file and the size of the data (per record, for
+        record variables), as given in the file's header"""
+
+        return (self._begin, self._vsize)
+
+    def get_raw_data(self, dim_indices={}):
+        """Returns a view of this variable's data exactly as stored in the file,
+        without copying, byte swapping or applying the fill value.
+
+        For a memory-mapped file, this is a view into the memory map.
+        dim_indices has the same meaning as for get_data.
+        """
+
+        dim_slices = self._get_dim_slices(dim_indices)
+        if len(dim_slices) > 0:
+            return self._var.data[tuple(dim_slices)]
+        else:
+            # Scalar data
+            return self._var.data
+
     def is_numeric(self):
         """Returns True if this variable is numeric, False otherwise (e.g., for characters)"""
 
-        mytype = self._var.typecode()
-        if mytype == 'c':
-            return False
-        else:
-            return True
+        return self._numeric
 
-    def _get_data_from_slices(self, dim_slices):
+    def _get_data_from_slices(self, dim_slices, copy=True):
         """Get this variable's data as a numpy array.
 
         dim_slices: list of slice objects or integer indices; length of
         dim_slices should match the dimensionality of this variable
+        copy: if False, return a read-only view of the file's data, in the
+            file's byte order, rather than a copy
         """
 
         if len(dim_slices) > 0:
-            vardata = self._var[dim_slices].copy()
+            vardata = self._var.data[tuple(dim_slices)]
+            if copy:
+                vardata = vardata.copy()
+            elif isinstance(vardata, np.ndarray):
+                # Make sure that the file's data cannot be modified through
+                # this view (e.g., if the file is not memory-mapped)
+                vardata.flags.writeable = False
         else:
             # Scalar data
             vardata = np.array(self._var.getValue())
@@ -59,7 +123,6 @@ class NetcdfVariableScipy(NetcdfVariable):
         # the maskandscale option is not ideal - for example, it allows for
         # small differences from the given _FillValue, rather than requiring an
         # exact match.
-        vardata_filled = apply_fillvalue(vardata, self.get_attributes())
+        vardata_filled = mask_fillvalue(vardata, self._fillvalue, copy=False)
 
         return vardata_filled
-
@@ -680,6 +680,11 @@ class netcdf_file(object):
                     data, typecode, size, shape, dimensions, attributes,
                     maskandscale=self.maskandscale)
 
+            # cprnc addition: remember where the variable's data live in the
+            # file, as is done when writing
+            self.variables[name].__dict__['_begin'] = begin_
+            self.variables[name].__dict__['_vsize'] = vsize
+
         if rec_vars:
             # Remove padding when only one record variable.
             if len(rec_vars) == 1:
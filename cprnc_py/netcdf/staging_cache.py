@@ -0,0 +1,278 @@
+"""Cache of copies of netcdf files on a fast (tmpfs) file system.
+
+Reading a file through a memory map is much faster when the file lives in
+memory (e.g., in /dev/shm) than when it lives on a slow or networked file
+system. StagingCache copies ("stages") files into a directory on such a file
+system, within a byte budget. Since this memory is shared by the whole system,
+copies are removed when the process exits, unless the cache is asked to keep
+them (persist=True) for later runs: copies are keyed by the original file's
+path, size and modification time, so a baseline that is compared again and
+again is only copied once. When room is needed, the least recently used copies
+are removed.
+
+Removing a copy that another process has open (and memory-mapped) is safe on
+POSIX systems: that process keeps its view of the data, and the space is freed
+when it closes the file.
+
+Typical usage is:
+
+    cache = StagingCache(policy='auto')
+    path = cache.stage(filename)
+    if path is None:
+        path = filename
+"""
+
+from __future__ import print_function
+
+import atexit
+import errno
+import hashlib
+import os
+import shutil
+import time
+from cprnc_py.netcdf.fs_utils import find_tmpfs
+
+# Valid staging policies:
+# - 'never': never stage files
+# - 'always': stage every file that fits
+# - 'auto': stage files that fit, except those that would not benefit (see
+#   StagingCache.stage)
+POLICIES = ('auto', 'always', 'never')
+
+# By default, the cache may use this fraction of its file system's total size
+DEFAULT_BUDGET_FRACTION = 0.1
+
+# Staging never leaves less than this fraction of the file system free
+MIN_FREE_FRACTION = 0.1
+
+# With the 'auto' policy, files larger than this are not copied: a single
+# pass through such a file via a memory map costs about as much as copying it
+DEFAULT_AUTO_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Suffixes of the cache's files: complete copies, and copies in progress
+_COPY_SUFFIX = '.nc'
+_PARTIAL_SUFFIX = '.partial'
+
+# Copies in progress older than this (in seconds) are assumed to have been left
+# behind by a process that died, and are removed
+_STALE_PARTIAL_SECONDS = 3600
+
+class StagingCache(object):
+    """Size-limited cache of copies of netcdf files on a fast file system."""
+
+    def __init__(self, policy='auto', max_bytes=None, directory=None,
+                 auto_max_bytes=DEFAULT_AUTO_MAX_BYTES, persist=False):
+        """Create a StagingCache object.
+
+        Arguments:
+        policy: one of POLICIES
+        max_bytes: maximum total size of the copies in the cache
+            If None, use DEFAULT_BUDGET_FRACTION of the file system's size.
+        directory: directory holding the copies
+            If None, use a per-user directory on the first tmpfs file system
+            found; if there is none, nothing is staged.
+        auto_max_bytes: largest file that is copied with the 'auto' policy
+        persist: if True, keep the copies made by this object in the cache for
+            later runs; otherwise they are removed when the process exits (see
+            remove_copies). Copies that were in the cache already are kept
+            either way.
+        """
+
+        if policy not in POLICIES:
+            raise ValueError("Unknown staging policy: {}".format(policy))
+        self._policy = policy
+        if directory is None and policy != 'never':
+            directory = _default_directory()
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._auto_max_bytes = auto_max_bytes
+        self._persist = persist
+        # Copies made by this object that are to be removed (see remove_copies)
+        self._copies = []
+
+    def get_directory(self):
+        """Returns the directory holding the copies (None if there is none)"""
+
+        return self._directory
+
+    def stage(self, filename):
+        """Returns the path to a staged copy of the given file, copying the file
+        into the cache if it is not there already; returns None if the file
+        should be read in place.
+
+        A file is read in place when the policy is 'never', when there is no
+        cache directory, or when it does not fit in the budget or in the free
+        space. In addition, with the 'auto' policy, files that are already on a
+        tmpfs file system are read in place, and files larger than
+        auto_max_bytes are only used from the cache if they are there already.
+        """
+
+        if self._policy == 'never' or self._directory is None:
+            return None
+        try:
+            stat = os.stat(filename)
+            if self._policy == 'auto' and _on_tmpfs(filename):
+                return None
+            if not self._ensure_directory():
+                return None
+
+            path = os.path.join(self._directory, _cache_key(filename, stat) + _COPY_SUFFIX)
+            if _touch(path):
+                return path
+            if self._policy == 'auto' and stat.st_size > self._auto_max_bytes:
+                return None
+            if not self._make_room(stat.st_size):
+                return None
+            path = self._copy(filename, path)
+            if path is not None and not self._persist:
+                if not self._copies:
+                    atexit.register(self.remove_copies)
+                self._copies.append(path)
+            return path
+        except (IOError, OSError):
+            # Staging is just an optimization: on any problem, read the file
+            # in place
+            return None
+
+    def remove_copies(self):
+        """Removes the copies made by this object, unless it was created with
+        persist=True. This is called automatically when the process exits.
+
+        Files that still have a copy open (and memory-mapped) can go on
+        reading it: the space is freed when the copy is closed.
+        """
+
+        while self._copies:
+            try:
+                os.remove(self._copies.pop())
+            except OSError:
+                # Evicted (e.g., by another process) in the meantime
+                pass
+
+    # ------------------------------------------------------------------------
+    # Private methods
+    # ------------------------------------------------------------------------
+
+    def _ensure_directory(self):
+        """Creates the cache directory if needed; returns True if it exists"""
+
+        try:
+            os.makedirs(self._directory, 0o700)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                return False
+        return os.path.isdir(self._directory)
+
+    def _get_budget(self, fs_stat):
+        """Returns the maximum total size of the copies, given the statvfs result
+        for the cache's file system"""
+
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return int(DEFAULT_BUDGET_FRACTION * fs_stat.f_blocks * fs_stat.f_frsize)
+
+    def _list_entries(self):
+        """Returns a list of (last_used, size, path) for the complete copies in
+        the cache, removing stale copies in progress along the way"""
+
+        entries = []
+        now = time.time()
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            try:
+                stat = os.stat(path)
+                if name.endswith(_COPY_SUFFIX):
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                elif (name.endswith(_PARTIAL_SUFFIX) and
+                      now - stat.st_mtime > _STALE_PARTIAL_SECONDS):
+                    os.remove(path)
+            except OSError:
+                # Removed by another process in the meantime
+                pass
+        return entries
+
+    def _make_room(self, size):
+        """Evicts least recently used copies until a file of the given size fits
+        in both the budget and the free space; returns False if it cannot fit"""
+
+        fs_stat = os.statvfs(self._directory)
+        budget = self._get_budget(fs_stat)
+        if size > budget:
+            return False
+        min_free = int(MIN_FREE_FRACTION * fs_stat.f_blocks * fs_stat.f_frsize)
+
+        entries = sorted(self._list_entries())
+        used = sum(entry_size for (last_used, entry_size, path) in entries)
+        while entries:
+            free = _free_bytes(self._directory)
+            if used + size <= budget and free - size >= min_free:
+                return True
+            (last_used, entry_size, path) = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            used -= entry_size
+        return _free_bytes(self._directory) - size >= min_free
+
+    def _copy(self, filename, path):
+        """Copies filename to path, via a temporary name so that other processes
+        never see a partial copy; returns path, or None if the copy failed"""
+
+        partial = "{}.{}{}".format(path, os.getpid(), _PARTIAL_SUFFIX)
+        try:
+            shutil.copyfile(filename, partial)
+            os.rename(partial, path)
+        except (IOError, OSError):
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            return None
+        return path
+
+# ------------------------------------------------------------------------
+# Private functions
+# ------------------------------------------------------------------------
+
+def _default_directory():
+    """Returns the default cache directory, or None if there is no tmpfs"""
+
+    tmpfs = find_tmpfs()
+    if not tmpfs:
+        return None
+    if hasattr(os, 'getuid'):
+        user = str(os.getuid())
+    else:
+        user = 'user'
+    return os.path.join(tmpfs[0], 'cprnc_staging_' + user)
+
+def _cache_key(filename, stat):
+    """Returns the name under which the copy of the given file is stored, which
+    changes whenever the file's path, size or modification time change"""
+
+    key = "{}\0{}\0{!r}".format(os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _touch(path):
+    """Marks the given copy as just used (for LRU eviction); returns False if it
+    does not exist"""
+
+    try:
+        os.utime(path, None)
+    except OSError:
+        return False
+    return True
+
+def _free_bytes(directory):
+    """Returns the number of bytes available on the file system of directory"""
+
+    fs_stat = os.statvfs(directory)
+    return fs_stat.f_bavail * fs_stat.f_frsize
+
+def _on_tmpfs(filename):
+    """Returns True if the given file is on a tmpfs file system (in which case
+    copying it to another one gains nothing)"""
+
+    device = os.stat(filename).st_dev
+    return any(os.stat(path).st_dev == device for path in find_tmpfs())
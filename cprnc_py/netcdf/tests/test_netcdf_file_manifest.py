@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from os.path import (join, dirname)
+from cprnc_py.manifest import write_manifest
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+from cprnc_py.netcdf.netcdf_file_scipy import NetcdfFileScipy as netcdf
+from cprnc_py.netcdf.netcdf_file_manifest import NetcdfFileManifest
+
+class TestNetcdfFileManifest(CustomAssertions):
+    """This class provides tests of NetcdfFileManifest, together with
+    NetcdfVariableManifest, using manifests of real netcdf files."""
+
+    TEST_DATA_PATH = join(dirname(__file__), 'test_inputs')
+    TESTFILE_BASIC = join(TEST_DATA_PATH, 'testfile_basic.nc')
+    TESTFILE_MULTIPLE_TIMES = join(TEST_DATA_PATH, 'testfile_multipleTimes_someTimeless.nc')
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._manifest_filename = join(self._tempdir, 'testfile.manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    def create_manifest(self, filename):
+        write_manifest(netcdf(filename), self._manifest_filename)
+        return NetcdfFileManifest(self._manifest_filename)
+
+    def test_metadata_sameAsBaseline(self):
+        mymanifest = self.create_manifest(self.TESTFILE_MULTIPLE_TIMES)
+        mynetcdf = netcdf(self.TESTFILE_MULTIPLE_TIMES)
+        self.assertSameItems(mymanifest.get_varlist(), mynetcdf.get_varlist())
+        self.assertSameItems(list(mymanifest.get_varlist_bydim('time')),
+                             list(mynetcdf.get_varlist_bydim('time')))
+        self.assertEqual(mymanifest.get_varshape('testvar', {'time':1}),
+                         mynetcdf.get_varshape('testvar', {'time':1}))
+        self.assertEqual(mymanifest.get_vardtype('testvar'),
+                         mynetcdf.get_vardtype('testvar'))
+
+    def test_varBytesEqual_withBaseline(self):
+        mymanifest = self.create_manifest(self.TESTFILE_MULTIPLE_TIMES)
+        mynetcdf = netcdf(self.TESTFILE_MULTIPLE_TIMES)
+        self.assertTrue(mymanifest.var_bytes_equal(mynetcdf, 'testvar', {'time':2}))
+        self.assertTrue(mymanifest.var_bytes_equal(mynetcdf, 'testvar_notime'))
+        # No digest is stored for the whole of a variable with a time dimension
+        self.assertFalse(mymanifest.var_bytes_equal(mynetcdf, 'testvar'))
+
+    def test_isDataAvailable_withBaselineRemoved(self):
+        baseline = join(self._tempdir, 'baseline.nc')
+        shutil.copy(self.TESTFILE_BASIC, baseline)
+        mymanifest = self.create_manifest(baseline)
+        os.remove(baseline)
+        self.assertFalse(mymanifest.is_data_available())
+        self.assertEqual(mymanifest.get_global_attributes(), {})
+
+    def test_getStoredVarstats(self):
+        mymanifest = self.create_manifest(self.TESTFILE_BASIC)
+        stats = mymanifest.get_stored_varstats('testvar2_hasfill', {'time':0})
+        self.assertEqual(stats['num_elements'], 10)
+        self.assertEqual(stats['num_valid'], 9)
+        self.assertEqual(stats['max_val'], 20.)
+
+    def test_getVardata_readsBaseline(self):
+        mymanifest = self.create_manifest(self.TESTFILE_BASIC)
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        self.assertTrue(mymanifest.is_data_available())
+        self.assertArraysEqual(mymanifest.get_vardata('testvar2_hasfill'),
+                               mynetcdf.get_vardata('testvar2_hasfill'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,11 +3,15 @@
 from __future__ import print_function
 
 import unittest
+import shutil
+import tempfile
 import numpy as np
 import numpy.ma as ma
 from os.path import (join, dirname)
+from cprnc_py.netcdf.scipy.io.netcdf import netcdf_file as scipy_netcdf_file
 from cprnc_py.test_utils.custom_assertions import CustomAssertions
 from cprnc_py.netcdf.netcdf_file_scipy import NetcdfFileScipy as netcdf
+from cprnc_py.netcdf.staging_cache import StagingCache
 
 class TestNetcdfFileScipy(CustomAssertions):
     """This class provides tests of NetcdfFileScipy, as well as the
@@ -21,6 +25,29 @@ class TestNetcdfFileScipy(CustomAssertions):
     TESTFILE_MULTIPLE_TIMES = join(TEST_DATA_PATH, 'testfile_multipleTimes_someTimeless.nc')
     TESTFILE_CHAR = join(TEST_DATA_PATH, 'testfile_char.nc')
 
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    def write_testfile(self, filename, data, fill_value=None, history=b''):
+        """Write a netcdf file in the temporary directory containing the
+        variable testvar(time, lat), where time is the record dimension, and
+        the global attribute history. Returns the full path to the file."""
+
+        path = join(self._tempdir, filename)
+        ncfile = scipy_netcdf_file(path, 'w')
+        ncfile.history = history
+        ncfile.createDimension('time', None)
+        ncfile.createDimension('lat', data.shape[1])
+        var = ncfile.createVariable('testvar', 'd', ('time', 'lat'))
+        if fill_value is not None:
+            var._FillValue = fill_value
+        var[:] = data
+        ncfile.close()
+        return path
+
     def test_getDimsize_withBasicData(self):
         mynetcdf = netcdf(self.TESTFILE_BASIC)
         dimsize = mynetcdf.get_dimsize('lat')
@@ -97,6 +124,153 @@ class TestNetcdfFileScipy(CustomAssertions):
         expected = np.array([6.])
         self.assertArraysEqual(mydata, expected)
 
+    def test_getVardata_withoutCopy_returnsReadOnlyView(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        expected = mynetcdf.get_vardata('testvar2_hasfill', {'lon':1})
+        mydata = mynetcdf.get_vardata('testvar2_hasfill', {'lon':1}, copy=False)
+        self.assertArraysEqual(mydata, expected)
+        # The file's byte order is kept, and the data are not owned by the view
+        self.assertEqual(mydata.dtype, mynetcdf.get_vardtype('testvar2_hasfill'))
+        self.assertFalse(ma.getdata(mydata).flags.owndata)
+        self.assertFalse(ma.getdata(mydata).flags.writeable)
+
+    def test_close_withContextManager(self):
+        with netcdf(self.TESTFILE_BASIC) as mynetcdf:
+            mydata = mynetcdf.get_vardata('testvar')
+        # Copied data remain valid after the file is closed
+        self.assertEqual(mydata[0,2,1], 6.)
+        self.assertTrue(mynetcdf._file.fp.closed)
+
+    def test_iterRecords_sameAsGetVardata(self):
+        mynetcdf = netcdf(self.TESTFILE_MULTIPLE_TIMES)
+        varnames = ['testvar', 'testvar2', 'time']
+        indices = []
+        for (index, data) in mynetcdf.iter_records('time', varnames):
+            indices.append(index)
+            self.assertSameItems(data.keys(), varnames)
+            for varname in varnames:
+                self.assertArraysEqual(data[varname],
+                                       mynetcdf.get_vardata(varname, {'time':index}))
+        self.assertEqual(indices, [0, 1, 2])
+
+    def test_iterRecords_withRange(self):
+        mynetcdf = netcdf(self.TESTFILE_MULTIPLE_TIMES)
+        records = list(mynetcdf.iter_records('time', ['testvar2'], start=1, stop=2))
+        self.assertEqual(len(records), 1)
+        (index, data) = records[0]
+        self.assertEqual(index, 1)
+        self.assertArraysEqual(data['testvar2'],
+                               mynetcdf.get_vardata('testvar2', {'time':1}))
+        self.assertFalse(ma.getdata(data['testvar2']).flags.writeable)
+
+    def test_iterRecords_withNonRecordDim(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        records = list(mynetcdf.iter_records('lon', ['testvar']))
+        self.assertEqual(len(records), 2)
+        self.assertArraysEqual(records[1][1]['testvar'],
+                               mynetcdf.get_vardata('testvar', {'lon':1}))
+
+    def test_getVardataChunks_sameAsGetVardata(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        for dim_indices in ({}, {'lon':1}):
+            expected = mynetcdf.get_vardata('testvar2_hasfill', dim_indices)
+            chunks = list(mynetcdf.get_vardata_chunks('testvar2_hasfill', dim_indices,
+                                                      max_chunk_size=3))
+            self.assertTrue(len(chunks) > 1)
+            self.assertTrue(all(chunk.size <= 3 for chunk in chunks))
+            mydata = ma.concatenate([chunk.ravel() for chunk in chunks])
+            self.assertArraysEqual(mydata, expected.ravel())
+
+    def test_getVarshape_withDimSlice(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        myshape = mynetcdf.get_varshape('testvar', {'lon':1})
+        self.assertEqual(myshape, (1, 5))
+
+    def test_init_withoutStagingCache_readsInPlace(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        self.assertIsNone(mynetcdf.get_staged_copy())
+
+    def test_init_withStagingCache(self):
+        cache = StagingCache(policy='always', directory=join(self._tempdir, 'cache'))
+        mynetcdf = netcdf(self.TESTFILE_BASIC, staging_cache=cache)
+        self.assertEqual(dirname(mynetcdf.get_staged_copy()), cache.get_directory())
+        (opener, args) = mynetcdf.get_opener()
+        self.assertEqual(opener(*args).get_staged_copy(), mynetcdf.get_staged_copy())
+
+    def test_init_withMissingStagedCopy_opensOriginal(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC,
+                          staged_copy=join(self._tempdir, 'nonexistent.nc'))
+        self.assertIsNone(mynetcdf.get_staged_copy())
+        self.assertEqual(mynetcdf.get_dimsize('lat'), 5)
+
+    def test_getVariable_isCached(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        var = mynetcdf._get_variable('testvar')
+        self.assertIs(mynetcdf._get_variable('testvar'), var)
+        self.assertFalse(hasattr(var, '__dict__'))
+
+    def test_getVariable_withMetadata(self):
+        mynetcdf = netcdf(self.TESTFILE_BASIC)
+        var = mynetcdf._get_variable('testvar2_hasfill')
+        self.assertEqual(var.get_dimnum('lat'), 1)
+        self.assertIsNone(var.get_dimnum('nonexistent'))
+        self.assertIsNotNone(var.get_fillvalue())
+        (begin, vsize) = var.get_byte_layout()
+        self.assertTrue(begin > 0)
+        self.assertEqual(vsize, 5 * 2 * var.get_dtype().itemsize)
+
+    def test_varBytesEqual_withSameFile(self):
+        mynetcdf1 = netcdf(self.TESTFILE_BASIC)
+        mynetcdf2 = netcdf(self.TESTFILE_BASIC)
+        self.assertTrue(mynetcdf1.var_bytes_equal(mynetcdf2, 'testvar2_hasfill'))
+        self.assertTrue(mynetcdf1.var_bytes_equal(mynetcdf2, 'testvar', {'lon':1}))
+
+    def test_varBytesEqual_withDifferentSlice(self):
+        data = np.array([[1., 2., 3.], [4., 5., 6.]])
+        file1 = netcdf(self.write_testfile('file1.nc', data))
+        data[1,2] = 7.
+        file2 = netcdf(self.write_testfile('file2.nc', data))
+        self.assertTrue(file1.var_bytes_equal(file2, 'testvar', {'time':0}))
+        self.assertFalse(file1.var_bytes_equal(file2, 'testvar', {'time':1}))
+        self.assertFalse(file1.var_bytes_equal(file2, 'testvar'))
+
+    def test_varBytesEqual_withDifferentFillValue(self):
+        data = np.array([[1., 2., 3.]])
+        file1 = netcdf(self.write_testfile('file1.nc', data, fill_value=1.))
+        file2 = netcdf(self.write_testfile('file2.nc', data, fill_value=2.))
+        self.assertFalse(file1.var_bytes_equal(file2, 'testvar'))
+
+    def test_varBytesEqual_withIdenticalNaNs(self):
+        data = np.array([[1., np.nan, 3.]])
+        file1 = netcdf(self.write_testfile('file1.nc', data))
+        file2 = netcdf(self.write_testfile('file2.nc', data))
+        self.assertTrue(file1.var_bytes_equal(file2, 'testvar'))
+
+    def test_dataSectionEqual_withDifferentHeaderLengths(self):
+        data = np.array([[1., 2., 3.], [4., 5., 6.]])
+        file1 = netcdf(self.write_testfile('file1.nc', data, history=b'short'))
+        file2 = netcdf(self.write_testfile('file2.nc', data,
+                                           history=b'a much longer history'))
+        self.assertTrue(file1.data_section_equal(file2))
+
+    def test_dataSectionEqual_withDifferentData(self):
+        data = np.array([[1., 2., 3.], [4., 5., 6.]])
+        file1 = netcdf(self.write_testfile('file1.nc', data))
+        data[1,2] = 7.
+        file2 = netcdf(self.write_testfile('file2.nc', data))
+        self.assertFalse(file1.data_section_equal(file2))
+
+    def test_dataSectionEqual_withDifferentFillValue(self):
+        data = np.array([[1., 2., 3.]])
+        file1 = netcdf(self.write_testfile('file1.nc', data, fill_value=1.))
+        file2 = netcdf(self.write_testfile('file2.nc', data, fill_value=2.))
+        self.assertFalse(file1.data_section_equal(file2))
+
+    def test_dataSectionEqual_withDifferentVariables(self):
+        file1 = netcdf(self.TESTFILE_BASIC)
+        file2 = netcdf(self.TESTFILE_MULTIPLE_TIMES)
+        self.assertFalse(file1.data_section_equal(file2))
+
     def test_getFilename(self):
         mynetcdf = netcdf(self.TESTFILE_BASIC)
         self.assertEqual(self.TESTFILE_BASIC, mynetcdf.get_filename())
@@ -6,7 +6,8 @@ import unittest
 import numpy as np
 import numpy.ma as ma
 from cprnc_py.test_utils.custom_assertions import CustomAssertions
-from cprnc_py.netcdf.netcdf_utils import apply_fillvalue
+from cprnc_py.netcdf.netcdf_utils import (apply_fillvalue, fillvalues_equal,
+                                          arrays_bitwise_equal, DataDigest)
 
 class TestNetcdfUtils(CustomAssertions):
 
@@ -35,5 +36,79 @@ class TestNetcdfUtils(CustomAssertions):
                                                '_FillValue':2})
         self.assertArraysEqual(result, ma.array([1,2,3], mask=[False,True,False]))
 
+    def test_applyFillvalue_withNoFillPresent_returnsPlainArray(self):
+        data = np.array([1,2,3])
+        result = apply_fillvalue(data = data,
+                                 attributes = {'_FillValue':4})
+        self.assertFalse(isinstance(result, ma.MaskedArray))
+        self.assertIs(result, data)
+
+    def test_applyFillvalue_withNaNFillValue(self):
+        result = apply_fillvalue(data = np.array([1.,np.nan,3.]),
+                                 attributes = {'_FillValue':np.nan})
+        self.assertArraysEqual(result, ma.array([1.,0.,3.], mask=[False,True,False]))
+
+    def test_applyFillvalue_withScalar(self):
+        result = apply_fillvalue(data = np.float64(2.),
+                                 attributes = {'_FillValue':2.})
+        self.assertTrue(ma.is_masked(result))
+
+    # ------------------------------------------------------------------------
+    # Tests of fillvalues_equal
+    # ------------------------------------------------------------------------
+
+    def test_fillvaluesEqual_withNone(self):
+        self.assertTrue(fillvalues_equal(None, None))
+        self.assertFalse(fillvalues_equal(None, 1.))
+
+    def test_fillvaluesEqual_withNaN(self):
+        self.assertTrue(fillvalues_equal(np.nan, np.array([np.nan])))
+        self.assertFalse(fillvalues_equal(np.nan, 1.))
+
+    # ------------------------------------------------------------------------
+    # Tests of arrays_bitwise_equal
+    # ------------------------------------------------------------------------
+
+    def test_arraysBitwiseEqual_withNonNativeByteOrder(self):
+        arr = np.arange(12.).reshape(3,4).astype('>f8')
+        self.assertTrue(arrays_bitwise_equal(arr[:,1], arr.copy()[:,1]))
+        self.assertFalse(arrays_bitwise_equal(arr[:,1], arr[:,2]))
+
+    def test_arraysBitwiseEqual_distinguishesSignedZeros(self):
+        self.assertFalse(arrays_bitwise_equal(np.array([0.]), np.array([-0.])))
+
+    def test_arraysBitwiseEqual_withDifferentDtypes(self):
+        self.assertFalse(arrays_bitwise_equal(np.array([1.]), np.array([1.], dtype='f4')))
+
+    # ------------------------------------------------------------------------
+    # Tests of DataDigest
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def digest(chunks, dtype, shape):
+        digest = DataDigest(dtype, shape)
+        for chunk in chunks:
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def test_dataDigest_independentOfChunkingAndByteOrder(self):
+        data = ma.array(np.arange(6.), mask=[False, True, False, False, True, False])
+        expected = self.digest([data], data.dtype, (6,))
+        swapped = data.astype('>f8')
+        self.assertEqual(self.digest([swapped[:1], swapped[1:5], swapped[5:]], '>f8', (6,)),
+                         expected)
+
+    def test_dataDigest_dependsOnMask(self):
+        data = np.arange(6.)
+        masked = ma.array(data, mask=[False, True, False, False, False, False])
+        self.assertNotEqual(self.digest([masked], data.dtype, (6,)),
+                            self.digest([data], data.dtype, (6,)))
+
+    def test_dataDigest_dependsOnShapeAndType(self):
+        data = np.arange(6.)
+        expected = self.digest([data], data.dtype, (6,))
+        self.assertNotEqual(self.digest([data], data.dtype, (2,3)), expected)
+        self.assertNotEqual(self.digest([data.astype('f4')], 'f4', (6,)), expected)
+
 if __name__ == '__main__':
     unittest.main()
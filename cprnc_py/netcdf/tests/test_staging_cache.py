@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import os
+import shutil
+import tempfile
+from os.path import join
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+from cprnc_py.netcdf.staging_cache import StagingCache
+
+class TestStagingCache(CustomAssertions):
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._cachedir = join(self._tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    def write_file(self, filename, nbytes, last_modified=None):
+        """Write a file of the given size in the temporary directory, returning
+        its full path"""
+
+        path = join(self._tempdir, filename)
+        with open(path, 'wb') as myfile:
+            myfile.write(b'x' * nbytes)
+        if last_modified is not None:
+            os.utime(path, (last_modified, last_modified))
+        return path
+
+    def create_cache(self, policy='always', max_bytes=1000, **kwargs):
+        return StagingCache(policy=policy, max_bytes=max_bytes,
+                            directory=self._cachedir, **kwargs)
+
+    def test_stage_copiesFile(self):
+        path = self.write_file('file1', 100)
+        staged = self.create_cache().stage(path)
+        self.assertEqual(os.path.dirname(staged), self._cachedir)
+        with open(staged, 'rb') as myfile:
+            self.assertEqual(myfile.read(), b'x' * 100)
+
+    def test_removeCopies_removesCopiesMade(self):
+        path1 = self.write_file('file1', 100)
+        path2 = self.write_file('file2', 100)
+        staged1 = self.create_cache(persist=True).stage(path1)
+        cache = self.create_cache()
+        # The existing copy of file1 is reused, so it is kept
+        self.assertEqual(cache.stage(path1), staged1)
+        staged2 = cache.stage(path2)
+        cache.remove_copies()
+        self.assertTrue(os.path.exists(staged1))
+        self.assertFalse(os.path.exists(staged2))
+
+    def test_stage_reusesCopyAcrossCaches(self):
+        path = self.write_file('file1', 100)
+        staged = self.create_cache(persist=True).stage(path)
+        with open(staged, 'wb') as myfile:
+            myfile.write(b'marker')
+        # A new cache (e.g., in a later run) finds the existing copy
+        staged_again = self.create_cache().stage(path)
+        self.assertEqual(staged_again, staged)
+        with open(staged_again, 'rb') as myfile:
+            self.assertEqual(myfile.read(), b'marker')
+
+    def test_stage_withModifiedFile_makesNewCopy(self):
+        path = self.write_file('file1', 100, last_modified=1000000)
+        staged = self.create_cache(persist=True).stage(path)
+        self.write_file('file1', 100, last_modified=2000000)
+        self.assertNotEqual(self.create_cache().stage(path), staged)
+
+    def test_stage_evictsLeastRecentlyUsed(self):
+        cache = self.create_cache(max_bytes=250)
+        path1 = self.write_file('file1', 100)
+        path2 = self.write_file('file2', 100)
+        path3 = self.write_file('file3', 100)
+        staged1 = cache.stage(path1)
+        staged2 = cache.stage(path2)
+        os.utime(staged1, (1000000, 1000000))
+        os.utime(staged2, (2000000, 2000000))
+        # Using file1 again makes file2 the least recently used
+        cache.stage(path1)
+        staged3 = cache.stage(path3)
+        self.assertTrue(os.path.exists(staged1))
+        self.assertFalse(os.path.exists(staged2))
+        self.assertTrue(os.path.exists(staged3))
+
+    def test_stage_withFileLargerThanBudget_returnsNone(self):
+        path = self.write_file('file1', 1001)
+        self.assertIsNone(self.create_cache().stage(path))
+        self.assertEqual(os.listdir(self._cachedir), [])
+
+    def test_stage_withPolicyNever_returnsNone(self):
+        path = self.write_file('file1', 100)
+        self.assertIsNone(self.create_cache(policy='never').stage(path))
+
+    def test_stage_withPolicyAuto_onlyReusesLargeFiles(self):
+        path = self.write_file('file1', 100)
+        self.assertIsNone(self.create_cache(policy='auto', auto_max_bytes=99).stage(path))
+        staged = self.create_cache(persist=True).stage(path)
+        self.assertEqual(self.create_cache(policy='auto', auto_max_bytes=99).stage(path),
+                         staged)
+
+    def test_stage_withNonexistentFile_returnsNone(self):
+        self.assertIsNone(self.create_cache().stage(join(self._tempdir, 'nonexistent')))
+
+    def test_init_withUnknownPolicy_raisesError(self):
+        with self.assertRaises(ValueError):
+            StagingCache(policy='sometimes')
+
+if __name__ == '__main__':
+    unittest.main()
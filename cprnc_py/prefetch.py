@@ -0,0 +1,157 @@
+"""Reading ahead of a computation, so that I/O overlaps with computation.
+
+A reader thread calls a read function on each item in turn, and keeps the
+results in a bounded buffer, while the caller works on the items that have
+already been read. The buffer holds at most a given number of items and, if
+max_bytes is given, at most about that many bytes of data (an item larger than
+max_bytes is still read, but only once the buffer is empty, so that the
+pipeline never stalls).
+
+The read function typically spends its time waiting for the file system, which
+releases the GIL, so a single reader thread is enough to hide the I/O time of a
+computation that takes about as long.
+
+Typical usage is:
+
+    for (item, data) in prefetch(read_func, items, depth=4):
+        compute(item, data)
+"""
+
+from __future__ import print_function
+
+import threading
+from collections import deque
+
+# Default maximum number of bytes of data held in the buffer
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# ------------------------------------------------------------------------
+# Public functions
+# ------------------------------------------------------------------------
+
+def prefetch(read_func, items, depth, max_bytes=DEFAULT_MAX_BYTES, size_func=None):
+    """Generator that yields a tuple (item, read_func(item)) for each item in
+    items, in order, with read_func being called in a separate thread up to
+    depth items ahead of the caller.
+
+    If read_func raises an exception, it is raised again here, when the
+    caller gets to the corresponding item. If the caller stops early (e.g.,
+    because of an exception), the reader thread is stopped, too.
+
+    Arguments:
+    read_func: function called as read_func(item)
+    items: iterable of items
+    depth: maximum number of items that have been read but not yet yielded
+    max_bytes: maximum number of bytes of data held in the buffer (or None for
+        no limit)
+    size_func: function giving the size in bytes of a result of read_func (if
+        None, the sizes are not counted, so only depth limits the buffer)
+    """
+
+    if depth < 1:
+        raise ValueError("depth must be at least 1: {}".format(depth))
+    buf = _PrefetchBuffer(depth, max_bytes)
+    reader = threading.Thread(target=_read_all,
+                              args=(read_func, items, size_func, buf))
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            entry = buf.get()
+            if entry is None:
+                break
+            (item, data, error) = entry
+            if error is not None:
+                raise error
+            yield (item, data)
+    finally:
+        buf.cancel()
+        reader.join()
+
+# ------------------------------------------------------------------------
+# Private functions and classes
+# ------------------------------------------------------------------------
+
+def _read_all(read_func, items, size_func, buf):
+    """Body of the reader thread: reads each item into buf, then marks the end
+    of the items"""
+
+    try:
+        for item in items:
+            data = read_func(item)
+            if size_func is None:
+                nbytes = 0
+            else:
+                nbytes = size_func(data)
+            if not buf.put((item, data, None), nbytes):
+                return
+    except Exception as error:
+        buf.put((None, None, error), 0)
+    buf.finish()
+
+
+class _PrefetchBuffer(object):
+    """Queue of results bounded both in number of entries and in bytes, shared
+    by the reader thread (put, finish) and the caller (get, cancel)"""
+
+    def __init__(self, depth, max_bytes):
+        self._depth = depth
+        self._max_bytes = max_bytes
+        self._entries = deque()
+        self._nbytes = 0
+        self._finished = False
+        self._cancelled = False
+        self._condition = threading.Condition()
+
+    def put(self, entry, nbytes):
+        """Adds an entry of the given size, waiting until there is room for it;
+        returns False (without adding the entry) if the caller has stopped"""
+
+        with self._condition:
+            while not self._cancelled and not self._has_room(nbytes):
+                self._condition.wait()
+            if self._cancelled:
+                return False
+            self._entries.append((entry, nbytes))
+            self._nbytes += nbytes
+            self._condition.notify_all()
+            return True
+
+    def finish(self):
+        """Marks the end of the entries"""
+
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def get(self):
+        """Removes and returns the next entry, waiting until there is one;
+        returns None once all entries have been returned"""
+
+        with self._condition:
+            while not self._entries and not self._finished:
+                self._condition.wait()
+            if not self._entries:
+                return None
+            (entry, nbytes) = self._entries.popleft()
+            self._nbytes -= nbytes
+            self._condition.notify_all()
+            return entry
+
+    def cancel(self):
+        """Stops the reader at its next put, and drops the remaining entries"""
+
+        with self._condition:
+            self._cancelled = True
+            self._entries.clear()
+            self._nbytes = 0
+            self._condition.notify_all()
+
+    def _has_room(self, nbytes):
+        """Returns True if an entry of the given size can be added now"""
+
+        if not self._entries:
+            return True
+        if len(self._entries) >= self._depth:
+            return False
+        return self._max_bytes is None or self._nbytes + nbytes <= self._max_bytes
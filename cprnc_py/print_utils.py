@@ -12,6 +12,17 @@ def index_str(indices):
     else:
         return "(" + ",".join([_format_index(index) for index in indices]) + ")"
 
+def attribute_str(value):
+    """Convert a netcdf attribute value into a string for printing.
+
+    Character attributes (which may be read as bytes) are printed as plain
+    text; numeric attributes are printed as numbers."""
+
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    else:
+        return str(value)
+
 
 # ------------------------------------------------------------------------
 # Private functions
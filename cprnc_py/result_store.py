@@ -0,0 +1,281 @@
+"""Compact, columnar storage of the results of comparing many variables (or
+slices of variables).
+
+Each result (e.g., a VarDiffs object) is packed into one row of a numpy
+structured array, with fixed-width fields for its kind and for each of the
+statistics from which it was computed. Rows are small and cheap to pickle (so
+workers can send them back instead of object graphs), and the flags that
+results are counted by (see row_flag) can be read without unpacking them.
+Results are only turned back into VarDiffs objects (e.g., for printing) when
+they are needed.
+
+Typical usage is:
+
+    row = pack_vardiffs(var_diffs)
+    store = ResultStore(num_results)
+    store.set(result_id, varname, index, row, shape)
+    var_diffs = store.get_vardiffs(result_id)
+"""
+
+from __future__ import print_function
+
+import numpy as np
+from cprnc_py.stats_kernel import VarStatsAccumulator, DiffStatsAccumulator
+from cprnc_py.vardiffs import (VarDiffs, VarDiffsNonNumeric, VarDiffsUnsharedVar,
+                               VarDiffsDimSizeDiff, VarDiffsDataUnavailable)
+
+# Kinds of results: one for each VarDiffs class
+NUMERIC = 1
+NON_NUMERIC = 2
+DIM_SIZE_DIFF = 3
+DATA_UNAVAILABLE = 4
+UNSHARED = 5
+
+# Fields holding the statistics of each variable (VarStatsAccumulator
+# attributes); in a row, these are prefixed with var1_ and var2_
+_VAR_FIELDS = (('num_elements', 'i8'), ('num_valid', 'i8'),
+               ('max_val', 'f8'), ('max_loc', 'i8'),
+               ('min_val', 'f8'), ('min_loc', 'i8'),
+               ('sum', 'f8'), ('sum_sq', 'f8'), ('sum_abs', 'f8'))
+
+# Fields holding the statistics on the differences (DiffStatsAccumulator
+# attributes)
+_DIFF_FIELDS = (('num_mask_diffs', 'i8'), ('num_compared', 'i8'), ('num_diffs', 'i8'),
+                ('sum_sq_diff', 'f8'), ('sum_abs1', 'f8'), ('sum_abs2', 'f8'),
+                ('rdiff_max', 'f8'), ('rdiff_maxloc', 'i8'), ('rdiff_log10_sum', 'f8'))
+
+# Names of the VarDiffs methods giving the flags that results are counted by
+COUNTED_FLAGS = ('vars_differ', 'masks_differ', 'dims_differ', 'could_not_be_analyzed',
+                 'fields_nonshared')
+
+# Data type of a row. kind is 0 for a row that has not been set.
+ROW_DTYPE = np.dtype(
+    [('kind', 'i1'), ('found_in_filenum', 'i1')] +
+    [('var1_' + name, dtype) for (name, dtype) in _VAR_FIELDS] +
+    [('var2_' + name, dtype) for (name, dtype) in _VAR_FIELDS] +
+    list(_DIFF_FIELDS))
+
+# ------------------------------------------------------------------------
+# Public functions
+# ------------------------------------------------------------------------
+
+def pack_vardiffs(var_diffs):
+    """Return a row (a numpy.void of type ROW_DTYPE) describing the given
+    VarDiffs object (or object of one of the other VarDiffs classes).
+
+    Extreme values are stored as 64-bit floats; this is exact for all floating
+    point types and for integers of up to 2**53 in magnitude.
+
+    A VarDiffs object whose dimensions differ (which only VarDiffs(varname,
+    var1, var2) creates) is stored like a VarDiffsDimSizeDiff object.
+    """
+
+    row = np.zeros(1, dtype=ROW_DTYPE)[0]
+    if isinstance(var_diffs, VarDiffsUnsharedVar):
+        row['kind'] = UNSHARED
+        row['found_in_filenum'] = var_diffs.get_found_in_filenum()
+    elif isinstance(var_diffs, VarDiffsNonNumeric):
+        row['kind'] = NON_NUMERIC
+    elif isinstance(var_diffs, VarDiffsDataUnavailable):
+        row['kind'] = DATA_UNAVAILABLE
+    elif var_diffs.dims_differ():
+        row['kind'] = DIM_SIZE_DIFF
+    else:
+        row['kind'] = NUMERIC
+        _pack_diff_stats(row, var_diffs.get_stats())
+    return row
+
+def unpack_vardiffs(varname, row, shape):
+    """Return a VarDiffs object (or object of one of the other VarDiffs
+    classes) from a row created by pack_vardiffs.
+
+    Arguments:
+    varname: variable name
+    row: numpy.void of type ROW_DTYPE
+    shape: shape of each of the variables described by the row
+    """
+
+    kind = row['kind']
+    if kind == NUMERIC:
+        return VarDiffs.from_stats(varname, unpack_diff_stats(row), shape)
+    elif kind == NON_NUMERIC:
+        return VarDiffsNonNumeric(varname)
+    elif kind == DIM_SIZE_DIFF:
+        return VarDiffsDimSizeDiff(varname)
+    elif kind == DATA_UNAVAILABLE:
+        return VarDiffsDataUnavailable(varname)
+    elif kind == UNSHARED:
+        return VarDiffsUnsharedVar(varname, int(row['found_in_filenum']))
+    else:
+        raise ValueError("Row has not been set")
+
+def row_flag(rows, name):
+    """Return what the VarDiffs method of the given name (e.g., 'vars_differ')
+    would return for the result described by each of the given rows.
+
+    Arguments:
+    rows: numpy array of type ROW_DTYPE (giving a boolean array), or a single
+        row (giving a single boolean)
+    name: one of COUNTED_FLAGS
+    """
+
+    kind = rows['kind']
+    if name == 'vars_differ':
+        return (((kind == NUMERIC) & (rows['num_diffs'] > 0)) |
+                (kind == DATA_UNAVAILABLE))
+    elif name == 'masks_differ':
+        return (kind == NUMERIC) & (rows['num_mask_diffs'] > 0)
+    elif name == 'dims_differ':
+        return (kind == DIM_SIZE_DIFF)
+    elif name == 'could_not_be_analyzed':
+        return (kind == NON_NUMERIC) | (kind == DIM_SIZE_DIFF)
+    elif name == 'fields_nonshared':
+        return (kind == UNSHARED)
+    else:
+        raise ValueError("Unknown count: {}".format(name))
+
+def unpack_diff_stats(row):
+    """Return the DiffStatsAccumulator object stored in a row of kind
+    NUMERIC"""
+
+    stats = DiffStatsAccumulator()
+    stats.var1 = _unpack_var_stats(row, 'var1_')
+    stats.var2 = _unpack_var_stats(row, 'var2_')
+    for (name, dtype) in _DIFF_FIELDS:
+        setattr(stats, name, row[name].item())
+    if stats.num_diffs == 0:
+        stats.rdiff_max = None
+        stats.rdiff_maxloc = None
+    return stats
+
+# ------------------------------------------------------------------------
+# ResultStore class
+# ------------------------------------------------------------------------
+
+class ResultStore(object):
+    """Fixed number of results, each stored as one row (see pack_vardiffs),
+    along with its variable name, its index along the dimension the variable
+    was sliced along (or None) and the shape of the variables it describes.
+
+    Variable names and shapes are stored once per variable, not once per row:
+    all results of a variable with an index (i.e., its slices) must have the
+    same shape, as must all of its results without an index.
+    """
+
+    def __init__(self, num_results):
+        """Create a ResultStore object with room for num_results results, none
+        of which are set yet.
+        """
+
+        self._rows = np.zeros(num_results, dtype=ROW_DTYPE)
+        # Position of each row's variable in self._varnames (-1 if not set)
+        self._varnums = np.full(num_results, -1, dtype=np.int32)
+        # Index of each row (-1 for None)
+        self._indices = np.full(num_results, -1, dtype=np.int64)
+        self._varnames = []
+        self._varnums_by_name = {}
+        # Shapes, keyed by (varnum, has_index)
+        self._shapes = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def set(self, result_id, varname, index, row, shape):
+        """Set the result with the given id.
+
+        Arguments:
+        result_id: integer from 0 to num_results - 1
+        varname: variable name
+        index: index of the slice described by the row, or None
+        row: numpy.void of type ROW_DTYPE (see pack_vardiffs)
+        shape: shape of each of the variables described by the row (only
+            needed for rows of kind NUMERIC; otherwise it can be None)
+        """
+
+        varnum = self._varnums_by_name.get(varname)
+        if varnum is None:
+            varnum = len(self._varnames)
+            self._varnames.append(varname)
+            self._varnums_by_name[varname] = varnum
+        self._rows[result_id] = row
+        self._varnums[result_id] = varnum
+        self._indices[result_id] = -1 if index is None else index
+        if shape is not None:
+            self._shapes.setdefault((varnum, index is not None), tuple(shape))
+
+    def is_set(self, result_id):
+        """Return True if the result with the given id has been set"""
+
+        return self._rows['kind'][result_id] != 0
+
+    def get_varname(self, result_id):
+        """Return the variable name of the result with the given id"""
+
+        return self._varnames[self._varnums[result_id]]
+
+    def get_index(self, result_id):
+        """Return the index of the result with the given id (or None)"""
+
+        index = self._indices[result_id]
+        if index < 0:
+            return None
+        return int(index)
+
+    def get_row(self, result_id):
+        """Return the row of the result with the given id"""
+
+        return self._rows[result_id]
+
+    def get_vardiffs(self, result_id):
+        """Return the VarDiffs object (or object of one of the other VarDiffs
+        classes) of the result with the given id"""
+
+        varnum = self._varnums[result_id]
+        shape = self._shapes.get((varnum, self._indices[result_id] >= 0))
+        return unpack_vardiffs(self._varnames[varnum], self._rows[result_id], shape)
+
+# ------------------------------------------------------------------------
+# Private functions
+# ------------------------------------------------------------------------
+
+def _pack_diff_stats(row, stats):
+    """Store a DiffStatsAccumulator object in a row"""
+
+    _pack_var_stats(row, 'var1_', stats.var1)
+    _pack_var_stats(row, 'var2_', stats.var2)
+    for (name, dtype) in _DIFF_FIELDS:
+        row[name] = _field_value(getattr(stats, name), dtype)
+
+def _pack_var_stats(row, prefix, stats):
+    """Store a VarStatsAccumulator object in the fields of a row with the
+    given prefix"""
+
+    for (name, dtype) in _VAR_FIELDS:
+        row[prefix + name] = _field_value(getattr(stats, name), dtype)
+
+def _unpack_var_stats(row, prefix):
+    """Return the VarStatsAccumulator object stored in the fields of a row with
+    the given prefix"""
+
+    stats = VarStatsAccumulator()
+    for (name, dtype) in _VAR_FIELDS:
+        setattr(stats, name, row[prefix + name].item())
+    if stats.num_valid == 0:
+        (stats.max_val, stats.max_loc) = (None, None)
+        (stats.min_val, stats.min_loc) = (None, None)
+    else:
+        stats.max_val = row[prefix + 'max_val']
+        stats.min_val = row[prefix + 'min_val']
+    return stats
+
+def _field_value(value, dtype):
+    """Return the value to store in a field of the given type for an
+    accumulator attribute, which may be None (e.g., the location of the
+    maximum when there are no valid points)"""
+
+    if value is not None:
+        return value
+    elif dtype == 'f8':
+        return np.nan
+    else:
+        return -1
@@ -0,0 +1,901 @@
+"""Fused, blocked computation of the statistics reported by VarInfo and
+VarDiffs.
+
+Rather than making many passes over the full data (each of which allocates at
+least one full-size temporary), the functions here walk the flattened data in
+fixed-size blocks, computing every needed statistic on a block before moving on
+to the next one. Temporaries are therefore limited to the size of one block, and
+each element only needs to be brought into cache once.
+
+Typical usage is:
+
+    stats = compute_diff_stats(var1, var2)
+    stats.vars_differ()
+    stats.rmse()
+    stats.var1.max_val
+
+The accumulators are partial statistics: accumulators computed from separate
+pieces of a variable (e.g., chunks handled by different workers, or slices along
+some dimension) can be combined with merge(), as long as their locations refer
+to the same flat index space (see the offset argument of the compute functions,
+and embedded()).
+
+Most code should not need to use this module directly: VarInfo and VarDiffs use
+it to compute their statistics.
+"""
+
+from __future__ import print_function
+
+import copy
+import math
+import numpy as np
+import numpy.ma as ma
+
+# Number of elements processed at a time. This should be small enough that a
+# handful of block-sized temporaries fit comfortably in cache.
+BLOCK_SIZE = 32768
+
+# If at most this fraction of the compared points of a block differ, the
+# differences are only computed at the differing points (see
+# DiffStatsAccumulator._update_differences). Beyond about this fraction, the
+# cost of gathering the differing points outweighs the arithmetic saved.
+SPARSE_DIFF_FRACTION = 0.2
+
+# ------------------------------------------------------------------------
+# Public functions
+# ------------------------------------------------------------------------
+
+def compute_var_stats(var, block_size=BLOCK_SIZE):
+    """Compute statistics on a single variable in one blocked pass.
+
+    Arguments:
+    var: numpy or numpy.ma array
+    block_size: number of elements to process at a time
+
+    Returns a VarStatsAccumulator object.
+    """
+
+    return compute_var_stats_chunked([var], block_size)
+
+def compute_var_stats_chunked(chunks, block_size=BLOCK_SIZE, offset=0):
+    """Compute statistics on a single variable that is provided in pieces.
+
+    This gives exactly the same result as compute_var_stats on the full
+    variable, regardless of how the variable is split into chunks.
+
+    Arguments:
+    chunks: iterable of numpy or numpy.ma arrays; these are consecutive pieces
+        of the flattened (C-order) variable
+    block_size: number of elements to process at a time
+    offset: flat index of the start of the first chunk in the full variable;
+        this is useful when different parts of a variable are processed
+        separately, with the results combined via merge()
+
+    Returns a VarStatsAccumulator object.
+    """
+
+    stats = VarStatsAccumulator()
+    for (block_offset, blocks) in _aligned_blocks(((chunk,) for chunk in chunks),
+                                                  block_size):
+        ((data, mask),) = blocks
+        stats.update(data, mask, offset + block_offset)
+    return stats
+
+def compute_diff_stats(var1, var2, block_size=BLOCK_SIZE):
+    """Compute statistics on two variables and their differences in one
+    blocked pass.
+
+    Shapes of the two variables must be the same.
+
+    Arguments:
+    var1, var2: numpy or numpy.ma arrays
+    block_size: number of elements to process at a time
+
+    Returns a DiffStatsAccumulator object.
+    """
+
+    if np.shape(var1) != np.shape(var2):
+        raise ValueError("compute_diff_stats requires arrays of the same shape")
+
+    return compute_diff_stats_chunked([(var1, var2)], block_size)
+
+def compute_diff_stats_chunked(chunk_pairs, block_size=BLOCK_SIZE, offset=0):
+    """Compute statistics on two variables and their differences, where the
+    variables are provided in pieces.
+
+    This gives exactly the same result as compute_diff_stats on the full
+    variables, regardless of how the variables are split into chunks. The two
+    chunks in each pair must be the same size.
+
+    Arguments:
+    chunk_pairs: iterable of tuples (var1_chunk, var2_chunk) of numpy or
+        numpy.ma arrays; these are consecutive pieces of the flattened (C-order)
+        variables
+    block_size: number of elements to process at a time
+    offset: flat index of the start of the first chunk in the full variables;
+        this is useful when different parts of the variables are processed
+        separately, with the results combined via merge()
+
+    Returns a DiffStatsAccumulator object.
+    """
+
+    stats = DiffStatsAccumulator()
+    for (block_offset, blocks) in _aligned_blocks(chunk_pairs, block_size):
+        ((data1, mask1), (data2, mask2)) = blocks
+        stats.update(data1, mask1, data2, mask2, offset + block_offset)
+    return stats
+
+def compute_var_stats_slices(var, block_size=BLOCK_SIZE):
+    """Compute statistics on each slice of a variable along its first
+    dimension.
+
+    This gives exactly the same result as calling compute_var_stats on each
+    slice, var[0], var[1], etc. But when the slices are small (no more than
+    block_size elements) and var has no mask, the statistics of all slices are
+    computed together with reductions along the slices, which, for many small
+    slices, is much faster than handling one slice at a time.
+
+    Arguments:
+    var: numpy or numpy.ma array with at least one dimension
+    block_size: number of elements to process at a time
+
+    Returns a list of VarStatsAccumulator objects, one per slice.
+    """
+
+    rows = _slice_rows(var, block_size)
+    if rows is None:
+        return [compute_var_stats(_unmask_if_clean(var[i]), block_size)
+                for i in range(np.shape(var)[0])]
+    return _row_var_stats(rows, np.fabs(rows))
+
+def compute_diff_stats_slices(var1, var2, block_size=BLOCK_SIZE):
+    """Compute statistics on two variables and their differences for each
+    slice of the variables along their first dimension.
+
+    This gives exactly the same result as calling compute_diff_stats on each
+    pair of slices, (var1[0], var2[0]), (var1[1], var2[1]), etc., but it is
+    much faster for many small slices (see compute_var_stats_slices).
+
+    Shapes of the two variables must be the same.
+
+    Arguments:
+    var1, var2: numpy or numpy.ma arrays with at least one dimension
+    block_size: number of elements to process at a time
+
+    Returns a list of DiffStatsAccumulator objects, one per slice.
+    """
+
+    if np.shape(var1) != np.shape(var2):
+        raise ValueError("compute_diff_stats_slices requires arrays of the same shape")
+
+    rows1 = _slice_rows(var1, block_size)
+    rows2 = _slice_rows(var2, block_size)
+    if rows1 is None or rows2 is None:
+        return [compute_diff_stats(_unmask_if_clean(var1[i]), _unmask_if_clean(var2[i]),
+                                   block_size)
+                for i in range(np.shape(var1)[0])]
+
+    abs1 = np.fabs(rows1)
+    abs2 = np.fabs(rows2)
+    var1_stats = _row_var_stats(rows1, abs1)
+    var2_stats = _row_var_stats(rows2, abs2)
+    # Compare in the native type (see DiffStatsAccumulator.update)
+    differ = (rows1 != rows2)
+    num_diffs = np.count_nonzero(differ, axis=1)
+    all_stats = []
+    for i in range(rows1.shape[0]):
+        stats = DiffStatsAccumulator()
+        stats.var1 = var1_stats[i]
+        stats.var2 = var2_stats[i]
+        stats.num_compared = rows1.shape[1]
+        stats.sum_abs1 = var1_stats[i].sum_abs
+        stats.sum_abs2 = var2_stats[i].sum_abs
+        if num_diffs[i] > 0:
+            stats._update_differences(rows1[i], rows2[i], abs1[i], abs2[i], differ[i],
+                                      int(num_diffs[i]), None, 0,
+                                      stats.sum_abs1 + stats.sum_abs2)
+        all_stats.append(stats)
+    return all_stats
+
+# ------------------------------------------------------------------------
+# Accumulator classes
+# ------------------------------------------------------------------------
+
+class VarStatsAccumulator(object):
+    """Running statistics on a single variable, built up one block at a time.
+
+    Locations are flat (C-order) indices into the full variable. Where an
+    extreme value occurs more than once, the first occurrence is kept, as for
+    numpy's argmax / argmin.
+
+    Partial statistics from disjoint pieces of a variable can be combined with
+    merge().
+
+    Attributes:
+    num_elements: total number of elements seen
+    num_valid: number of unmasked elements seen
+    max_val, max_loc: maximum unmasked value and its location (None if no valid
+        elements have been seen)
+    min_val, min_loc: minimum unmasked value and its location
+    sum: sum of unmasked elements
+    sum_sq: sum of squares of unmasked elements
+    sum_abs: sum of the absolute values of unmasked elements
+    """
+
+    def __init__(self):
+        self.num_elements = 0
+        self.num_valid = 0
+        self.max_val = None
+        self.max_loc = None
+        self.min_val = None
+        self.min_loc = None
+        self.sum = 0.
+        self.sum_sq = 0.
+        self.sum_abs = 0.
+
+    def update(self, data, mask, offset):
+        """Accumulate statistics from one block of data.
+
+        Arguments:
+        data: 1-d numpy array
+        mask: 1-d boolean numpy array (True where data are invalid), or None if
+            all data are valid
+        offset: flat index of data[0] in the full variable
+        """
+
+        if mask is None:
+            valid = None
+            vals = data
+        else:
+            valid = ~mask
+            vals = data[valid]
+        self._update_from_valid(vals, valid, data.size, offset, _sum_abs(vals))
+
+    def merge(self, other):
+        """Return a new VarStatsAccumulator combining self and other, which
+        should describe disjoint pieces of the same variable, with locations
+        in the same flat index space.
+
+        Neither self nor other is modified. merge is commutative and
+        associative (sums are associative up to floating-point roundoff), so
+        partial results can be reduced in any order.
+        """
+
+        merged = copy.copy(self)
+        merged.num_elements += other.num_elements
+        merged.num_valid += other.num_valid
+        merged.sum += other.sum
+        merged.sum_sq += other.sum_sq
+        merged.sum_abs += other.sum_abs
+        if _replaces(other.max_val, other.max_loc,
+                     merged.max_val, merged.max_loc, np.greater):
+            (merged.max_val, merged.max_loc) = (other.max_val, other.max_loc)
+        if _replaces(other.min_val, other.min_loc,
+                     merged.min_val, merged.min_loc, np.less):
+            (merged.min_val, merged.min_loc) = (other.min_val, other.min_loc)
+        return merged
+
+    def embedded(self, full_shape, dimnum, index):
+        """Return a copy of self whose locations have been mapped from a slice
+        of a variable to the full variable.
+
+        self should have been computed on the slice at the given index of
+        dimension number dimnum of a variable whose shape is full_shape.
+        """
+
+        embedded = copy.copy(self)
+        embedded.max_loc = _embed_location(self.max_loc, full_shape, dimnum, index)
+        embedded.min_loc = _embed_location(self.min_loc, full_shape, dimnum, index)
+        return embedded
+
+    def to_dict(self):
+        """Return a dictionary of the statistics, containing only plain python
+        numbers (and None), suitable for serialization (e.g., as JSON).
+
+        The original object can be recreated with from_dict."""
+
+        return dict((attr, _plain_number(value))
+                    for (attr, value) in vars(self).items())
+
+    @classmethod
+    def from_dict(cls, stats_dict):
+        """Create a VarStatsAccumulator from a dictionary created by to_dict"""
+
+        stats = cls()
+        for attr in vars(stats):
+            setattr(stats, attr, stats_dict[attr])
+        return stats
+
+    def mean_absval(self):
+        """Return the mean of the absolute values of unmasked elements (0 if
+        there are no unmasked elements)."""
+
+        if self.num_valid > 0:
+            return self.sum_abs / self.num_valid
+        else:
+            return 0
+
+    def mean(self):
+        """Return the mean of unmasked elements (0 if there are no unmasked
+        elements)."""
+
+        if self.num_valid > 0:
+            return self.sum / self.num_valid
+        else:
+            return 0
+
+    def rms(self):
+        """Return the root mean square of unmasked elements (0 if there are no
+        unmasked elements)."""
+
+        if self.num_valid > 0:
+            return math.sqrt(self.sum_sq / self.num_valid)
+        else:
+            return 0
+
+    def _update_from_valid(self, vals, valid, num_elements, offset, sum_abs):
+        """Accumulate statistics given the already-extracted valid values of a
+        block.
+
+        The locations of the block's extremes are only worked out when they
+        replace the running extremes, which, after the first few blocks, is
+        rare; so for masked blocks, the positions of the valid values are
+        usually not needed at all.
+
+        Arguments:
+        vals: 1-d numpy array of the unmasked values in this block
+        valid: 1-d boolean numpy array giving the points of the block from
+            which vals were taken, or None if vals is the whole block
+        num_elements: total number of elements in the block (masked or not)
+        offset: flat index of the start of the block in the full variable
+        sum_abs: sum of the absolute values of vals
+        """
+
+        self.num_elements += num_elements
+        if vals.size == 0:
+            return
+        self.num_valid += vals.size
+        self.sum_abs += sum_abs
+        vals64 = vals.astype(np.float64, copy=False)
+        self.sum += _sum(vals64)
+        # (Unlike np.dot, whose result can depend on where vals64 sits in
+        # memory, this reduction matches that of _row_var_stats)
+        self.sum_sq += _sum(np.square(vals64))
+
+        imax = np.argmax(vals)
+        if _may_replace(vals[imax], self.max_val, np.greater):
+            max_loc = offset + _valid_position(valid, imax)
+            if _replaces(vals[imax], max_loc, self.max_val, self.max_loc, np.greater):
+                (self.max_val, self.max_loc) = (vals[imax], max_loc)
+        imin = np.argmin(vals)
+        if _may_replace(vals[imin], self.min_val, np.less):
+            min_loc = offset + _valid_position(valid, imin)
+            if _replaces(vals[imin], min_loc, self.min_val, self.min_loc, np.less):
+                (self.min_val, self.min_loc) = (vals[imin], min_loc)
+
+class DiffStatsAccumulator(object):
+    """Running statistics on two variables and their differences, built up one
+    block at a time.
+
+    Difference statistics only consider points that are unmasked in both
+    variables. Locations are flat (C-order) indices into the full variables.
+
+    Partial statistics from disjoint pieces of the variables can be combined
+    with merge().
+
+    Attributes:
+    var1, var2: VarStatsAccumulator objects for each of the two variables
+    num_mask_diffs: number of points whose mask differs between the variables
+    num_compared: number of points unmasked in both variables
+    num_diffs: number of compared points whose values differ
+    sum_sq_diff: sum of squared differences
+    sum_abs1, sum_abs2: sums of absolute values of the compared points
+    rdiff_max, rdiff_maxloc: maximum relative difference and its location
+        (None if no differences have been seen)
+    rdiff_log10_sum: sum of log10 of the relative differences at differing
+        points
+    """
+
+    def __init__(self):
+        self.var1 = VarStatsAccumulator()
+        self.var2 = VarStatsAccumulator()
+        self.num_mask_diffs = 0
+        self.num_compared = 0
+        self.num_diffs = 0
+        self.sum_sq_diff = 0.
+        self.sum_abs1 = 0.
+        self.sum_abs2 = 0.
+        self.rdiff_max = None
+        self.rdiff_maxloc = None
+        self.rdiff_log10_sum = 0.
+
+    @classmethod
+    def identical(cls, var_stats):
+        """Return the DiffStatsAccumulator that would be computed for two
+        variables known to be identical (same values and same mask), given the
+        statistics of either one of them.
+
+        This lets callers that can establish identity cheaply (e.g., by
+        comparing raw bytes) skip the difference computation. It should not be
+        used if the variables contain NaN values, since NaNs compare unequal to
+        themselves.
+
+        Arguments:
+        var_stats: VarStatsAccumulator object for either variable
+        """
+
+        stats = cls()
+        stats.var1 = var_stats
+        stats.var2 = copy.copy(var_stats)
+        stats.num_compared = var_stats.num_valid
+        stats.sum_abs1 = var_stats.sum_abs
+        stats.sum_abs2 = var_stats.sum_abs
+        return stats
+
+    def update(self, data1, mask1, data2, mask2, offset):
+        """Accumulate statistics from one block of each variable.
+
+        Arguments:
+        data1, data2: 1-d numpy arrays of the same size
+        mask1, mask2: 1-d boolean numpy arrays (True where data are invalid), or
+            None if all data are valid
+        offset: flat index of data1[0] (and data2[0]) in the full variables
+        """
+
+        num_elements = data1.size
+        if mask1 is None and mask2 is None:
+            # Common case: the per-variable and the difference statistics are
+            # computed over the same points, so share the work between them.
+            positions = None
+            (vals1, vals2) = (data1, data2)
+            abs1 = np.fabs(vals1)
+            abs2 = np.fabs(vals2)
+            sum_abs1 = _sum(abs1)
+            sum_abs2 = _sum(abs2)
+            self.var1._update_from_valid(vals1, None, num_elements, offset, sum_abs1)
+            self.var2._update_from_valid(vals2, None, num_elements, offset, sum_abs2)
+        else:
+            self.var1.update(data1, mask1, offset)
+            self.var2.update(data2, mask2, offset)
+            if mask1 is None:
+                invalid = mask2
+                self.num_mask_diffs += np.count_nonzero(mask2)
+            elif mask2 is None:
+                invalid = mask1
+                self.num_mask_diffs += np.count_nonzero(mask1)
+            else:
+                invalid = mask1 | mask2
+                self.num_mask_diffs += np.count_nonzero(mask1 != mask2)
+            positions = np.flatnonzero(~invalid)
+            vals1 = data1[positions]
+            vals2 = data2[positions]
+            abs1 = np.fabs(vals1)
+            abs2 = np.fabs(vals2)
+            sum_abs1 = _sum(abs1)
+            sum_abs2 = _sum(abs2)
+
+        if vals1.size == 0:
+            return
+        self.num_compared += vals1.size
+        self.sum_abs1 += sum_abs1
+        self.sum_abs2 += sum_abs2
+
+        # Compare in the native type, so that large integers that differ are
+        # not made equal by conversion to floating point
+        differ = (vals1 != vals2)
+        num_diffs = np.count_nonzero(differ)
+        if num_diffs == 0:
+            return
+        self._update_differences(vals1, vals2, abs1, abs2, differ, num_diffs,
+                                 positions, offset, sum_abs1 + sum_abs2)
+
+    def _update_differences(self, vals1, vals2, abs1, abs2, differ, num_diffs,
+                            positions, offset, sum_abs):
+        """Accumulate the statistics on the differences of one block, given the
+        values compared (those valid in both variables), for a block in which
+        some of these values differ.
+
+        Arguments:
+        vals1, vals2: 1-d numpy arrays of the values compared
+        abs1, abs2: absolute values of vals1 and vals2
+        differ: 1-d boolean numpy array: vals1 != vals2
+        num_diffs: number of True values in differ (at least 1)
+        positions: positions of vals1 and vals2 within the block, or None if
+            they are the whole block
+        offset: flat index of the start of the block in the full variables
+        sum_abs: sum of abs1 and abs2
+        """
+
+        self.num_diffs += num_diffs
+        differ_positions = np.flatnonzero(differ)
+
+        # Points that are equal contribute exact zeros to the differences, so
+        # when few points differ, only the differing points are gathered and
+        # worked on. This does not hold for equal infinite values (whose
+        # difference is NaN), which can only be present if sum_abs is infinite.
+        if num_diffs <= SPARSE_DIFF_FRACTION * vals1.size and not math.isinf(sum_abs):
+            diffs = (vals1[differ_positions].astype(np.float64) -
+                     vals2[differ_positions])
+            self.sum_sq_diff += float(np.dot(diffs, diffs))
+        else:
+            diffs = vals1.astype(np.float64) - vals2
+            self.sum_sq_diff += float(np.dot(diffs, diffs))
+            diffs = diffs[differ_positions]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rdiff = (np.fabs(diffs) /
+                     np.maximum(abs1[differ_positions], abs2[differ_positions]))
+            self.rdiff_log10_sum += _sum(np.log10(rdiff))
+        irmax = np.argmax(rdiff)
+        rdiff_maxloc = offset + _block_position(positions, differ_positions[irmax])
+        if _replaces(rdiff[irmax], rdiff_maxloc,
+                     self.rdiff_max, self.rdiff_maxloc, np.greater):
+            (self.rdiff_max, self.rdiff_maxloc) = (rdiff[irmax], rdiff_maxloc)
+
+    def merge(self, other):
+        """Return a new DiffStatsAccumulator combining self and other, which
+        should describe disjoint pieces of the same variables, with locations
+        in the same flat index space.
+
+        Neither self nor other is modified. merge is commutative and
+        associative (sums are associative up to floating-point roundoff), so
+        partial results can be reduced in any order.
+        """
+
+        merged = copy.copy(self)
+        merged.var1 = self.var1.merge(other.var1)
+        merged.var2 = self.var2.merge(other.var2)
+        merged.num_mask_diffs += other.num_mask_diffs
+        merged.num_compared += other.num_compared
+        merged.num_diffs += other.num_diffs
+        merged.sum_sq_diff += other.sum_sq_diff
+        merged.sum_abs1 += other.sum_abs1
+        merged.sum_abs2 += other.sum_abs2
+        merged.rdiff_log10_sum += other.rdiff_log10_sum
+        if _replaces(other.rdiff_max, other.rdiff_maxloc,
+                     merged.rdiff_max, merged.rdiff_maxloc, np.greater):
+            (merged.rdiff_max, merged.rdiff_maxloc) = (other.rdiff_max,
+                                                       other.rdiff_maxloc)
+        return merged
+
+    def embedded(self, full_shape, dimnum, index):
+        """Return a copy of self whose locations have been mapped from a slice
+        of the variables to the full variables.
+
+        self should have been computed on the slice at the given index of
+        dimension number dimnum of variables whose shape is full_shape.
+        """
+
+        embedded = copy.copy(self)
+        embedded.var1 = self.var1.embedded(full_shape, dimnum, index)
+        embedded.var2 = self.var2.embedded(full_shape, dimnum, index)
+        embedded.rdiff_maxloc = _embed_location(self.rdiff_maxloc, full_shape,
+                                                dimnum, index)
+        return embedded
+
+    def vars_differ(self):
+        """Return True if any point unmasked in both variables differs."""
+
+        return self.num_diffs > 0
+
+    def masks_differ(self):
+        """Return True if the variables' masks differ."""
+
+        return self.num_mask_diffs > 0
+
+    def rmse(self):
+        """Return the RMS difference over points unmasked in both variables."""
+
+        if self.vars_differ():
+            return math.sqrt(self.sum_sq_diff / self.num_compared)
+        else:
+            return 0.
+
+    def normalized_rmse(self):
+        """Return the RMS difference normalized by the average of the two
+        variables' mean absolute values."""
+
+        if self.vars_differ():
+            norm = (self.sum_abs1 + self.sum_abs2) / (2.0 * self.num_compared)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.float64(self.rmse()) / norm
+        else:
+            return 0.
+
+    def rdiff_logavg(self):
+        """Return the average, over differing points, of -log10 of the
+        relative difference (roughly, the number of digits that agree)."""
+
+        if self.vars_differ():
+            return -self.rdiff_log10_sum / self.num_diffs
+        else:
+            return float('nan')
+
+# ------------------------------------------------------------------------
+# Private functions
+# ------------------------------------------------------------------------
+
+def _slice_rows(var, block_size):
+    """Return the slices of var along its first dimension as the rows of a 2-d
+    array in native byte order, if their statistics can be computed together
+    (see compute_var_stats_slices); otherwise return None.
+
+    For the results to be exactly the same as for the individual slices, each
+    slice must be handled as a single block, so must have at most block_size
+    elements; and it must have no mask, so that the same elements are reduced
+    in the same order.
+    """
+
+    shape = np.shape(var)
+    slice_size = int(np.prod(shape[1:]))
+    if slice_size == 0 or slice_size > block_size or shape[0] == 0:
+        return None
+    if ma.getmask(var) is not ma.nomask:
+        return None
+    rows = np.reshape(ma.getdata(var), (shape[0], slice_size))
+    (rows, mask) = _native_piece((rows, None))
+    return rows
+
+def _row_var_stats(rows, abs_rows):
+    """Return a list of the VarStatsAccumulator objects of each row of a 2-d
+    array, each of which is a whole, unmasked block.
+
+    The reductions are done along the rows of the whole array at once; they
+    give the same results as VarStatsAccumulator.update on each row.
+
+    Arguments:
+    rows: 2-d numpy array, in native byte order
+    abs_rows: absolute values of rows
+    """
+
+    (nrows, row_size) = rows.shape
+    rows64 = rows.astype(np.float64, copy=False)
+    sums = np.sum(rows64, axis=1, dtype=np.float64)
+    sums_sq = np.sum(np.square(rows64), axis=1, dtype=np.float64)
+    sums_abs = np.sum(abs_rows, axis=1, dtype=np.float64)
+    imax = np.argmax(rows, axis=1)
+    imin = np.argmin(rows, axis=1)
+    row_numbers = np.arange(nrows)
+    max_vals = rows[row_numbers, imax]
+    min_vals = rows[row_numbers, imin]
+    all_stats = []
+    for i in range(nrows):
+        stats = VarStatsAccumulator()
+        stats.num_elements = row_size
+        stats.num_valid = row_size
+        stats.sum_abs += float(sums_abs[i])
+        stats.sum += float(sums[i])
+        stats.sum_sq += float(sums_sq[i])
+        (stats.max_val, stats.max_loc) = (max_vals[i], int(imax[i]))
+        (stats.min_val, stats.min_loc) = (min_vals[i], int(imin[i]))
+        all_stats.append(stats)
+    return all_stats
+
+def _unmask_if_clean(var):
+    """Return var without its mask if no element is masked (as netcdf_utils
+    does for data without missing points); otherwise return var unchanged"""
+
+    if ma.getmask(var) is not ma.nomask and not ma.is_masked(var):
+        return ma.getdata(var)
+    return var
+
+def _flat_data_and_mask(var):
+    """Return a tuple (data, mask) of flattened (C-order) versions of the given
+    array's data and mask. mask is None if the array has no mask.
+
+    For contiguous arrays, these are views rather than copies.
+    """
+
+    data = np.ravel(ma.getdata(var))
+    mask = ma.getmask(var)
+    if mask is ma.nomask:
+        mask = None
+    else:
+        mask = np.ravel(mask)
+    return (data, mask)
+
+def _aligned_blocks(chunks, block_size):
+    """Generator that splits consecutive chunks of one or more variables into
+    blocks whose boundaries fall on multiples of block_size.
+
+    Aligning the blocks this way means that the blocks (and thus all
+    statistics computed from them) do not depend on how the data happened to be
+    split into chunks. At most one partial block is held back between chunks.
+
+    Arguments:
+    chunks: iterable of tuples of numpy or numpy.ma arrays; the i'th array in
+        each tuple is the next piece of the i'th (flattened) variable
+    block_size: number of elements in each block
+
+    Yields tuples (offset, blocks), where offset is the flat index of the start
+    of the block and blocks is a list of (data, mask) tuples, one per variable.
+    """
+
+    offset = 0
+    carry = None
+    for chunk in chunks:
+        pieces = _check_piece_sizes(
+            [_flat_data_and_mask(arr) for arr in chunk])
+        start = 0
+        size = pieces[0][0].size
+        if carry is not None:
+            # Complete the partial block left over from the previous chunk
+            need = block_size - carry[0][0].size
+            front = [_slice_piece(piece, 0, need) for piece in pieces]
+            carry = [_concatenate_pieces(c, f) for (c, f) in zip(carry, front)]
+            start = min(need, size)
+            if carry[0][0].size < block_size:
+                continue
+            yield (offset, [_native_piece(piece) for piece in carry])
+            offset += block_size
+            carry = None
+        while size - start >= block_size:
+            stop = start + block_size
+            yield (offset, [_native_piece(_slice_piece(piece, start, stop))
+                            for piece in pieces])
+            offset += block_size
+            start = stop
+        if start < size:
+            # Copy the remainder, so that we don't hold onto the whole chunk
+            carry = [_copy_piece(_slice_piece(piece, start, size))
+                     for piece in pieces]
+    if carry is not None:
+        yield (offset, [_native_piece(piece) for piece in carry])
+
+def _check_piece_sizes(pieces):
+    """Check that all (data, mask) pieces have the same size; returns the
+    pieces unchanged."""
+
+    sizes = set(data.size for (data, mask) in pieces)
+    if len(sizes) > 1:
+        raise ValueError("Chunks of different variables must have the same size")
+    return pieces
+
+def _slice_piece(piece, start, stop):
+    """Return elements start:stop of a (data, mask) tuple."""
+
+    (data, mask) = piece
+    return (data[start:stop], _mask_block(mask, start, stop))
+
+def _native_piece(piece):
+    """Return a (data, mask) tuple whose data are in the machine's byte order.
+
+    Data read directly from a netcdf file (e.g., views into a memory map) are
+    big-endian; converting each block once is cheaper than having every
+    operation on the block swap the bytes again."""
+
+    (data, mask) = piece
+    if data.dtype.isnative:
+        return piece
+    return (data.astype(data.dtype.newbyteorder('=')), mask)
+
+def _copy_piece(piece):
+    """Return a copy of a (data, mask) tuple."""
+
+    (data, mask) = piece
+    if mask is None:
+        return (data.copy(), None)
+    else:
+        return (data.copy(), mask.copy())
+
+def _concatenate_pieces(piece1, piece2):
+    """Concatenate two (data, mask) tuples."""
+
+    (data1, mask1) = piece1
+    (data2, mask2) = piece2
+    data = np.concatenate((data1, data2))
+    if mask1 is None and mask2 is None:
+        mask = None
+    else:
+        mask = np.concatenate((_mask_or_false(mask1, data1.size),
+                               _mask_or_false(mask2, data2.size)))
+    return (data, mask)
+
+def _mask_or_false(mask, size):
+    """Return mask, or an all-False mask of the given size if mask is None."""
+
+    if mask is None:
+        return np.zeros(size, dtype=bool)
+    else:
+        return mask
+
+def _mask_block(mask, start, stop):
+    """Return the given block of mask, or None if mask is None."""
+
+    if mask is None:
+        return None
+    else:
+        return mask[start:stop]
+
+def _block_position(positions, index):
+    """Map an index into a block's extracted values back to a position in the
+    block."""
+
+    if positions is None:
+        return int(index)
+    else:
+        return int(positions[index])
+
+def _valid_position(valid, index):
+    """Map an index into a block's extracted values back to a position in the
+    block, given the block's valid points (or None if all points are valid)."""
+
+    if valid is None:
+        return int(index)
+    else:
+        return int(np.flatnonzero(valid)[index])
+
+def _sum(arr):
+    """Return the sum of arr, accumulated in double precision, as a float."""
+
+    return float(np.sum(arr, dtype=np.float64))
+
+def _sum_abs(arr):
+    """Return the sum of the absolute values of arr, accumulated in double
+    precision, as a float."""
+
+    return _sum(np.fabs(arr))
+
+def _replaces(new_val, new_loc, cur_val, cur_loc, compare):
+    """Return True if (new_val, new_loc) should replace (cur_val, cur_loc) as
+    the running extreme.
+
+    compare should be np.greater (for maxima) or np.less (for minima). A value
+    of None means that no extreme has been found. As with numpy's argmax /
+    argmin, a NaN takes precedence over any other value, and of two equal
+    values, the one at the lower location is kept.
+    """
+
+    if new_val is None:
+        return False
+    if cur_val is None:
+        return True
+    new_isnan = bool(np.isnan(new_val))
+    cur_isnan = bool(np.isnan(cur_val))
+    if new_isnan or cur_isnan:
+        if new_isnan and cur_isnan:
+            return new_loc < cur_loc
+        return new_isnan
+    if new_val == cur_val:
+        return new_loc < cur_loc
+    return bool(compare(new_val, cur_val))
+
+def _may_replace(new_val, cur_val, compare):
+    """Return True if new_val might replace cur_val as the running extreme (see
+    _replaces), i.e., unless it is certain not to, whatever the locations.
+
+    This only compares the values, so that the location of new_val need not be
+    worked out when it cannot matter."""
+
+    if cur_val is None or new_val == cur_val:
+        return True
+    if np.isnan(new_val) or np.isnan(cur_val):
+        return bool(np.isnan(new_val))
+    return bool(compare(new_val, cur_val))
+
+def _plain_number(value):
+    """Convert a numpy scalar into the equivalent python number; other values
+    are returned unchanged."""
+
+    if isinstance(value, np.generic):
+        return value.item()
+    else:
+        return value
+
+def _embed_location(loc, full_shape, dimnum, index):
+    """Map a flat location within a slice of an array to a flat location in the
+    full array.
+
+    Arguments:
+    loc: flat (C-order) index into the slice (or None)
+    full_shape: shape of the full array
+    dimnum: dimension number along which the slice was taken
+    index: index of the slice along that dimension
+    """
+
+    if loc is None:
+        return None
+    slice_shape = tuple(full_shape[:dimnum]) + tuple(full_shape[dimnum+1:])
+    indices = list(np.unravel_index(loc, slice_shape))
+    indices.insert(dimnum, index)
+    return int(np.ravel_multi_index(indices, full_shape))
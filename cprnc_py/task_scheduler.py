@@ -0,0 +1,96 @@
+"""Scheduling of tasks of very different sizes onto a pool of workers.
+
+Tasks are dispatched largest-first, so that the biggest tasks do not end up
+running alone at the end while other workers sit idle, and small tasks are
+batched together, so that they do not each pay the full overhead of being sent
+to a worker.
+
+Typical usage is:
+
+    batches = schedule_batches(costs, nworkers)
+
+which returns lists of task numbers, in the order in which they should be
+dispatched.
+"""
+
+from __future__ import print_function
+
+# Each batch is made small enough that there are about this many batches per
+# worker, so that the load can be balanced at the end of the run
+BATCHES_PER_WORKER = 4
+
+# Cost added to every task for the fixed overhead of running it (in the same
+# units as the task costs: bytes of data to be read)
+TASK_OVERHEAD_COST = 64 * 1024
+
+# ------------------------------------------------------------------------
+# Public functions
+# ------------------------------------------------------------------------
+
+def schedule_batches(costs, nworkers, batches_per_worker=BATCHES_PER_WORKER,
+                     task_overhead_cost=TASK_OVERHEAD_COST, cheapest_first=False):
+    """Group tasks into batches and order the batches for dispatch.
+
+    Tasks are considered in order of decreasing cost. Each task that is at
+    least as costly as the target batch cost gets a batch of its own; smaller
+    tasks are combined into batches of about the target cost. The target is
+    chosen so that there are about batches_per_worker batches per worker. The
+    batches are returned in order of decreasing cost.
+
+    With cheapest_first, tasks are instead considered, and the batches
+    returned, in order of increasing cost. This gives up load balancing at the
+    end of the run for getting as many results as possible early on (e.g., when
+    the run may be stopped once some result is found).
+
+    Arguments:
+    costs: sequence giving the estimated cost of each task (e.g., the number of
+        bytes it needs to read)
+    nworkers: number of workers that will run the tasks
+    batches_per_worker: approximate number of batches to create per worker
+    task_overhead_cost: fixed cost added to each task
+    cheapest_first: if True, dispatch the cheapest tasks first
+
+    Returns a list of batches, each of which is a list of task numbers (indices
+    into costs).
+    """
+
+    total_costs = [cost + task_overhead_cost for cost in costs]
+    target = sum(total_costs) / float(max(1, nworkers * batches_per_worker))
+
+    batches = []
+    batch_costs = []
+    current = []
+    current_cost = 0
+    if cheapest_first:
+        sign = 1
+    else:
+        sign = -1
+    for task in sorted(range(len(total_costs)), key=lambda task: sign * total_costs[task]):
+        cost = total_costs[task]
+        if cost >= target:
+            if current:
+                # Keep the batches in the order in which their tasks were
+                # considered
+                batches.append(current)
+                batch_costs.append(current_cost)
+                current = []
+                current_cost = 0
+            batches.append([task])
+            batch_costs.append(cost)
+            continue
+        current.append(task)
+        current_cost += cost
+        if current_cost >= target:
+            batches.append(current)
+            batch_costs.append(current_cost)
+            current = []
+            current_cost = 0
+    if current:
+        batches.append(current)
+        batch_costs.append(current_cost)
+
+    if cheapest_first:
+        # The batches were created in order of increasing cost of their tasks
+        return batches
+    order = sorted(range(len(batches)), key=lambda batch: -batch_costs[batch])
+    return [batches[batch] for batch in order]
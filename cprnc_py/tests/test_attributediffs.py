@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from cprnc_py.attributediffs import AttributeDiffs
+from cprnc_py.netcdf.netcdf_file_fake import NetcdfFileFake
+from cprnc_py.netcdf.netcdf_variable_fake import NetcdfVariableFake
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+
+class TestAttributeDiffs(CustomAssertions):
+
+    FILENAME1 = 'foo1.nc'
+    FILENAME2 = 'foo2.nc'
+
+    def test_numDifferences_withSameAttributes(self):
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(np.array([1.]),
+                                                    attributes={'units': b'm'})},
+            global_attributes = {'title': b'foo'})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(np.array([2.]),
+                                                    attributes={'units': b'm'})},
+            global_attributes = {'title': b'foo'})
+        mydiffs = AttributeDiffs(file1, file2)
+        self.assertEqual(mydiffs.num_differences(), 0)
+        self.assertEqual(str(mydiffs), "No differences in header attributes\n")
+
+    def test_numDifferences_withDifferentAndMissingAttributes(self):
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(np.array([1.]),
+                                                    attributes={'units': b'm',
+                                                                'scale': np.array([1., 2.])}),
+                         'var2': NetcdfVariableFake(np.array([1.]),
+                                                    attributes={'units': b'm'})},
+            global_attributes = {'history': b'run 1'})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(np.array([1.]),
+                                                    attributes={'units': b'm',
+                                                                'scale': np.array([1., 3.])}),
+                         'var3': NetcdfVariableFake(np.array([1.]),
+                                                    attributes={'units': b'km'})},
+            global_attributes = {'history': b'run 2', 'title': b'foo'})
+        mydiffs = AttributeDiffs(file1, file2)
+        # var2 and var3 are not shared, so their attributes are not compared
+        self.assertEqual(mydiffs.num_differences(), 3)
+
+    def test_str_withDifferences(self):
+        file1 = NetcdfFileFake(self.FILENAME1, global_attributes = {'history': b'run 1'})
+        file2 = NetcdfFileFake(self.FILENAME2, global_attributes = {'title': b'foo'})
+        mystr = str(AttributeDiffs(file1, file2))
+        expected = ("HEADER DIFFERENCES:\n"
+                    " global attribute history\n"
+                    "   file 1: run 1\n"
+                    "   file 2: (not present)\n"
+                    " global attribute title\n"
+                    "   file 1: (not present)\n"
+                    "   file 2: foo\n")
+        self.assertEqual(mystr, expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from cprnc_py.diffsummary import DiffSummary
+from cprnc_py.result_store import pack_vardiffs
+from cprnc_py.vardiffs import (VarDiffs, VarDiffsNonNumeric, VarDiffsUnsharedVar,
+                               VarDiffsDimSizeDiff)
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+
+class TestDiffSummary(CustomAssertions):
+
+    # ------------------------------------------------------------------------
+    # Helper methods
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def row_identical():
+        var = np.array([1., 2.])
+        return pack_vardiffs(VarDiffs('foo', var, var))
+
+    @staticmethod
+    def row_differ():
+        return pack_vardiffs(VarDiffs('foo', np.array([1., 2.]), np.array([1., 3.])))
+
+    # ------------------------------------------------------------------------
+    # Tests
+    # ------------------------------------------------------------------------
+
+    def test_add_countsEachFlag(self):
+        summary = DiffSummary(5)
+        for row in (self.row_identical(), self.row_differ(),
+                    pack_vardiffs(VarDiffsNonNumeric('bar')),
+                    pack_vardiffs(VarDiffsDimSizeDiff('baz')),
+                    pack_vardiffs(VarDiffsUnsharedVar('qux', 1))):
+            summary.add(row)
+        self.assertTrue(summary.is_complete())
+        self.assertEqual(summary.num_vars(), 5)
+        self.assertEqual(summary.num_vars_differ(), 1)
+        self.assertEqual(summary.num_masks_differ(), 0)
+        self.assertEqual(summary.num_dims_differ(), 1)
+        self.assertEqual(summary.num_could_not_be_analyzed(), 2)
+        self.assertEqual(summary.num_nonshared_fields(), 1)
+
+    def test_filesDiffer_beforeComplete_withDifference(self):
+        summary = DiffSummary(3)
+        summary.add(self.row_differ())
+        self.assertFalse(summary.is_complete())
+        self.assertTrue(summary.files_differ())
+
+    def test_filesDiffer_withNothingAnalyzable_onlyOnceComplete(self):
+        summary = DiffSummary(2)
+        summary.add(pack_vardiffs(VarDiffsNonNumeric('bar')))
+        self.assertFalse(summary.files_differ())
+        summary.add(pack_vardiffs(VarDiffsNonNumeric('baz')))
+        self.assertTrue(summary.files_differ())
+
+    def test_filesDiffer_withIdenticalVars(self):
+        summary = DiffSummary(1)
+        summary.add(self.row_identical())
+        self.assertFalse(summary.files_differ())
+        self.assertRegexMatches(str(summary), "seem to be IDENTICAL")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,34 @@
 from __future__ import print_function
 
 import unittest
+try:
+    # python2: a StringIO that accepts str
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 from cprnc_py.filediffs import FileDiffs
+from cprnc_py.vardiffs import VarDiffs
 from cprnc_py.netcdf.netcdf_file_fake import NetcdfFileFake
 from cprnc_py.netcdf.netcdf_variable_fake import NetcdfVariableFake
+from cprnc_py.netcdf.netcdf_utils import arrays_bitwise_equal
 import numpy as np
 from cprnc_py.test_utils.custom_assertions import CustomAssertions
 
+class NetcdfFileFakeBytesEqual(NetcdfFileFake):
+    """Version of NetcdfFileFake that can tell when variables are
+    byte-for-byte identical, like a real file can"""
+
+    def var_bytes_equal(self, other, varname, dim_indices={}):
+        data1 = self.get_vardata(varname, dim_indices)
+        data2 = other.get_vardata(varname, dim_indices)
+        return (arrays_bitwise_equal(np.ma.getdata(data1), np.ma.getdata(data2)) and
+                arrays_bitwise_equal(np.ma.getmaskarray(data1), np.ma.getmaskarray(data2)))
+
+    def data_section_equal(self, other):
+        varlist = sorted(self.get_varlist())
+        return (varlist == sorted(other.get_varlist()) and
+                all(self.var_bytes_equal(other, varname) for varname in varlist))
+
 class TestFilediffs(CustomAssertions):
 
     FILENAME1 = 'foo1.nc'
@@ -388,5 +410,382 @@ class TestFilediffs(CustomAssertions):
         mydiffs = FileDiffs(file1, file2, separate_dim='dim1')
         mystr = str(mydiffs)
 
+    # ------------------------------------------------------------------------
+    # Tests of nprocs
+    # ------------------------------------------------------------------------
+
+    def test_nprocs_sameOutputAsSerial_withTwoFileDiffs(self):
+        data = np.arange(6.).reshape((2,3))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data, ('time','dim2'))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data + 1., ('time','dim2'))})
+        # Make sure that one FileDiffs object does not affect the other
+        parallel_differ = FileDiffs(file1, file2, nprocs=2)
+        parallel_same = FileDiffs(file1, file1, nprocs=2)
+        self.assertEqual(str(parallel_differ), str(FileDiffs(file1, file2)))
+        self.assertEqual(str(parallel_same), str(FileDiffs(file1, file1)))
+        self.assertTrue(parallel_differ.files_differ())
+        self.assertFalse(parallel_same.files_differ())
+
+    def test_executorThreads_sameOutputAsSerial(self):
+        data = np.arange(6.).reshape((2,3))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data, ('time','dim2')),
+                         'var2': NetcdfVariableFake(data[0], ('dim2',))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data + 1., ('time','dim2')),
+                         'var2': NetcdfVariableFake(data[0], ('dim2',))})
+        threaded = FileDiffs(file1, file2, nprocs=2, executor='threads')
+        self.assertEqual(str(threaded), str(FileDiffs(file1, file2)))
+        self.assertEqual(threaded.num_vars_differ(), 2)
+
+    def test_recordScan_sameOutputAsDefault(self):
+        data = np.arange(6.).reshape((2,3))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data, ('time','dim2')),
+                         'var2': NetcdfVariableFake(data, ('time','dim2')),
+                         'var3': NetcdfVariableFake(data[0], ('dim2',))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data + 1., ('time','dim2')),
+                         'var2': NetcdfVariableFake(data[:,:2], ('time','dim2')),
+                         'var3': NetcdfVariableFake(data[0], ('dim2',))})
+        scanned = FileDiffs(file1, file2, record_scan=True)
+        self.assertEqual(str(scanned), str(FileDiffs(file1, file2)))
+        self.assertEqual(scanned.num_vars_differ(), 2)
+        self.assertEqual(scanned.num_dims_differ(), 2)
+
+    def test_recordScan_withThreads_sameOutputAsDefault(self):
+        data = np.arange(12.).reshape((4,3))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data, ('time','dim2'))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data * 2., ('time','dim2'))})
+        scanned = FileDiffs(file1, file2, nprocs=3, executor='threads',
+                            record_scan=True)
+        self.assertEqual(str(scanned), str(FileDiffs(file1, file2)))
+        self.assertEqual(scanned.num_vars(), 4)
+
+    def test_prefetch_sameOutputAsDefault(self):
+        data = np.arange(6.).reshape((2,3))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data, ('time','dim2')),
+                         'var2': NetcdfVariableFake(data, ('time','dim2')),
+                         'var3': NetcdfVariableFake(data[0], ('dim2',))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data + 1., ('time','dim2')),
+                         'var2': NetcdfVariableFake(data[:,:2], ('time','dim2')),
+                         'var3': NetcdfVariableFake(data[0], ('dim2',))})
+        for separate_dim in ('time', None):
+            prefetched = FileDiffs(file1, file2, separate_dim=separate_dim,
+                                   prefetch_depth=2, prefetch_bytes=1)
+            self.assertEqual(str(prefetched),
+                             str(FileDiffs(file1, file2, separate_dim=separate_dim)))
+
+    def test_prefetch_withNprocs_raisesError(self):
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(np.array([1.]), ('dim1',))})
+        with self.assertRaises(ValueError):
+            FileDiffs(file1, file1, nprocs=2, prefetch_depth=2)
+
+    def test_sliceBlockBytes_sameOutputAsDefault(self):
+        data = np.arange(12.).reshape((4,3))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data, ('time','dim2')),
+                         'var2': NetcdfVariableFake(data, ('time','dim2')),
+                         'var3': NetcdfVariableFake(data.T, ('dim2','time')),
+                         'var4': NetcdfVariableFake(data[0], ('dim2',))})
+        data2 = data.copy()
+        data2[2,1] = 100.
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data2, ('time','dim2')),
+                         'var2': NetcdfVariableFake(data[:,:2], ('time','dim2')),
+                         'var3': NetcdfVariableFake(np.ma.masked_greater(data2.T, 50.),
+                                                    ('dim2','time')),
+                         'var4': NetcdfVariableFake(data[0], ('dim2',))})
+        for kwargs in ({}, {'all_slices': True}, {'nprocs': 2, 'executor': 'threads'}):
+            # 48 bytes per block: two slices of var1 and var3 at a time
+            blocked = FileDiffs(file1, file2, slice_block_bytes=48, **kwargs)
+            self.assertEqual(str(blocked), str(FileDiffs(file1, file2, **kwargs)))
+        self.assertEqual(blocked.num_vars_differ(), 1)
+        self.assertEqual(blocked.num_masks_differ(), 1)
+        self.assertEqual(blocked.num_dims_differ(), 4)
+
+    def test_executorUnknown_raisesError(self):
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(np.array([1.]), ('dim1',))})
+        with self.assertRaises(ValueError):
+            FileDiffs(file1, file1, executor='fibers')
+
+    # ------------------------------------------------------------------------
+    # Tests of max_chunk_bytes
+    # ------------------------------------------------------------------------
+
+    def test_maxChunkBytes_sameOutputAsUnchunked(self):
+        data1 = np.arange(24.).reshape((2,3,4))
+        data2 = data1.copy()
+        data2[1,2,3] = 100.
+        masked = np.ma.array(data1, mask=(data1 % 5 == 0))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data1, ('time','dim2','dim3')),
+                         'var2': NetcdfVariableFake(masked, ('time','dim2','dim3')),
+                         'var3': NetcdfVariableFake(np.array([1.,2.,3.]), ('dim4',))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data2, ('time','dim2','dim3')),
+                         'var2': NetcdfVariableFake(data2, ('time','dim2','dim3')),
+                         'var3': NetcdfVariableFake(np.array([1.,2.]), ('dim4',))})
+        for separate_dim in (None, 'time'):
+            unchunked = FileDiffs(file1, file2, separate_dim=separate_dim)
+            chunked = FileDiffs(file1, file2, separate_dim=separate_dim,
+                                max_chunk_bytes=24)
+            self.assertEqual(str(chunked), str(unchunked))
+            self.assertEqual(chunked.num_vars_differ(), unchunked.num_vars_differ())
+            self.assertEqual(chunked.num_dims_differ(), 1)
+
+    # ------------------------------------------------------------------------
+    # Tests of the byte-for-byte identical fast path
+    # ------------------------------------------------------------------------
+
+    def test_bytesEqual_sameOutputAsFullComparison(self):
+        data = np.arange(24.).reshape((2,3,4))
+        masked = np.ma.array(data, mask=(data % 5 == 0))
+        with_nan = data.copy()
+        with_nan[0,1,2] = np.nan
+        variables1 = {'var1': NetcdfVariableFake(data, ('time','dim2','dim3')),
+                      'var2': NetcdfVariableFake(masked, ('time','dim2','dim3')),
+                      'var3': NetcdfVariableFake(with_nan, ('time','dim2','dim3'))}
+        variables2 = {'var1': NetcdfVariableFake(data.copy(), ('time','dim2','dim3')),
+                      'var2': NetcdfVariableFake(masked.copy(), ('time','dim2','dim3')),
+                      'var3': NetcdfVariableFake(with_nan.copy(), ('time','dim2','dim3'))}
+        for separate_dim in (None, 'time'):
+            for max_chunk_bytes in (None, 24):
+                full = FileDiffs(NetcdfFileFake(self.FILENAME1, variables1),
+                                 NetcdfFileFake(self.FILENAME2, variables2),
+                                 separate_dim=separate_dim,
+                                 max_chunk_bytes=max_chunk_bytes)
+                fast = FileDiffs(NetcdfFileFakeBytesEqual(self.FILENAME1, variables1),
+                                 NetcdfFileFakeBytesEqual(self.FILENAME2, variables2),
+                                 separate_dim=separate_dim,
+                                 max_chunk_bytes=max_chunk_bytes)
+                self.assertEqual(str(fast), str(full))
+                # NaNs compare unequal, so var3 is reported as differing
+                self.assertTrue(fast.num_vars_differ() > 0)
+
+    # ------------------------------------------------------------------------
+    # Tests of check_data_identity
+    # ------------------------------------------------------------------------
+
+    def test_checkDataIdentity_withIdenticalData(self):
+        file1 = NetcdfFileFakeBytesEqual(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(np.array([1.,2.]))},
+            global_attributes = {'history': b'run 1'})
+        file2 = NetcdfFileFakeBytesEqual(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(np.array([1.,2.]))},
+            global_attributes = {'history': b'run 2'})
+        mydiffs = FileDiffs(file1, file2, check_data_identity=True)
+        self.assertFalse(mydiffs.files_differ())
+        self.assertEqual(mydiffs.num_vars(), 0)
+        mystr = str(mydiffs)
+        self.assertRegexMatches(mystr, "global attribute history")
+        self.assertRegexMatches(mystr, "seem to be IDENTICAL")
+
+    def test_checkDataIdentity_withDifferentData(self):
+        file1 = NetcdfFileFakeBytesEqual(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(np.array([1.,2.]))})
+        file2 = NetcdfFileFakeBytesEqual(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(np.array([1.,3.]))})
+        mydiffs = FileDiffs(file1, file2, check_data_identity=True)
+        self.assertTrue(mydiffs.files_differ())
+        self.assertEqual(mydiffs.num_vars(), 1)
+
+    def test_checkDataIdentity_withNaNs_sameAsDefault(self):
+        # NaNs compare unequal, so identical data with NaNs are reported as
+        # differing, with or without the check
+        data = np.array([1., np.nan])
+        file1 = NetcdfFileFakeBytesEqual(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data)})
+        file2 = NetcdfFileFakeBytesEqual(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data.copy())})
+        self.assertTrue(file1.data_section_equal(file2))
+        mydiffs = FileDiffs(file1, file2, check_data_identity=True)
+        self.assertTrue(mydiffs.files_differ())
+        self.assertEqual(str(mydiffs), str(FileDiffs(file1, file2)))
+
+    def test_checkDataIdentity_withMaskedNaNs(self):
+        # Masked NaNs are not compared, so the data are reported as identical
+        data = np.ma.array([1., np.nan], mask=[False, True])
+        file1 = NetcdfFileFakeBytesEqual(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data)})
+        file2 = NetcdfFileFakeBytesEqual(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data.copy())})
+        mydiffs = FileDiffs(file1, file2, check_data_identity=True)
+        self.assertFalse(mydiffs.files_differ())
+        self.assertEqual(mydiffs.num_vars(), 0)
+
+    # ------------------------------------------------------------------------
+    # Tests of all_slices
+    # ------------------------------------------------------------------------
+
+    def test_allSlices_sameAsWholeVariable(self):
+        data1 = np.array([[1.,2.,3.],[4.,5.,6.]])
+        data2 = np.array([[1.,2.,8.],[4.,7.,6.]])
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data1, ('dim1', 'dim2'))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data2, ('dim1', 'dim2'))})
+        mydiffs = FileDiffs(file1, file2, separate_dim='dim2', all_slices=True)
+        mystr = str(mydiffs)
+        expected = "var1  dim2 index:    All    All\n" + \
+                   str(VarDiffs('var1', data1, data2))
+        self.assertTrue(expected in mystr)
+        # The combined statistics appear after the individual slices, and do
+        # not affect the counts
+        self.assertTrue(mystr.index("All") > mystr.index("index:      3"))
+        self.assertEqual(mydiffs.num_vars(), 3)
+        self.assertEqual(mydiffs.num_vars_differ(), 2)
+
+    def test_allSlices_skipsVariablesWithUnanalyzedSlices(self):
+        data1 = np.array([[1.,2.,3.],[4.,5.,6.]])
+        data2 = np.array([[1.,2.],[4.,7.]])
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data1, ('dim1', 'dim2'))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data2, ('dim1', 'dim2'))})
+        mydiffs = FileDiffs(file1, file2, separate_dim='dim2', all_slices=True)
+        self.assertNotRegexMatches(str(mydiffs), "All")
+
+    # ------------------------------------------------------------------------
+    # Tests of stream
+    # ------------------------------------------------------------------------
+
+    def create_stream_test_files(self):
+        data = np.arange(6.).reshape((2,3))
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'var1': NetcdfVariableFake(data, ('time','dim2')),
+                         'Var2': NetcdfVariableFake(data[0], ('dim2',)),
+                         'var3': NetcdfVariableFake(data, ('time','dim2'))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'var1': NetcdfVariableFake(data + 1., ('time','dim2')),
+                         'Var2': NetcdfVariableFake(data[0], ('dim2',)),
+                         'var4': NetcdfVariableFake(data, ('time','dim2'))})
+        return (file1, file2)
+
+    def test_stream_sameOutputAsDefault(self):
+        (file1, file2) = self.create_stream_test_files()
+        for kwargs in ({}, {'all_slices': True}, {'separate_dim': None},
+                       {'nprocs': 2, 'executor': 'threads'}):
+            stream = StringIO()
+            streamed = FileDiffs(file1, file2, stream=stream, **kwargs)
+            self.assertEqual(stream.getvalue() + str(streamed),
+                             str(FileDiffs(file1, file2, **kwargs)))
+
+    def test_getSummary_sameCountsAsFileDiffs(self):
+        (file1, file2) = self.create_stream_test_files()
+        mydiffs = FileDiffs(file1, file2)
+        summary = mydiffs.get_summary()
+        self.assertTrue(summary.is_complete())
+        self.assertEqual(summary.num_vars(), mydiffs.num_vars())
+        self.assertEqual(summary.num_vars_differ(), 2)
+        self.assertTrue(summary.files_differ())
+        self.assertTrue(str(mydiffs).endswith(str(summary)))
+
+    def test_stream_keepsCounts(self):
+        (file1, file2) = self.create_stream_test_files()
+        streamed = FileDiffs(file1, file2, stream=StringIO())
+        self.assertEqual(streamed.num_vars(), 7)
+        self.assertEqual(streamed.num_vars_differ(), 2)
+        self.assertEqual(streamed.num_nonshared_fields(), 4)
+        self.assertTrue(streamed.files_differ())
+        self.assertTrue(str(streamed).startswith("SUMMARY of cprnc:"))
+
+    # ------------------------------------------------------------------------
+    # Tests of stop_on_first_difference
+    # ------------------------------------------------------------------------
+
+    def create_fail_fast_test_files(self, big2_differs=False):
+        """Create two files with a small variable that differs and two big
+        variables, one of which may differ in shape"""
+        big = np.arange(100.).reshape((2,50))
+        big2 = np.arange(150.).reshape((3,50)) if big2_differs else big
+        file1 = NetcdfFileFake(
+            self.FILENAME1,
+            variables = {'small': NetcdfVariableFake(np.array([1.,2.]), ('dim2',)),
+                         'big1': NetcdfVariableFake(big, ('time','dim3')),
+                         'big2': NetcdfVariableFake(big, ('time','dim3'))})
+        file2 = NetcdfFileFake(
+            self.FILENAME2,
+            variables = {'small': NetcdfVariableFake(np.array([1.,3.]), ('dim2',)),
+                         'big1': NetcdfVariableFake(big, ('time','dim3')),
+                         'big2': NetcdfVariableFake(big2, ('time','dim3'))})
+        return (file1, file2)
+
+    def test_stopOnFirstDifference_stopsAfterCheapestDifference(self):
+        (file1, file2) = self.create_fail_fast_test_files()
+        mydiffs = FileDiffs(file1, file2, stop_on_first_difference=True)
+        self.assertTrue(mydiffs.files_differ())
+        self.assertTrue(mydiffs.stopped_early())
+        self.assertEqual(mydiffs.num_vars(), 1)
+        self.assertRegexMatches(str(mydiffs), "Stopped at the first difference")
+
+    def test_stopOnFirstDifference_withDimSizeDiff_comparesItFirst(self):
+        (file1, file2) = self.create_fail_fast_test_files(big2_differs=True)
+        mydiffs = FileDiffs(file1, file2, separate_dim=None,
+                            stop_on_first_difference=True)
+        self.assertEqual(mydiffs.num_vars(), 1)
+        self.assertEqual(mydiffs.num_dims_differ(), 1)
+
+    def test_stopOnFirstDifference_withIdenticalFiles_sameAsDefault(self):
+        (file1, file2) = self.create_fail_fast_test_files()
+        mydiffs = FileDiffs(file1, file1, stop_on_first_difference=True)
+        self.assertFalse(mydiffs.files_differ())
+        self.assertFalse(mydiffs.stopped_early())
+        self.assertEqual(str(mydiffs), str(FileDiffs(file1, file1)))
+
+    def test_stopOnFirstDifference_withPrefetch_skipsOtherTasks(self):
+        (file1, file2) = self.create_fail_fast_test_files()
+        mydiffs = FileDiffs(file1, file2, prefetch_depth=1, record_scan=True,
+                            stop_on_first_difference=True)
+        self.assertTrue(mydiffs.files_differ())
+        self.assertTrue(mydiffs.stopped_early())
+        self.assertTrue(mydiffs.num_vars() < 5)
+
+    def test_stopOnFirstDifference_withThreadsAndStream(self):
+        (file1, file2) = self.create_fail_fast_test_files()
+        stream = StringIO()
+        mydiffs = FileDiffs(file1, file2, nprocs=2, executor='threads',
+                            stream=stream, stop_on_first_difference=True)
+        self.assertTrue(mydiffs.files_differ())
+        self.assertRegexMatches(stream.getvalue(), "small")
+
 if __name__ == '__main__':
     unittest.main()
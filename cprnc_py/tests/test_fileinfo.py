@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+from cprnc_py.fileinfo import FileInfo
+from cprnc_py.netcdf.netcdf_file_fake import NetcdfFileFake
+from cprnc_py.netcdf.netcdf_variable_fake import NetcdfVariableFake
+import numpy as np
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+
+class TestFileinfo(CustomAssertions):
+
+    FILENAME = 'foo.nc'
+
+    # ------------------------------------------------------------------------
+    # Helper methods
+    # ------------------------------------------------------------------------
+
+    def create_file(self):
+        """Create a file with a time variable, a variable on time, and a
+        timeless variable"""
+        return NetcdfFileFake(
+            self.FILENAME,
+            variables = {
+                'time': NetcdfVariableFake(np.array([0., 1., 2.]), ('time',)),
+                'var1': NetcdfVariableFake(np.arange(12.).reshape((3,4)),
+                                           ('time','dim2')),
+                'var2': NetcdfVariableFake(np.array([5., -5.]), ('dim3',))})
+
+    # ------------------------------------------------------------------------
+    # Tests of str
+    # ------------------------------------------------------------------------
+
+    def test_str_separateDim_countsEachSlice(self):
+        finfo = FileInfo(self.create_file(), separate_dim='time')
+        # 3 slices of each of time and var1, plus var2
+        self.assertRegexMatches(str(finfo), "A total of +7 fields were analyzed")
+
+    def test_str_noSeparateDim(self):
+        finfo = FileInfo(self.create_file(), separate_dim=None)
+        self.assertRegexMatches(str(finfo), "A total of +3 fields were analyzed")
+
+    # ------------------------------------------------------------------------
+    # Tests of nprocs and executor
+    # ------------------------------------------------------------------------
+
+    def test_nprocs_sameOutputAsSerial(self):
+        ncfile = self.create_file()
+        self.assertEqual(str(FileInfo(ncfile, nprocs=2)), str(FileInfo(ncfile)))
+
+    def test_executorThreads_sameOutputAsSerial(self):
+        ncfile = self.create_file()
+        self.assertEqual(str(FileInfo(ncfile, nprocs=2, executor='threads')),
+                         str(FileInfo(ncfile)))
+
+    # ------------------------------------------------------------------------
+    # Tests of slice_block_bytes
+    # ------------------------------------------------------------------------
+
+    def test_sliceBlockBytes_sameOutputAsDefault(self):
+        ncfile = self.create_file()
+        # Blocks of 2 slices of var1 and one of 1 slice
+        self.assertEqual(str(FileInfo(ncfile, slice_block_bytes=64)),
+                         str(FileInfo(ncfile)))
+
+    def test_sliceBlockBytes_withSlicesAlongInnerDim_sameOutputAsDefault(self):
+        data = np.ma.array(np.arange(12.).reshape((4,3)),
+                           mask=[[False]*3, [False, True, False]] + [[False]*3]*2)
+        ncfile = NetcdfFileFake(
+            self.FILENAME,
+            variables = {'var1': NetcdfVariableFake(data, ('dim1','time'))})
+        self.assertEqual(str(FileInfo(ncfile, slice_block_bytes=1000)),
+                         str(FileInfo(ncfile)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import shutil
+import tempfile
+import numpy as np
+from os.path import join
+from cprnc_py.filediffs import FileDiffs
+from cprnc_py.manifest import write_manifest
+from cprnc_py.netcdf.netcdf_file_fake import NetcdfFileFake
+from cprnc_py.netcdf.netcdf_file_manifest import NetcdfFileManifest
+from cprnc_py.netcdf.netcdf_variable_fake import NetcdfVariableFake
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+
+class TestManifest(CustomAssertions):
+
+    # Fake files are not actually on disk, so the baseline is never available
+    FILENAME1 = 'nonexistent_foo1.nc'
+    FILENAME2 = 'nonexistent_foo2.nc'
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._manifest_filename = join(self._tempdir, 'foo1.manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    def create_file(self, filename, var1_data):
+        """Create a fake file with a variable var1(time, dim2) with the given
+        data and a variable var2 without a time dimension"""
+
+        masked = np.ma.array([1., 2., 3.], mask=[False, True, False])
+        return NetcdfFileFake(
+            filename,
+            variables = {'var1': NetcdfVariableFake(var1_data, ('time', 'dim2')),
+                         'var2': NetcdfVariableFake(masked, ('dim3',)),
+                         'var3': NetcdfVariableFake(np.array([b'a']), ('dim4',),
+                                                    is_numeric=False)})
+
+    def test_fromManifest_withIdenticalData_sameAsFullComparison(self):
+        data = np.arange(6.).reshape((2,3))
+        file1 = self.create_file(self.FILENAME1, data)
+        file2 = self.create_file(self.FILENAME2, data.copy())
+        write_manifest(file1, self._manifest_filename, separate_dim='time')
+        manifest = NetcdfFileManifest(self._manifest_filename)
+
+        expected = FileDiffs(file1, file2, separate_dim='time', all_slices=True)
+        mydiffs = FileDiffs(manifest, file2, separate_dim='time', all_slices=True)
+        self.assertEqual(str(mydiffs), str(expected))
+        self.assertFalse(mydiffs.files_differ())
+
+    def test_fromManifest_withDifferentData_baselineUnavailable(self):
+        data = np.arange(6.).reshape((2,3))
+        file1 = self.create_file(self.FILENAME1, data)
+        data2 = data.copy()
+        data2[1,2] = 100.
+        file2 = self.create_file(self.FILENAME2, data2)
+        write_manifest(file1, self._manifest_filename, separate_dim='time')
+        manifest = NetcdfFileManifest(self._manifest_filename)
+
+        mydiffs = FileDiffs(manifest, file2, separate_dim='time')
+        self.assertTrue(mydiffs.files_differ())
+        # Only the second time slice of var1 differs
+        self.assertEqual(mydiffs.num_vars_differ(), 1)
+        self.assertRegexMatches(str(mydiffs), "data are not available")
+
+    def test_fromManifest_withDifferentSeparateDim_baselineUnavailable(self):
+        # Without digests for the requested slices, nothing can be shown to be
+        # identical
+        data = np.arange(6.).reshape((2,3))
+        file1 = self.create_file(self.FILENAME1, data)
+        file2 = self.create_file(self.FILENAME2, data.copy())
+        write_manifest(file1, self._manifest_filename, separate_dim='time')
+        manifest = NetcdfFileManifest(self._manifest_filename)
+
+        mydiffs = FileDiffs(manifest, file2, separate_dim=None)
+        self.assertEqual(mydiffs.num_vars_differ(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
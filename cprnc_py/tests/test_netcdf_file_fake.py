@@ -18,5 +18,26 @@ class TestNetcdfFileFake(CustomAssertions):
         mydims = sorted(fl.get_dimlist())
         self.assertEqual(['dim1','dim2','dim3'], mydims)
 
+    def test_get_varlist_bydim(self):
+        var1 = NetcdfVariableFake(np.zeros((2,3)), dimnames=['dim2','dim1'])
+        var2 = NetcdfVariableFake(np.zeros(3), dimnames=['dim1'])
+        var3 = NetcdfVariableFake(np.zeros(2), dimnames=['dim2'])
+        fl = NetcdfFileFake('myfile', variables = {'var3':var3, 'var2':var2,
+                                                   'var1':var1})
+        expected = [('var2', None),
+                    ('var1', 0), ('var3', 0),
+                    ('var1', 1), ('var3', 1)]
+        self.assertEqual(expected, list(fl.get_varlist_bydim('dim2')))
+
+    def test_get_varlist_bydim_afterAddVariable(self):
+        var1 = NetcdfVariableFake(np.zeros(2), dimnames=['dim1'])
+        fl = NetcdfFileFake('myfile', variables = {'var1':var1})
+        self.assertEqual([('var1', 0), ('var1', 1)],
+                         list(fl.get_varlist_bydim('dim1')))
+        fl.add_variable('var2', NetcdfVariableFake(np.zeros(3), dimnames=['dim2']))
+        self.assertEqual([('var2', None), ('var1', 0), ('var1', 1)],
+                         list(fl.get_varlist_bydim('dim1')))
+        self.assertEqual(3, fl.get_dimsize('dim2'))
+
 if __name__ == '__main__':
     unittest.main()
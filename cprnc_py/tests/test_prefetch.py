@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import threading
+from cprnc_py.prefetch import prefetch
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+
+class TestPrefetch(CustomAssertions):
+
+    def test_prefetch_yieldsItemsInOrder(self):
+        results = list(prefetch(lambda item: item * 2, range(10), depth=3))
+        self.assertEqual(results, [(item, item * 2) for item in range(10)])
+
+    def test_prefetch_withNoItems(self):
+        self.assertEqual(list(prefetch(lambda item: item, [], depth=2)), [])
+
+    def test_prefetch_readsAtMostDepthAhead(self):
+        read = []
+        lock = threading.Lock()
+        def read_func(item):
+            with lock:
+                read.append(item)
+            return item
+        for (item, data) in prefetch(read_func, range(10), depth=2):
+            # Items item+1 and item+2 may have been read, but no more
+            with lock:
+                self.assertTrue(len(read) <= item + 3)
+
+    def test_prefetch_withMaxBytes_readsOneAtATime(self):
+        read = []
+        lock = threading.Lock()
+        def read_func(item):
+            with lock:
+                read.append(item)
+            return item
+        for (item, data) in prefetch(read_func, range(10), depth=5, max_bytes=10,
+                                     size_func=lambda data: 10):
+            with lock:
+                self.assertTrue(len(read) <= item + 2)
+
+    def test_prefetch_withReadError_raisesError(self):
+        def read_func(item):
+            if item == 3:
+                raise KeyError(item)
+            return item
+        results = []
+        with self.assertRaises(KeyError):
+            for (item, data) in prefetch(read_func, range(10), depth=2):
+                results.append(item)
+        self.assertEqual(results, [0, 1, 2])
+
+    def test_prefetch_stoppingEarly_stopsReader(self):
+        read = []
+        generator = prefetch(read.append, range(1000), depth=2)
+        next(generator)
+        generator.close()
+        # close waits for the reader thread to stop
+        self.assertTrue(len(read) <= 4)
+
+    def test_prefetch_withZeroDepth_raisesError(self):
+        with self.assertRaises(ValueError):
+            list(prefetch(lambda item: item, range(2), depth=0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+import numpy.ma as ma
+from cprnc_py.result_store import (ResultStore, pack_vardiffs, unpack_vardiffs,
+                                   unpack_diff_stats, row_flag, ROW_DTYPE)
+from cprnc_py.vardiffs import (VarDiffs, VarDiffsNonNumeric, VarDiffsUnsharedVar,
+                               VarDiffsDimSizeDiff, VarDiffsDataUnavailable)
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+
+class TestResultStore(CustomAssertions):
+
+    # ------------------------------------------------------------------------
+    # Helper methods
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def create_vardiffs():
+        """Return a VarDiffs object for two 2x2 variables that differ in one
+        point and in their masks"""
+        var1 = ma.array([[1., 2.], [3., 4.]], mask=[[False, True], [False, False]])
+        var2 = np.array([[1., 2.], [3.5, 4.]], dtype=np.float32)
+        return VarDiffs('foo', var1, var2)
+
+    # ------------------------------------------------------------------------
+    # Tests of pack_vardiffs and unpack_vardiffs
+    # ------------------------------------------------------------------------
+
+    def test_unpackVardiffs_sameAsOriginal(self):
+        var_diffs = self.create_vardiffs()
+        unpacked = unpack_vardiffs('foo', pack_vardiffs(var_diffs), (2, 2))
+        self.assertEqual(str(unpacked), str(var_diffs))
+        self.assertTrue(unpacked.vars_differ())
+        self.assertTrue(unpacked.masks_differ())
+
+    def test_unpackDiffStats_sameAsOriginal(self):
+        stats = self.create_vardiffs().get_stats()
+        unpacked = unpack_diff_stats(pack_vardiffs(self.create_vardiffs()))
+        self.assertEqual(vars(unpacked.var1), vars(stats.var1))
+        self.assertEqual(vars(unpacked.var2), vars(stats.var2))
+        for attr in ('num_mask_diffs', 'num_compared', 'num_diffs', 'sum_sq_diff',
+                     'rdiff_max', 'rdiff_maxloc', 'rdiff_log10_sum'):
+            self.assertEqual(getattr(unpacked, attr), getattr(stats, attr))
+
+    def test_unpackDiffStats_withNoDiffsOrValidPoints(self):
+        var = ma.array([1., 2.], mask=[True, True])
+        unpacked = unpack_diff_stats(pack_vardiffs(VarDiffs('foo', var, var)))
+        self.assertIsNone(unpacked.rdiff_max)
+        self.assertIsNone(unpacked.rdiff_maxloc)
+        self.assertIsNone(unpacked.var1.max_val)
+        self.assertIsNone(unpacked.var2.min_loc)
+
+    def test_unpackVardiffs_withOtherKinds(self):
+        for var_diffs in (VarDiffsNonNumeric('foo'), VarDiffsDimSizeDiff('foo'),
+                          VarDiffsDataUnavailable('foo'), VarDiffsUnsharedVar('foo', 2)):
+            unpacked = unpack_vardiffs('foo', pack_vardiffs(var_diffs), None)
+            self.assertEqual(type(unpacked), type(var_diffs))
+            self.assertEqual(str(unpacked), str(var_diffs))
+
+    # ------------------------------------------------------------------------
+    # Tests of row_flag
+    # ------------------------------------------------------------------------
+
+    def test_rowFlag_sameAsVardiffs(self):
+        var_diffs_list = [self.create_vardiffs(), VarDiffsNonNumeric('bar'),
+                          VarDiffsDimSizeDiff('baz'), VarDiffsDataUnavailable('qux'),
+                          VarDiffsUnsharedVar('quux', 1)]
+        rows = np.array([pack_vardiffs(var_diffs) for var_diffs in var_diffs_list],
+                        dtype=ROW_DTYPE)
+        for name in ('vars_differ', 'masks_differ', 'dims_differ',
+                     'could_not_be_analyzed', 'fields_nonshared'):
+            expected = [getattr(var_diffs, name)() for var_diffs in var_diffs_list]
+            self.assertEqual(list(row_flag(rows, name)), expected)
+            self.assertEqual(row_flag(rows[0], name), expected[0])
+
+    def test_rowFlag_unknown_raisesError(self):
+        with self.assertRaises(ValueError):
+            row_flag(np.zeros(1, dtype=ROW_DTYPE), 'foo')
+
+    # ------------------------------------------------------------------------
+    # Tests of ResultStore
+    # ------------------------------------------------------------------------
+
+    def test_resultStore_getVardiffs(self):
+        store = ResultStore(3)
+        store.set(2, 'foo', 5, pack_vardiffs(self.create_vardiffs()), (2, 2))
+        self.assertFalse(store.is_set(0))
+        self.assertTrue(store.is_set(2))
+        self.assertEqual(store.get_varname(2), 'foo')
+        self.assertEqual(store.get_index(2), 5)
+        self.assertEqual(str(store.get_vardiffs(2)), str(self.create_vardiffs()))
+
+    def test_resultStore_withNonNumericRowFirst_keepsShape(self):
+        store = ResultStore(2)
+        store.set(0, 'foo', 1, pack_vardiffs(VarDiffsUnsharedVar('foo', 2)), None)
+        store.set(1, 'foo', 0, pack_vardiffs(self.create_vardiffs()), (2, 2))
+        self.assertEqual(str(store.get_vardiffs(1)), str(self.create_vardiffs()))
+
+if __name__ == '__main__':
+    unittest.main()
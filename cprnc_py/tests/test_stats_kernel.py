@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+import math
+import numpy as np
+import numpy.ma as ma
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+from cprnc_py.stats_kernel import (compute_var_stats, compute_var_stats_chunked,
+                                   compute_diff_stats, compute_diff_stats_chunked,
+                                   compute_var_stats_slices, compute_diff_stats_slices,
+                                   VarStatsAccumulator)
+
+class TestStatsKernel(CustomAssertions):
+
+    # Small block size, so that the tests exercise accumulation across blocks
+    BLOCK_SIZE = 3
+
+    # ------------------------------------------------------------------------
+    # Tests of compute_var_stats
+    # ------------------------------------------------------------------------
+
+    def test_varStats_withUnmaskedData(self):
+        var = np.array([[3., -7., 2.], [9., 1., 9.]])
+        stats = compute_var_stats(var, block_size=self.BLOCK_SIZE)
+        self.assertEqual(stats.num_elements, 6)
+        self.assertEqual(stats.num_valid, 6)
+        self.assertEqual(stats.max_val, 9.)
+        # The first of the two maxima is kept
+        self.assertEqual(stats.max_loc, 3)
+        self.assertEqual(stats.min_val, -7.)
+        self.assertEqual(stats.min_loc, 1)
+        self.assertAlmostEqual(stats.mean_absval(), 31./6.)
+
+    def test_varStats_withMaskedData(self):
+        var = ma.array([5., 1., 8., 2., -4., 3.],
+                       mask=[True, False, True, False, True, False])
+        stats = compute_var_stats(var, block_size=self.BLOCK_SIZE)
+        self.assertEqual(stats.num_elements, 6)
+        self.assertEqual(stats.num_valid, 3)
+        self.assertEqual(stats.max_val, 3.)
+        self.assertEqual(stats.max_loc, 5)
+        self.assertEqual(stats.min_val, 1.)
+        self.assertEqual(stats.min_loc, 1)
+        self.assertAlmostEqual(stats.mean_absval(), 2.)
+
+    def test_varStats_withMaskedData_locatesExtremesInLaterBlocks(self):
+        var = ma.array([1., 2., 3., 0., 7., 9., 9., -5., 4.],
+                       mask=[False, True, False, True, True, False, False, False, True])
+        stats = compute_var_stats(var, block_size=self.BLOCK_SIZE)
+        self.assertEqual(stats.max_val, 9.)
+        self.assertEqual(stats.max_loc, 5)
+        self.assertEqual(stats.min_val, -5.)
+        self.assertEqual(stats.min_loc, 7)
+
+    def test_varStats_withBigEndianData_sameAsNative(self):
+        var = ma.array([3., -7., 2., 9., 1., 9.],
+                       mask=[False, False, True, False, False, False])
+        stats_native = compute_var_stats(var, block_size=self.BLOCK_SIZE)
+        stats_big = compute_var_stats(var.astype('>f8'), block_size=self.BLOCK_SIZE)
+        self.assertEqual(stats_big.to_dict(), stats_native.to_dict())
+
+    def test_varStats_withAllMasked(self):
+        var = ma.array([1., 2.], mask=[True, True])
+        stats = compute_var_stats(var, block_size=self.BLOCK_SIZE)
+        self.assertEqual(stats.num_valid, 0)
+        self.assertIsNone(stats.max_val)
+        self.assertEqual(stats.mean_absval(), 0)
+
+    def test_varStats_withNaN(self):
+        var = np.array([1., 2., 3., np.nan, 5.])
+        stats = compute_var_stats(var, block_size=self.BLOCK_SIZE)
+        self.assertTrue(np.isnan(stats.max_val))
+        self.assertEqual(stats.max_loc, 3)
+
+    # ------------------------------------------------------------------------
+    # Tests of compute_diff_stats
+    # ------------------------------------------------------------------------
+
+    def test_diffStats_withIdenticalVars(self):
+        var = np.array([1., 2., 3., 4.])
+        stats = compute_diff_stats(var, var.copy(), block_size=self.BLOCK_SIZE)
+        self.assertFalse(stats.vars_differ())
+        self.assertFalse(stats.masks_differ())
+        self.assertEqual(stats.rmse(), 0.)
+        self.assertEqual(stats.num_compared, 4)
+
+    def test_diffStats_matchesDirectComputation(self):
+        var1 = np.array([[1., 2., 3.], [4., 0., 6.], [7., 8., -9.]])
+        var2 = np.array([[1., 2.5, 3.], [4., 0., 5.], [7., 8., 9.]])
+        stats = compute_diff_stats(var1, var2, block_size=self.BLOCK_SIZE)
+
+        diffs = var1 - var2
+        self.assertTrue(stats.vars_differ())
+        self.assertEqual(stats.num_diffs, 3)
+        self.assertAlmostEqual(stats.rmse(), np.sqrt((diffs ** 2).mean()))
+        norm = (np.abs(var1).mean() + np.abs(var2).mean()) / 2.
+        self.assertAlmostEqual(stats.normalized_rmse(), stats.rmse() / norm)
+
+        differ = diffs != 0
+        rdiff = np.abs(diffs[differ]) / np.maximum(np.abs(var1[differ]),
+                                                   np.abs(var2[differ]))
+        self.assertAlmostEqual(stats.rdiff_max, rdiff.max())
+        self.assertEqual(stats.rdiff_maxloc, 8)
+        self.assertAlmostEqual(stats.rdiff_logavg(),
+                               -np.log10(rdiff).sum() / 3.)
+
+        self.assertEqual(stats.var1.min_val, -9.)
+        self.assertEqual(stats.var2.max_loc, 8)
+
+    def test_diffStats_onlyComparesPointsValidInBoth(self):
+        var1 = ma.array([1., 2., 3., 4.], mask=[True, False, False, False])
+        var2 = ma.array([9., 2., 9., 4.], mask=[False, False, True, False])
+        stats = compute_diff_stats(var1, var2, block_size=self.BLOCK_SIZE)
+        self.assertFalse(stats.vars_differ())
+        self.assertTrue(stats.masks_differ())
+        self.assertEqual(stats.num_mask_diffs, 2)
+        self.assertEqual(stats.num_compared, 2)
+        self.assertEqual(stats.var1.num_valid, 3)
+        self.assertEqual(stats.var2.max_val, 9.)
+
+    def test_diffStats_withIntegers(self):
+        var1 = np.array([2**62, 5], dtype=np.int64)
+        var2 = np.array([2**62 + 1, 5], dtype=np.int64)
+        stats = compute_diff_stats(var1, var2, block_size=self.BLOCK_SIZE)
+        self.assertTrue(stats.vars_differ())
+
+    def test_diffStats_withFewDiffs(self):
+        # Few enough differences that only the differing points are worked on
+        var1 = np.arange(1., 21.)
+        var2 = var1.copy()
+        var2[[3, 15]] = [8., 12.]
+        stats = compute_diff_stats(var1, var2)
+        self.assertEqual(stats.num_diffs, 2)
+        self.assertEqual(stats.sum_sq_diff, 16. + 16.)
+        self.assertEqual(stats.rdiff_max, 0.5)
+        self.assertEqual(stats.rdiff_maxloc, 3)
+        self.assertAlmostEqual(stats.rdiff_log10_sum, math.log10(0.5) + math.log10(0.25))
+
+    def test_diffStats_withFewDiffsAndEqualInfinities(self):
+        # As when many points differ, the difference of the equal infinities
+        # makes the sum of squared differences NaN
+        var1 = np.array([np.inf] + [1.] * 9)
+        var2 = var1.copy()
+        var2[5] = 2.
+        stats = compute_diff_stats(var1, var2)
+        self.assertEqual(stats.num_diffs, 1)
+        self.assertTrue(np.isnan(stats.sum_sq_diff))
+        self.assertEqual(stats.rdiff_max, 0.5)
+
+    def test_diffStats_withDifferentShapes_raisesError(self):
+        with self.assertRaises(ValueError):
+            compute_diff_stats(np.array([1., 2.]), np.array([1., 2., 3.]))
+
+    # ------------------------------------------------------------------------
+    # Tests of the chunked versions
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def split(arr, boundaries):
+        """Split a flattened copy of arr at the given boundaries"""
+        return np.split(arr.ravel(), boundaries)
+
+    def test_varStatsChunked_sameAsUnchunked(self):
+        var = ma.array(np.linspace(-1., 1., 11) ** 3,
+                       mask=[False]*4 + [True] + [False]*6)
+        expected = compute_var_stats(var, block_size=self.BLOCK_SIZE)
+        actual = compute_var_stats_chunked(self.split(var, [1, 2, 7]),
+                                           block_size=self.BLOCK_SIZE)
+        self.assertEqual(vars(actual), vars(expected))
+
+    def test_diffStatsChunked_sameAsUnchunked(self):
+        var1 = np.linspace(-1., 1., 11) ** 3
+        var2 = ma.array(var1 * 1.1, mask=[False]*9 + [True] + [False])
+        expected = compute_diff_stats(var1, var2, block_size=self.BLOCK_SIZE)
+        pieces1 = self.split(var1, [2, 4, 5, 10])
+        pieces2 = self.split(var2, [2, 4, 5, 10])
+        actual = compute_diff_stats_chunked(zip(pieces1, pieces2),
+                                            block_size=self.BLOCK_SIZE)
+        self.assertEqual(vars(actual.var1), vars(expected.var1))
+        self.assertEqual(vars(actual.var2), vars(expected.var2))
+        for attr in ('num_mask_diffs', 'num_compared', 'num_diffs', 'sum_sq_diff',
+                     'rdiff_max', 'rdiff_maxloc', 'rdiff_log10_sum'):
+            self.assertEqual(getattr(actual, attr), getattr(expected, attr))
+
+    def test_diffStatsChunked_withChunksOfDifferentSizes_raisesError(self):
+        with self.assertRaises(ValueError):
+            compute_diff_stats_chunked([(np.array([1., 2.]), np.array([1.]))])
+
+    # ------------------------------------------------------------------------
+    # Tests of compute_var_stats_slices and compute_diff_stats_slices
+    # ------------------------------------------------------------------------
+
+    def assertDiffStatsEqual(self, actual, expected):
+        self.assertEqual(vars(actual.var1), vars(expected.var1))
+        self.assertEqual(vars(actual.var2), vars(expected.var2))
+        for attr in ('num_mask_diffs', 'num_compared', 'num_diffs', 'sum_sq_diff',
+                     'sum_abs1', 'sum_abs2', 'rdiff_max', 'rdiff_maxloc',
+                     'rdiff_log10_sum'):
+            self.assertEqual(getattr(actual, attr), getattr(expected, attr))
+
+    def test_varStatsSlices_sameAsEachSlice(self):
+        var = (np.linspace(-1., 1., 24) ** 3).reshape((4, 2, 3)).astype('>f4')
+        actual = compute_var_stats_slices(var, block_size=6)
+        self.assertEqual(len(actual), 4)
+        for (i, stats) in enumerate(actual):
+            self.assertEqual(vars(stats), vars(compute_var_stats(var[i], block_size=6)))
+
+    def test_varStatsSlices_withRandomData_sameAsEachSlice(self):
+        # Sums of many values with a wide range of magnitudes depend on the
+        # order of the reductions, so this checks that it is the same
+        random = np.random.RandomState(0)
+        for dtype in ('f4', '>f8'):
+            var = (random.standard_normal((7, 301)) *
+                   10. ** random.uniform(-5., 5., (7, 301))).astype(dtype)
+            actual = compute_var_stats_slices(var)
+            for (i, stats) in enumerate(actual):
+                self.assertEqual(vars(stats), vars(compute_var_stats(var[i])))
+
+    def test_diffStatsSlices_withRandomData_sameAsEachSlice(self):
+        random = np.random.RandomState(1)
+        var1 = random.standard_normal((7, 301)) * 10. ** random.uniform(-5., 5., (7, 301))
+        var2 = var1 + random.standard_normal((7, 301))
+        actual = compute_diff_stats_slices(var1, var2)
+        for (i, stats) in enumerate(actual):
+            self.assertDiffStatsEqual(stats, compute_diff_stats(var1[i], var2[i]))
+
+    def test_varStatsSlices_withLargeMaskedSlices_sameAsEachSlice(self):
+        var = ma.array(np.arange(12.).reshape((2, 6)) - 5.,
+                       mask=[[False]*6, [False, True] + [False]*4])
+        actual = compute_var_stats_slices(var, block_size=self.BLOCK_SIZE)
+        for (i, stats) in enumerate(actual):
+            self.assertEqual(vars(stats),
+                             vars(compute_var_stats(var[i], block_size=self.BLOCK_SIZE)))
+
+    def test_diffStatsSlices_sameAsEachSlice(self):
+        var1 = (np.linspace(-1., 1., 15) ** 3).reshape((5, 3))
+        var2 = var1.copy()
+        var2[1, 2] = 4.
+        var2[3, :] *= 1.5
+        actual = compute_diff_stats_slices(var1, var2, block_size=self.BLOCK_SIZE)
+        self.assertEqual([stats.num_diffs for stats in actual], [0, 1, 0, 3, 0])
+        for (i, stats) in enumerate(actual):
+            self.assertDiffStatsEqual(
+                stats, compute_diff_stats(var1[i], var2[i], block_size=self.BLOCK_SIZE))
+
+    def test_diffStatsSlices_withMaskedData_sameAsEachSlice(self):
+        var1 = np.arange(6.).reshape((3, 2))
+        var2 = ma.array(var1 + 1., mask=[[False, False], [True, False], [False, False]])
+        actual = compute_diff_stats_slices(var1, var2, block_size=self.BLOCK_SIZE)
+        for (i, stats) in enumerate(actual):
+            self.assertDiffStatsEqual(
+                stats, compute_diff_stats(var1[i], var2[i], block_size=self.BLOCK_SIZE))
+
+    def test_diffStatsSlices_withDifferentShapes_raisesError(self):
+        with self.assertRaises(ValueError):
+            compute_diff_stats_slices(np.zeros((2, 3)), np.zeros((3, 2)))
+
+    # ------------------------------------------------------------------------
+    # Tests of merge and embedded
+    # ------------------------------------------------------------------------
+
+    def test_varStatsMerge_sameAsUnsplit(self):
+        var = np.array([4., -1., 7., 7., 0., -3., 2.])
+        expected = compute_var_stats(var)
+        part1 = compute_var_stats_chunked([var[:3]])
+        part2 = compute_var_stats_chunked([var[3:]], offset=3)
+        for merged in (part1.merge(part2), part2.merge(part1)):
+            self.assertEqual(vars(merged), vars(expected))
+
+    def test_varStatsMerge_keepsFirstOfEqualExtremes(self):
+        var = np.array([1., 5., 5., 1.])
+        part1 = compute_var_stats_chunked([var[:2]])
+        part2 = compute_var_stats_chunked([var[2:]], offset=2)
+        self.assertEqual(part2.merge(part1).max_loc, 1)
+        self.assertEqual(part2.merge(part1).min_loc, 0)
+
+    def test_varStatsMerge_isAssociative(self):
+        var = ma.array([3., 9., -2., 8., 1., -2.],
+                       mask=[False, True, False, False, False, False])
+        parts = [compute_var_stats_chunked([var[i:i+2]], offset=i)
+                 for i in (0, 2, 4)]
+        left = parts[0].merge(parts[1]).merge(parts[2])
+        right = parts[0].merge(parts[1].merge(parts[2]))
+        self.assertEqual(vars(left), vars(right))
+        self.assertEqual(left.num_valid, 5)
+        self.assertEqual(left.min_loc, 2)
+        self.assertEqual(left.rms(), math.sqrt(82./5.))
+
+    def test_varStatsMerge_withEmptyAccumulator(self):
+        stats = compute_var_stats(np.array([1., 2.]))
+        merged = compute_var_stats(ma.array([3.], mask=[True])).merge(stats)
+        self.assertEqual(merged.max_val, 2.)
+        self.assertEqual(merged.num_elements, 3)
+
+    def test_varStatsToDict_roundTrips(self):
+        var = ma.array(np.array([3., -1., 2.], dtype=np.float32),
+                       mask=[False, False, True])
+        stats = compute_var_stats(var)
+        stats_dict = stats.to_dict()
+        self.assertTrue(all(not isinstance(value, np.generic)
+                            for value in stats_dict.values()))
+        self.assertEqual(vars(VarStatsAccumulator.from_dict(stats_dict)), vars(stats))
+
+    def test_diffStatsMerge_withEmbeddedSlices_sameAsWhole(self):
+        var1 = np.array([[1., 2., 3.], [4., 5., 6.]])
+        var2 = np.array([[1., 2., 9.], [4., 0., 6.]])
+        expected = compute_diff_stats(var1, var2)
+        slices = [compute_diff_stats(var1[:,i], var2[:,i]).embedded(var1.shape, 1, i)
+                  for i in range(3)]
+        merged = slices[2].merge(slices[0]).merge(slices[1])
+        self.assertEqual(vars(merged.var1), vars(expected.var1))
+        self.assertEqual(vars(merged.var2), vars(expected.var2))
+        for attr in ('num_mask_diffs', 'num_compared', 'num_diffs', 'sum_sq_diff',
+                     'rdiff_max', 'rdiff_maxloc'):
+            self.assertEqual(getattr(merged, attr), getattr(expected, attr))
+        self.assertAlmostEqual(merged.rdiff_log10_sum, expected.rdiff_log10_sum)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import unittest
+from cprnc_py.task_scheduler import schedule_batches
+from cprnc_py.test_utils.custom_assertions import CustomAssertions
+
+class TestTaskScheduler(CustomAssertions):
+
+    def test_scheduleBatches_coversEachTaskOnce(self):
+        costs = [5, 100, 1, 1, 30, 2, 0, 7]
+        batches = schedule_batches(costs, nworkers=2, task_overhead_cost=0)
+        self.assertSameItems(sum(batches, []), range(len(costs)))
+
+    def test_scheduleBatches_largestFirst(self):
+        costs = [1, 1000, 1, 500, 1, 1]
+        batches = schedule_batches(costs, nworkers=2, task_overhead_cost=0)
+        self.assertEqual(batches[0], [1])
+        self.assertEqual(batches[1], [3])
+
+    def test_scheduleBatches_cheapestFirst(self):
+        costs = [1000, 3, 500, 1, 2, 700]
+        batches = schedule_batches(costs, nworkers=2, task_overhead_cost=0,
+                                   cheapest_first=True)
+        self.assertEqual(sum(batches, []), [3, 4, 1, 2, 5, 0])
+
+    def test_scheduleBatches_batchesSmallTasks(self):
+        costs = [1] * 100
+        batches = schedule_batches(costs, nworkers=2, batches_per_worker=5,
+                                   task_overhead_cost=0)
+        self.assertEqual(len(batches), 10)
+        self.assertTrue(all(len(batch) == 10 for batch in batches))
+
+    def test_scheduleBatches_withNoTasks(self):
+        self.assertEqual(schedule_batches([], nworkers=4), [])
+
+if __name__ == '__main__':
+    unittest.main()
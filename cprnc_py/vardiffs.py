@@ -1,9 +1,7 @@
 from __future__ import print_function
 
 import numpy as np
-import numpy.ma as ma
-import math
-from cprnc_py.numpy_utils import compress_two_arrays
+from cprnc_py.stats_kernel import compute_diff_stats
 from cprnc_py.varinfo import VarInfo
 
 class VarDiffs(object):
@@ -41,14 +39,31 @@ class VarDiffs(object):
         """
 
         self._varname = varname
-        self._var1info = VarInfo(var1)
-        self._var2info = VarInfo(var2)
 
         # Compute all necessary statistics in initialization, so that we don't
         # have to hold onto the variables in memory for later use (in case the
         # variables consume a lot of memory).
         self._compute_stats(var1, var2)
 
+    @classmethod
+    def from_stats(cls, varname, stats, shape):
+        """Create a VarDiffs object from precomputed statistics.
+
+        This is useful when the statistics have been accumulated piece by piece
+        (e.g., for variables too large to hold in memory at once).
+
+        Arguments:
+        varname: string (just used for printing)
+        stats: DiffStatsAccumulator object
+        shape: tuple giving the shape of each of the variables described by
+            stats"""
+
+        vardiffs = cls.__new__(cls)
+        vardiffs._varname = varname
+        vardiffs._dims_differ = False
+        vardiffs._set_diff_stats(stats, shape)
+        return vardiffs
+
     def __str__(self):
         mystr = ""
         mystr += str(self._var1info)
@@ -97,128 +112,66 @@ class VarDiffs(object):
         """Return True if the fields are not shared"""
 
         return False
-    
+
+    def get_stats(self):
+        """Return the DiffStatsAccumulator object from which this object's
+        statistics were computed, or None if the dimensions differ.
+
+        The result can be merged with the statistics of other pieces of the
+        same variables (e.g., other slices along some dimension)."""
+
+        return self._stats
+
     # ------------------------------------------------------------------------
     # Private methods
     # ------------------------------------------------------------------------
 
     def _compute_stats(self, var1, var2):
         self._dims_differ = self._compute_dims_differ(var1, var2)
-        self._diffs = None
-        self._sums = None
         if (self.dims_differ()):
+            self._stats = None
+            self._var1info = VarInfo(var1)
+            self._var2info = VarInfo(var2)
             self._vars_differ = False
             self._masks_differ = False
             self._rmse = 0.
             self._normalized_rmse = 0.
-            self._relative_diffs = 0.
+            self._rdiff_max = np.nan
+            self._rdiff_maxloc = -1
+            self._rdiff_logavg = np.nan
         else:
-            self._masks_differ = self._compute_masks_differ(var1, var2)
-
-            # For performance reasons, create compressed versions of var1 and var2
-            (var1c, var2c) = compress_two_arrays(var1, var2)
-
-            # FIXME(wjs, 2016-01-04) Change the following to use pre-computed
-            # abs diff?: check if any abs diff is > 0:
-            self._vars_differ = not np.array_equal(var1c, var2c)
+            # Compute the statistics of both variables and of their differences
+            # in a single pass through the data
+            stats = compute_diff_stats(var1, var2)
+            self._set_diff_stats(stats, np.shape(var1))
 
-            self._rmse = self._compute_rmse(var1c, var2c)
-            self._normalized_rmse = self._compute_normalized_rmse(var1c, var2c)
-            self._rdiff_max, self._rdiff_maxloc, self._rdiff_logavg = self._compute_rdiff_stats(var1c, var2c)
+    def _set_diff_stats(self, stats, shape):
+        """Store statistics computed for two variables of the same shape.
 
-    def _compute_diffs(self, var1, var2):
-        """Computes the differences of var1 and var2
-
-        vars_differ must already be set for self."""
-        if self._diffs is None and self.vars_differ():
-            # Cache these for multiple uses
-            self._diffs = var1 - var2
-        return self._diffs
-
-    def _compute_sums(self, var1, var2):
-        """Computes the sums of var1 and var2
-
-        vars_differ must already be set for self."""
-        if self._sums == None and self.vars_differ():
-            # Cache these for multiple uses
-            self._sums = var1 + var2
-        return self._sums
-
-    def _compute_rdiff_stats(self, var1, var2):
-        """Compute the relative difference statistics of var1 and var2.
-
-        vars_differ must already be set for self."""
-        if (not self.vars_differ() or len(var1) == 0):
-            rdiff_max = np.float('nan')
-            rdiff_maxloc = -1
-            rdiff_logavg = np.float('nan')
+        Arguments:
+        stats: DiffStatsAccumulator object
+        shape: tuple giving the shape of each of the variables"""
+
+        self._stats = stats
+        self._var1info = VarInfo.from_stats(stats.var1, shape)
+        self._var2info = VarInfo.from_stats(stats.var2, shape)
+        self._masks_differ = stats.masks_differ()
+        self._vars_differ = stats.vars_differ()
+        self._rmse = stats.rmse()
+        self._normalized_rmse = stats.normalized_rmse()
+        if (self._vars_differ):
+            self._rdiff_max = stats.rdiff_max
+            self._rdiff_maxloc = stats.rdiff_maxloc
         else:
-            maxvals = np.maximum(np.abs(var1), np.abs(var2))
-            rdiff = np.abs(self._compute_diffs(var1, var2)) / maxvals
-            rdiff_max = np.max(rdiff)
-            rdiff_maxloc = np.argmax(rdiff)
-            differences = self._compute_diffs(var1, var2) != 0
-            numDiffs = np.sum(differences)
-            if numDiffs > 0:
-                # Compute the sum of logs by taking the products of the logands; +1 if the logand is 0
-                # Then take the log of the result
-                # Since the log(1) is 0, this does not affect the final sum
-                rdiff_prod = np.prod(rdiff[differences])
-                if rdiff_prod != np.float('inf') and rdiff_prod > 0.0:
-                    rdiff_logsum = -math.log10(rdiff_prod)
-                else:
-                    # We need to use a different (slower, less accurate) method of computing this,
-                    # the product either overflowed or underflowed due to the small exponent
-                    rdiff_logs = np.log10(rdiff[differences])
-                    rdiff_logsum = -np.sum(rdiff_logs)
-                rdiff_logavg = rdiff_logsum / np.sum(differences)
-            else:
-                rdiff_logavg = np.float('nan')
-        return rdiff_max, rdiff_maxloc, rdiff_logavg
+            self._rdiff_max = np.nan
+            self._rdiff_maxloc = -1
+        self._rdiff_logavg = stats.rdiff_logavg()
 
     def _compute_dims_differ(self, var1, var2):
-        if (var1.shape == var2.shape):
+        if (np.shape(var1) == np.shape(var2)):
             return False
         else:
             return True
-    
-    def _compute_masks_differ(self, var1, var2):
-        if (np.array_equal(
-            ma.getmaskarray(var1),
-            ma.getmaskarray(var2))):
-            return False
-        else:
-            return True
-
-    def _compute_diffcount(self, var1, var2):
-        if (self.vars_differ()):
-            diffs = self._compute_diffs(var1, var2)
-            diff_count = np.sum(diffs != 0)
-        else:
-            diff_count = 0
-        return diff_count
-
-    def _compute_rmse(self, var1, var2):
-        """Compute the RMS Error between var1 and var2.
-
-        vars_differ must already be set for self."""
-
-        if (self.vars_differ()):
-            rmse = np.sqrt((self._compute_diffs(var1, var2) ** 2).mean())
-        else:
-            rmse = 0.
-        return rmse
-
-    def _compute_normalized_rmse(self, var1, var2):
-        """Compute the normalized RMSE between var1 and var2.
-
-        vars_differ must already be set for self."""
-        if (self.vars_differ()):
-            norm = (np.average(np.abs(var1)) + np.average(np.abs(var2))) / 2.0
-            nrmse = self._compute_rmse(var1, var2) / norm
-        else:
-            nrmse = 0.
-        return nrmse
 
 class VarDiffsNonAnalyzable(object):
     """This version of VarDiffs is used for non-analyzable variables.
@@ -247,6 +200,9 @@ class VarDiffsNonAnalyzable(object):
     def could_not_be_analyzed(self):
         return True
 
+    def get_stats(self):
+        return None
+
 class VarDiffsNonNumeric(VarDiffsNonAnalyzable):
     """This version of VarDiffs is used for non-numeric variables.
 
@@ -270,6 +226,25 @@ class VarDiffsDimSizeDiff(VarDiffsNonAnalyzable):
     def dims_differ(self):
         return True
 
+class VarDiffsDataUnavailable(VarDiffsNonAnalyzable):
+    """This version of VarDiffs is used for variables that could not be shown to
+    be identical (e.g., because their digests differ), but whose data are not
+    available for a detailed comparison. These are counted as differing.
+
+    Usage is the same as for the standard VarDiffs.
+    """
+
+    def __str__(self):
+        mystr = "Variable could not be shown to be identical, and its data are not " + \
+                "available for a detailed comparison"
+        return mystr
+
+    def vars_differ(self):
+        return True
+
+    def could_not_be_analyzed(self):
+        return False
+
 class VarDiffsUnsharedVar(object):
     """This version of VarDiffs is used for variables which aren't shared.
 
@@ -297,6 +272,10 @@ class VarDiffsUnsharedVar(object):
             self._found_in_filenum, other_filenum)
         return mystr
 
+    def get_found_in_filenum(self):
+        """Return the file number in which the variable is found"""
+        return self._found_in_filenum
+
     def vars_differ(self):
         return False
 
@@ -311,3 +290,6 @@ class VarDiffsUnsharedVar(object):
 
     def could_not_be_analyzed(self):
         return False
+
+    def get_stats(self):
+        return None
@@ -1,8 +1,8 @@
 from __future__ import print_function
 
 import numpy as np
-import numpy.ma as ma
 from cprnc_py.print_utils import index_str
+from cprnc_py.stats_kernel import compute_var_stats
 
 class VarInfo(object):
     """This class computes and prints a variety of statistics about a single
@@ -30,11 +30,27 @@ class VarInfo(object):
         # Compute all necessary statistics in initialization, so that we don't
         # have to hold onto the variable in memory for later use (in case the
         # variable consumes a lot of memory).
-        if not ma.isMA(var):
-            var = ma.array(var)
-        self._compute_stats(var)
+        self._set_stats(compute_var_stats(var), np.shape(var))
         self.name = name
 
+    @classmethod
+    def from_stats(cls, stats, shape, name=None):
+        """Create a VarInfo object from precomputed statistics.
+
+        This is useful when the statistics have been computed as a by-product
+        of some other computation (e.g., by VarDiffs), avoiding another pass
+        over the data.
+
+        Arguments:
+        stats: VarStatsAccumulator object
+        shape: tuple giving the shape of the variable described by stats
+        name: variable name (or None)"""
+
+        varinfo = cls.__new__(cls)
+        varinfo._set_stats(stats, shape)
+        varinfo.name = name
+        return varinfo
+
     def __str__(self):
         mystr = ""
         if self.name:
@@ -50,34 +66,31 @@ class VarInfo(object):
     # Private methods
     # ------------------------------------------------------------------------
 
-    def _compute_stats(self, var):
-        """Compute and store various statistics for later printing.
+    def _set_stats(self, stats, shape):
+        """Store various statistics for later printing.
 
         Arguments:
-        var: numpy.ma array"""
-
-        # For performance reasons, it's better to use varc rather than var for
-        # any operation that doesn't need to reference the array size or indices
-        varc = var.compressed()
+        stats: VarStatsAccumulator object
+        shape: tuple giving the shape of the variable"""
 
-        self._shape = var.shape
-        self._num_elements = var.size
-        self._num_valid = varc.size
+        self._shape = shape
+        self._num_elements = stats.num_elements
+        self._num_valid = stats.num_valid
         if (self._num_valid > 0):
-            self._max_val = varc.max()
-            self._max_loc = var.argmax()
-            self._min_val = varc.min()
-            self._min_loc = var.argmin()
-            self._mean_absval = (np.fabs(varc)).mean()
+            self._max_val = stats.max_val
+            self._max_loc = stats.max_loc
+            self._min_val = stats.min_val
+            self._min_loc = stats.min_loc
+            self._mean_absval = stats.mean_absval()
         else:
             self._max_val = 0
             self._max_loc = 0
             self._min_val = 0
             self._min_loc = 0
             self._mean_absval = 0
-        if (var.ndim > 0 and var.shape[0] > 0):
-            self._max_indices = np.unravel_index(self._max_loc, var.shape)
-            self._min_indices = np.unravel_index(self._min_loc, var.shape)
+        if (len(shape) > 0 and shape[0] > 0):
+            self._max_indices = np.unravel_index(self._max_loc, shape)
+            self._min_indices = np.unravel_index(self._min_loc, shape)
         else:
             self._max_indices = 0
             self._min_indices = 0